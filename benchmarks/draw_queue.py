@@ -0,0 +1,144 @@
+"""
+Compare the draw queue throughput of the old background thread consumer,
+which blocks on the queue and draws one item per wakeup, with the GUI loop
+consumer that applies the queue in frames through the RenderScheduler.
+
+Run from the repository root with `python -m benchmarks.draw_queue`.  A Tk
+canvas is drawn to when a display is available, otherwise a stand-in canvas
+that only builds the item arguments is used.
+"""
+from argparse           import ArgumentParser
+from queue              import Queue
+from threading          import Thread
+from time               import perf_counter, sleep
+from types              import SimpleNamespace
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_type       import DrawingType
+from pypaint.render_scheduler   import RenderScheduler
+
+
+class StandInCanvas:
+    """
+    Canvas replacement for machines without a display, scheduling after
+    callbacks in a simple loop instead of the Tk event loop.
+    """
+
+    def __init__(self):
+        self.callbacks = []
+        self.running = False
+        self.item_count = 0
+
+    def create_line(self, *coords, **options):
+        self.item_count += 1
+        return self.item_count
+
+    def after(self, delay, callback):
+        self.callbacks.append((perf_counter() + delay / 1000, callback))
+
+    def mainloop(self):
+        self.running = True
+        while self.running and self.callbacks:
+            self.callbacks.sort(key = lambda callback: callback[0])
+            when, callback = self.callbacks.pop(0)
+            sleep(max(0, when - perf_counter()))
+            callback()
+
+    def quit(self):
+        self.running = False
+
+
+def create_canvas():
+    try:
+        from tkinter import Canvas, TclError, Tk
+        root = Tk()
+    except (ImportError, TclError):
+        return StandInCanvas(), "stand-in"
+
+    canvas = Canvas(root)
+    canvas.pack()
+    return canvas, "tk"
+
+def create_drawings(count):
+    return [Drawing(DrawingType.PEN, 1, "#000000",
+                    [i % 800, i % 600, (i + 5) % 800, (i + 5) % 600])
+                for i in range(count)]
+
+def fill_queue(drawings):
+    draw_queue = Queue()
+    def f():
+        for drawing in drawings:
+            draw_queue.put(drawing)
+    Thread(target = f).start()
+    return draw_queue
+
+def draw(canvas, drawing):
+    return canvas.create_line(*drawing.coords, width = drawing.thickness,
+                                fill = drawing.color)
+
+def run_thread_consumer(canvas, drawings):
+    """
+    Return the seconds taken for the blocking thread consumer to draw all of
+    the drawings.
+    """
+    start = perf_counter()
+    draw_queue = fill_queue(drawings)
+    def f():
+        for _ in range(len(drawings)):
+            draw(canvas, draw_queue.get())
+    thread = Thread(target = f)
+    thread.start()
+    if isinstance(canvas, StandInCanvas):
+        thread.join()
+    else:
+        def check():
+            if thread.is_alive():
+                canvas.after(1, check)
+            else:
+                canvas.quit()
+        canvas.after(1, check)
+        canvas.mainloop()
+    return perf_counter() - start, None
+
+def run_scheduler_consumer(canvas, drawings):
+    """
+    Return the seconds taken for the render scheduler to draw all of the
+    drawings in frames driven by after(), along with its frame counters.
+    """
+    start = perf_counter()
+    state = SimpleNamespace(draw_queue = fill_queue(drawings),
+                            draw_active = True)
+    remaining = [len(drawings)]
+    def render(drawing):
+        draw(canvas, drawing)
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            state.draw_active = False
+            canvas.quit()
+        return drawing.bounding_box()
+    scheduler = RenderScheduler(canvas, state, render)
+    scheduler.start()
+    canvas.mainloop()
+    return perf_counter() - start, scheduler.stats()
+
+def main():
+    parser = ArgumentParser(description = __doc__.strip().split("\n\n")[0])
+    parser.add_argument("--count", type = int, default = 100000,
+                        help = "number of drawings to queue")
+    args = parser.parse_args()
+
+    drawings = create_drawings(args.count)
+    canvas, canvas_type = create_canvas()
+    print("{} drawings, {} canvas".format(args.count, canvas_type))
+    for name, consumer in [("thread", run_thread_consumer),
+                            ("frames", run_scheduler_consumer)]:
+        seconds, stats = consumer(canvas, drawings)
+        print("{:>8}: {:8.3f}s {:12.0f} drawings/s".format(name, seconds,
+                                                    args.count / seconds))
+        if stats is not None:
+            print("{:>8}  {frames} frames, {mean_frame_items:.0f} items per "
+                    "frame, {max_frame_ms:.1f}ms max frame".format("",
+                                                                **stats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Compare how long Tk takes to redraw and scroll a canvas holding every
+drawing as a vector item with one drawn as the --raster-tiles mode draws
+it, the older drawings flattened into PhotoImage tiles by a RasterLayer
+and the recent ones left as vector items, as the number of drawings grows.
+
+Run from the repository root with `python -m benchmarks.raster_tiles`.  The
+tile rendering is timed without a display, the canvas timings need one.
+"""
+from argparse           import ArgumentParser
+from random             import Random
+from time               import perf_counter
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_history    import DrawingHistory
+from pypaint.drawing_type       import DrawingType
+from pypaint.raster_layer       import RasterLayer
+
+
+def create_drawings(count, width, height, seed = 0):
+    random = Random(seed)
+    drawings = []
+    for _ in range(count):
+        x, y = random.randrange(width), random.randrange(height)
+        coords = [x, y]
+        for _ in range(8):
+            x += random.randint(-10, 10)
+            y += random.randint(-10, 10)
+            coords += [x, y]
+        drawings.append(Drawing(DrawingType.PEN, random.randint(1, 5),
+                                "#{:06x}".format(random.getrandbits(24)),
+                                coords))
+    return drawings
+
+def create_layer(drawings):
+    """
+    Return a raster layer over a history of the drawings, with its line 
+    moved as the view moves it once they have been added.
+    """
+    history = DrawingHistory()
+    for drawing in drawings:
+        history.append(drawing)
+    layer = RasterLayer(history)
+    layer.update()
+    return layer
+
+def render_tiles(layer):
+    """
+    Return the (x, y, ppm) image of each tile holding flattened drawings, 
+    and the seconds taken to render them on this thread, to gather their 
+    drawings as the GUI thread does, and to render them through the 
+    layer's workers.
+    """
+    tiles = list(layer.history.tiles.cells)
+    start = perf_counter()
+    images = [layer.render_tile(tile) for tile in tiles]
+    inline = perf_counter() - start
+
+    start = perf_counter()
+    for tile in tiles:
+        layer.render_job(tile)
+    gather = perf_counter() - start
+
+    first = next(filter(None, map(layer.submit, tiles)), None)
+    if first is not None:   # the workers are started before timing them
+        first.result()
+    start = perf_counter()
+    for future in [future for future in map(layer.submit, tiles) 
+                        if future is not None]:
+        future.result()
+    workers = perf_counter() - start
+    return ([image for image in images if image is not None], inline, 
+            gather, workers)
+
+def create_canvas(width, height):
+    try:
+        from tkinter import Canvas, TclError, Tk
+        root = Tk()
+    except (ImportError, TclError):
+        return None
+
+    canvas = Canvas(root, width = width, height = height,
+                    scrollregion = (0, 0, 2 * width, 2 * height))
+    canvas.pack()
+    root.update()
+    return canvas
+
+def add_vector_items(canvas, drawings):
+    for drawing in drawings:
+        canvas.create_line(*drawing.coords, width = drawing.thickness,
+                            fill = drawing.color)
+
+def recent_drawings(layer):
+    """
+    Return the drawings the layer leaves as vector items.
+    """
+    return [drawing for index, drawing in enumerate(layer.history)
+                if not layer.is_flat(index, drawing)]
+
+def add_tile_items(canvas, tiles):
+    from tkinter import NW, PhotoImage
+    images = []
+    for x, y, ppm in tiles:
+        images.append(PhotoImage(data = ppm, format = "PPM"))
+        canvas.create_image(x, y, image = images[-1], anchor = NW)
+    return images
+
+def time_canvas(canvas, scrolls):
+    """
+    Return the milliseconds of a full redraw, and the mean milliseconds of
+    a scroll step, of everything on the canvas.
+    """
+    start = perf_counter()
+    canvas.event_generate("<Expose>")
+    canvas.update()
+    redraw = perf_counter() - start
+
+    start = perf_counter()
+    for step in range(scrolls):
+        canvas.xview_scroll(1 if step % 2 == 0 else -1, "pages")
+        canvas.update()
+    return 1000 * redraw, 1000 * (perf_counter() - start) / max(scrolls, 1)
+
+def main():
+    parser = ArgumentParser(description = __doc__.strip().split("\n\n")[0])
+    parser.add_argument("--counts", type = int, nargs = "+",
+                        default = [1000, 10000, 50000],
+                        help = "numbers of drawings to compare at")
+    parser.add_argument("--width", type = int, default = 1024,
+                        help = "width of the window, the drawings cover "
+                                "twice it")
+    parser.add_argument("--height", type = int, default = 768,
+                        help = "height of the window, the drawings cover "
+                                "twice it")
+    parser.add_argument("--scrolls", type = int, default = 20,
+                        help = "scroll steps timed at each count")
+    args = parser.parse_args()
+
+    width, height = 2 * args.width, 2 * args.height
+    canvas = create_canvas(args.width, args.height)
+    if canvas is None:
+        print("no display, only timing the tile rendering")
+
+    print("{:>8} {:>6} {:>10} {:>10} {:>10} {:>16} {:>16}".format(
+                "drawings", "tiles", "render ms", "gather ms", "workers ms", 
+                "vector ms", "tiles ms"))
+    print("{:>48} {:>16} {:>16}".format("", "redraw/scroll", 
+                                        "redraw/scroll"))
+    for count in args.counts:
+        drawings = create_drawings(count, width, height)
+        layer = create_layer(drawings)
+        try:
+            tiles, *seconds = render_tiles(layer)
+        finally:
+            layer.stop()
+        row = "{:8} {:6} {:10.0f} {:10.0f} {:10.0f}".format(count, 
+                    len(tiles), *(1000 * part for part in seconds))
+        if canvas is not None:
+            canvas.delete("all")
+            add_vector_items(canvas, drawings)
+            vector = time_canvas(canvas, args.scrolls)
+            canvas.delete("all")
+            images = add_tile_items(canvas, tiles)
+            add_vector_items(canvas, recent_drawings(layer))
+            raster = time_canvas(canvas, args.scrolls)
+            canvas.delete("all")
+            del images
+            row += " {:7.1f}/{:<8.1f} {:7.1f}/{:<8.1f}".format(*vector,
+                                                                *raster)
+        print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Load test the relay with simulated clients, each drawing strokes at a set
+rate while counting the drawings relayed to it from all the others.
+
+Run from the repository root with `python -m benchmarks.relay_load`.  A
+relay is started in process unless --port points at a running one.
+"""
+from argparse           import ArgumentParser
+from asyncio            import gather, open_connection, run, sleep
+from time               import perf_counter
+
+from pypaint.drawing        import Drawing
+from pypaint.drawing_type   import DrawingType
+from pypaint.relay          import Relay
+from pypaint.wire_codec     import WireCodec
+
+
+class SimulatedClient:
+    """
+    Client that sends batches of stroke drawings, each carrying its client
+    and sequence numbers in its first point so receivers can time them.
+    """
+
+    def __init__(self, number, sent_times):
+        self.number = number
+        self.sent_times = sent_times
+        self.codec = WireCodec()
+        self.received = 0
+        self.latencies = []
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await open_connection(host, port)
+        self.writer.write(self.codec.offer())
+
+    async def draw(self, count, batch_size, interval):
+        for seq in range(0, count, batch_size):
+            drawings = []
+            now = perf_counter()
+            for i in range(seq, min(seq + batch_size, count)):
+                self.sent_times[self.number, i] = now
+                drawings.append(Drawing(DrawingType.PEN, 2, "#000000",
+                                        [self.number, i, i % 800, i % 600,
+                                            (i + 7) % 800, (i + 3) % 600]))
+            self.writer.write(self.codec.encode(drawings))
+            await self.writer.drain()
+            await sleep(interval)
+
+    async def listen(self, expected):
+        while self.received < expected:
+            data = await self.reader.read(1 << 16)
+            if not data:
+                break
+            now = perf_counter()
+            for drawing in self.codec.decode(data):
+                self.received += 1
+                sent = self.sent_times.get(tuple(drawing.coords[:2]))
+                if sent is not None:
+                    self.latencies.append(now - sent)
+
+    def close(self):
+        self.writer.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def run_load(args):
+    relay = None
+    port = args.port
+    if port is None:
+        relay = Relay("127.0.0.1", 0)
+        await relay.start()
+        port = relay.port
+
+    sent_times = {}
+    clients = [SimulatedClient(number, sent_times)
+                for number in range(args.clients)]
+    for client in clients:
+        await client.connect(args.host, port)
+
+    expected = (args.clients - 1) * args.drawings
+    start = perf_counter()
+    await gather(*(client.draw(args.drawings, args.batch,
+                                args.interval / 1000) for client in clients),
+                    *(client.listen(expected) for client in clients))
+    seconds = perf_counter() - start
+
+    for client in clients:
+        client.close()
+    if relay is not None:
+        await relay.stop()
+
+    received = sum(client.received for client in clients)
+    latencies = [latency for client in clients
+                    for latency in client.latencies]
+    print("{} clients, {} drawings each".format(args.clients, args.drawings))
+    print("relayed {} of {} drawings in {:.3f}s, {:.0f} drawings/s".format(
+                received, expected * args.clients, seconds,
+                received / seconds))
+    if latencies:
+        print("latency ms: median {:.1f}, p99 {:.1f}, max {:.1f}".format(
+                1000 * percentile(latencies, 0.5),
+                1000 * percentile(latencies, 0.99), 1000 * max(latencies)))
+
+def main():
+    parser = ArgumentParser(description = __doc__.strip().split("\n\n")[0])
+    parser.add_argument("--clients", type = int, default = 100,
+                        help = "number of simulated clients")
+    parser.add_argument("--drawings", type = int, default = 200,
+                        help = "drawings sent by each client")
+    parser.add_argument("--batch", type = int, default = 10,
+                        help = "drawings sent per write")
+    parser.add_argument("--interval", type = float, default = 20,
+                        help = "milliseconds between a client's writes")
+    parser.add_argument("--host", default = "127.0.0.1",
+                        help = "address of the relay")
+    parser.add_argument("--port", type = int, default = None,
+                        help = "port of a running relay, instead of "
+                                "starting one")
+    run(run_load(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+Time the hot paths of the application against synthetic stroke workloads:
+encoding and decoding drawings, saving and loading files, syncing the
+history to a connected peer, the memory the history grows by, and how fast
+the draw queue drains, writing the results as JSON.
+
+Run from the repository root with `python -m benchmarks.suite`.  Given a
+--baseline of earlier results, such as the stored benchmarks/baseline.json,
+each result is compared against it and the suite exits with status 1 if
+any has regressed past its tolerance, so the results of one run can be
+kept as the baseline for the next.  The whole suite is run --repeat
+times, so the runs of a benchmark are spread out rather than all caught
+by the same burst of load on the machine, keeping the best of each rate
+or time and the median of anything else.  Each result carries a
+tolerance suited to how much it varies between runs.
+
+The save, load and sync benchmarks call into the controller, and are
+skipped if its GUI dependencies are not installed.
+"""
+from argparse           import ArgumentParser
+from json               import dump, load
+from os                 import close, remove
+from platform           import python_version
+from queue              import Empty, Queue
+from random             import Random
+from sys                import exit, stderr, stdout
+from tempfile           import mkstemp
+from threading          import Event, Thread
+from time               import perf_counter, strftime
+from tracemalloc        import get_traced_memory
+from tracemalloc        import start as start_tracing
+from tracemalloc        import stop as stop_tracing
+from types              import SimpleNamespace
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_history    import DrawingHistory
+from pypaint.drawing_type       import DrawingType
+from pypaint.headless_renderer  import Framebuffer, HeadlessRenderer
+from pypaint.paint_state        import PaintState
+from pypaint.render_scheduler   import RenderScheduler
+
+from .draw_queue                import StandInCanvas
+
+
+TOLERANCE = 0.25        # share a result can worsen by before it regresses
+WORST_CASE_TOLERANCE = 1.0      # of a worst case, such as the longest frame
+MIN_REPEAT = 0.2        # seconds each repeat of a timing runs for at least
+
+
+def create_strokes(count, points, seed = 0):
+    """
+    Return pen strokes of the given number of points each, wandering over a
+    2048 pixel square, with the op ids of a single author.
+    """
+    random = Random(seed)
+    strokes = []
+    for seq in range(1, count + 1):
+        x, y = random.randrange(2048), random.randrange(2048)
+        coords = [x, y]
+        for _ in range(points - 1):
+            x += random.randint(-8, 8)
+            y += random.randint(-8, 8)
+            coords += [x, y]
+        strokes.append(Drawing(DrawingType.PEN, random.randint(1, 10),
+                                "#{:06x}".format(random.getrandbits(24)),
+                                coords, op_id = (1, seq)))
+    return strokes
+
+def create_history(strokes):
+    history = DrawingHistory()
+    for drawing in strokes:
+        history.append(drawing)
+    return history
+
+def mean_time(f):
+    """
+    Return the mean seconds f takes, calling it as many times as it takes 
+    to run for MIN_REPEAT seconds, so quick calls are not lost in the noise 
+    of the timer.
+    """
+    calls = 0
+    begin = perf_counter()
+    while True:
+        f()
+        calls += 1
+        seconds = perf_counter() - begin
+        if seconds >= MIN_REPEAT:
+            return seconds / calls
+
+def result(value, unit, higher_is_better = True, tolerance = TOLERANCE,
+            keep = "best"):
+    """
+    Return a result, kept as the best or the median of the suite's runs.
+    """
+    return {"value" : value, "unit" : unit,
+            "higher_is_better" : higher_is_better, "tolerance" : tolerance,
+            "keep" : keep}
+
+def bench_codec(args):
+    """
+    Return the rates of Drawing.encode and Drawing.decode_drawings.
+    """
+    strokes = create_strokes(args.drawings, args.points)
+    data = b''.join(drawing.encode() for drawing in strokes)
+    encode = mean_time(lambda: [drawing.encode() for drawing in strokes])
+    decode = mean_time(lambda: Drawing.decode_drawings(data))
+    return {
+        "encode" : result(len(strokes) / encode, "drawings/s"),
+        "decode" : result(len(strokes) / decode, "drawings/s"),
+        "decode_bytes" : result(len(data) / decode / 1e6, "MB/s")
+        }
+
+def bench_files(args, controller_type):
+    """
+    Return the rates of Controller.save_logic and of the load it starts, at
+    each number of records.
+
+    The load is timed through the loading thread's body, so it covers the
+    decoding of every drawing onto the draw queue, which a thread drains 
+    as the GUI loop would so the load stays throttled to it.
+    """
+    results = {}
+    for records in args.records:
+        state = PaintState()
+        history = create_history(create_strokes(records, args.points))
+        controller = controller_type.__new__(controller_type)
+        controller.application_state = state
+        handle, filename = mkstemp(suffix = ".pypaint")
+        close(handle)
+        def save_file():
+            state.drawing_history = history
+            controller.save_logic(filename)
+        def load_file():
+            loading = Event()
+            loading.set()
+            drainer = Thread(target = drain, 
+                                args = (state.draw_queue, loading))
+            drainer.start()
+            controller._load_drawings(open(filename, "rb"))
+            loading.clear()
+            drainer.join()
+        try:
+            save = mean_time(save_file)
+            load = mean_time(load_file)
+        finally:
+            remove(filename)
+        results["save_{}".format(records)] = result(records / save,
+                                                    "records/s")
+        results["load_{}".format(records)] = result(records / load,
+                                                    "records/s")
+    return results
+
+def drain(queue, loading):
+    """
+    Discard the drawings put on the queue until loading stops and it is 
+    empty.
+    """
+    while loading.is_set() or not queue.empty():
+        try:
+            queue.get(timeout = 0.01)
+        except Empty:
+            pass
+
+def bench_sync(args, controller_type):
+    """
+    Return the milliseconds Controller._sync_to_connected takes to enqueue
+    the whole history for a new peer, and the last drawings for a peer
+    holding a prefix of it.
+    """
+    state = PaintState()
+    state.send_active = True
+    state.send_queue = Queue()      # nothing drains it
+    history = create_history(create_strokes(args.records[0], args.points))
+    state.drawing_history = history
+    controller = controller_type.__new__(controller_type)
+    controller.application_state = state
+
+    missing = max(len(history) // 100, 1)
+    prefix = create_history(list(history)[:len(history) - missing])
+    results = {}
+    for name, token in [("full", (0, 0)), ("tail", prefix.sync_token())]:
+        sync = Drawing(DrawingType.SYNC, 0, "", token + (0, 0))
+        def f():
+            controller._sync_to_connected(sync)
+            state.send_queue = Queue()
+        results["sync_{}".format(name)] = result(
+                                    1000 * mean_time(f), "ms",
+                                    higher_is_better = False)
+    return results
+
+def bench_history_memory(args):
+    """
+    Return the bytes the history grows by per drawing added through
+    PaintState.add_last_drawing, compaction included.
+    """
+    strokes = create_strokes(args.drawings, args.points)
+    start_tracing()
+    try:
+        state = PaintState()
+        before, _ = get_traced_memory()
+        for drawing in strokes:
+            state.add_last_drawing(drawing)
+        after, peak = get_traced_memory()
+    finally:
+        stop_tracing()
+    return {
+        "history_bytes" : result((after - before) / len(strokes),
+                                    "bytes/drawing", higher_is_better = False, 
+                                    keep = "median"),
+        "history_peak_bytes" : result((peak - before) / len(strokes),
+                                        "bytes/drawing",
+                                        higher_is_better = False, 
+                                        keep = "median")
+        }
+
+def bench_draw_queue(args):
+    """
+    Return the rate the render scheduler drains a queue of strokes at,
+    drawing each into a framebuffer and adding it to the history, and its
+    longest frame, a worst case kept as the median of the runs.
+    """
+    strokes = create_strokes(args.queued, args.points)
+    canvas = StandInCanvas()
+    state = PaintState()
+    for drawing in strokes:
+        state.add_to_draw_queue(drawing)
+    framebuffer = Framebuffer(2048, 2048, b"\xff\xff\xff")
+    remaining = SimpleNamespace(count = len(strokes))
+    def render(drawing):
+        HeadlessRenderer.draw(framebuffer, drawing)
+        state.add_last_drawing(drawing)
+        remaining.count -= 1
+        if remaining.count == 0:
+            state.draw_active = False
+            canvas.quit()
+        return drawing.bounding_box()
+
+    scheduler = RenderScheduler(canvas, state, render)
+    begin = perf_counter()
+    scheduler.start()
+    canvas.mainloop()
+    seconds = perf_counter() - begin
+    stats = scheduler.stats()
+    return {
+        "drain" : result(len(strokes) / seconds, "drawings/s"),
+        "drain_max_frame" : result(stats["max_frame_ms"], "ms",
+                                    higher_is_better = False, 
+                                    tolerance = WORST_CASE_TOLERANCE, 
+                                    keep = "median")
+        }
+
+def run_suite(args):
+    """
+    Return the results of the repeated runs of the suite, each kept as the 
+    best or the median of its runs.
+    """
+    try:
+        from pypaint.controller import Controller
+    except ImportError as err:
+        Controller = None
+        print("skipping the benchmarks of the controller: {}".format(err), 
+                file = args.log)
+
+    runs = {}
+    for run in range(1, args.repeat + 1):
+        print("run {} of {}".format(run, args.repeat), file = args.log)
+        for name, current in run_benchmarks(args, Controller).items():
+            runs.setdefault(name, []).append(current)
+
+    results = {}
+    for name, values in runs.items():
+        ordered = sorted(values, key = lambda current: current["value"],
+                            reverse = values[0]["higher_is_better"])
+        results[name] = (ordered[0] if values[0]["keep"] == "best"
+                            else ordered[len(ordered) // 2])
+    return results
+
+def run_benchmarks(args, controller_type):
+    results = {}
+    benchmarks = [("codec", bench_codec, False),
+                    ("files", bench_files, True),
+                    ("sync", bench_sync, True),
+                    ("history_memory", bench_history_memory, False),
+                    ("draw_queue", bench_draw_queue, False)]
+    for name, bench, needs_controller in benchmarks:
+        if (args.only and name not in args.only 
+                or needs_controller and controller_type is None):
+            continue
+        print("running {}".format(name), file = args.log)
+        if not needs_controller:
+            results.update(bench(args))
+        else:
+            results.update(bench(args, controller_type))
+    return results
+
+def compare(results, baseline, tolerance = None):
+    """
+    Return a line for each result worse than its baseline by more than the
+    tolerance, as a share of the baseline, or by more than its own if no 
+    tolerance is given.
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None or previous["value"] == 0:
+            continue
+        change = current["value"] / previous["value"] - 1
+        if not current["higher_is_better"]:
+            change = -change
+        if change < -(tolerance if tolerance is not None 
+                        else current.get("tolerance", TOLERANCE)):
+            regressions.append("{}: {:.4g} {} against {:.4g}, {:.0%} "
+                                "worse".format(name, current["value"],
+                                                current["unit"],
+                                                previous["value"], -change))
+    return regressions
+
+def main():
+    parser = ArgumentParser(description = __doc__.strip().split("\n\n")[0])
+    parser.add_argument("--drawings", type = int, default = 100000,
+                        help = "strokes to encode, decode and add to the "
+                                "history")
+    parser.add_argument("--records", type = int, nargs = "+",
+                        default = [100000],
+                        help = "history lengths to save and load, up to "
+                                "10000000, the first is also synced")
+    parser.add_argument("--queued", type = int, default = 20000,
+                        help = "strokes queued to drain")
+    parser.add_argument("--points", type = int, default = 16,
+                        help = "points in each stroke")
+    parser.add_argument("--repeat", type = int, default = 3,
+                        help = "runs of the whole suite, the best rate or "
+                                "time or the median of anything else is kept")
+    parser.add_argument("--only", nargs = "+",
+                        help = "benchmarks to run, all by default")
+    parser.add_argument("--output",
+                        help = "file to write the JSON results to, instead "
+                                "of standard output")
+    parser.add_argument("--baseline",
+                        help = "JSON results of an earlier run to compare "
+                                "against")
+    parser.add_argument("--tolerance", type = float,
+                        help = "share any result can worsen by before it "
+                                "counts as a regression, instead of each "
+                                "one's own")
+    args = parser.parse_args()
+    args.log = stdout if args.output else stderr
+
+    report = {
+        "time" : strftime("%Y-%m-%dT%H:%M:%S"),
+        "python" : python_version(),
+        "parameters" : {"drawings" : args.drawings,
+                        "records" : args.records, "queued" : args.queued,
+                        "points" : args.points},
+        "results" : run_suite(args)
+        }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = load(baseline_file)
+        if baseline.get("parameters") != report["parameters"]:
+            print("baseline was run with other parameters: {}".format(
+                    baseline.get("parameters")), file = args.log)
+        regressions = compare(report["results"], baseline["results"],
+                                args.tolerance)
+        report["baseline"] = args.baseline
+        report["regressions"] = regressions
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            dump(report, output_file, indent = 4)
+            print(file = output_file)
+    else:
+        dump(report, stdout, indent = 4)
+        print()
+    for regression in regressions:
+        print("regressed {}".format(regression), file = args.log)
+    exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -3,30 +3,97 @@ from chadlib.utility.main_script    import (create_argument_parser,
 
 from .controller                    import Controller
 from .paint_state                   import PaintState
+from .relay                         import Relay
+from .sender                        import Sender
+from .stroke_simplifier             import SIMPLIFIERS
 
 
 VERSION = "2.0.11"
 APPLICATION_NAME = "PyPaint"
 APPLICATION_DESCRIPTION = "Simple, networked paint application"
+METRICS_INTERVAL = 60       # seconds between metrics written to the log
 
 
-def create_application_controller():
+def create_application_controller(simplifier = None, 
+                                    flush_interval = Sender.FLUSH_INTERVAL, 
+                                    flush_size = Sender.FLUSH_SIZE, 
+                                    async_network = False, 
+                                    remote_preview_rate = 0, 
+                                    raster_tiles = False, 
+                                    metrics_interval = None):
     state = PaintState()
-    controller = Controller(APPLICATION_NAME, state)
+    controller = Controller(APPLICATION_NAME, state, simplifier, 
+                            flush_interval, flush_size, async_network, 
+                            remote_preview_rate, raster_tiles, 
+                            metrics_interval)
     return controller
 
+def add_arguments(parser):
+    """
+    Add the PyPaint specific options to the parser.
+    """
+    parser.add_argument("--simplify", choices = sorted(SIMPLIFIERS), 
+                        default = "rdp", 
+                        help = "stroke simplification applied to freehand "
+                                "drawing")
+    parser.add_argument("--tolerance", type = float, default = 1.0, 
+                        help = "simplification tolerance in pixels")
+    parser.add_argument("--flush-interval", type = int, 
+                        default = Sender.FLUSH_INTERVAL, 
+                        help = "milliseconds drawings are coalesced for "
+                                "before being sent")
+    parser.add_argument("--flush-size", type = int, 
+                        default = Sender.FLUSH_SIZE, 
+                        help = "drawings that are sent straight away "
+                                "without waiting for the interval")
+    parser.add_argument("--async-network", action = "store_true", 
+                        help = "run the connection on an asyncio loop in "
+                                "the GUI thread instead of network threads")
+    parser.add_argument("--remote-preview", type = float, default = 0, 
+                        metavar = "RATE", 
+                        help = "previews per second of shapes being dragged "
+                                "out sent to the connected application, off "
+                                "by default, needs a peer that understands "
+                                "previews")
+    parser.add_argument("--raster-tiles", action = "store_true", 
+                        help = "flatten older drawings into image tiles, "
+                                "keeping only recent ones as canvas items")
+    parser.add_argument("--metrics", type = float, nargs = "?", 
+                        const = METRICS_INTERVAL, metavar = "SECONDS", 
+                        help = "record queue depths, draw times and network "
+                                "rates, shown from the Debug menu and "
+                                "written to the log every SECONDS, {} by "
+                                "default".format(METRICS_INTERVAL))
+    parser.add_argument("--serve", action = "store_true", 
+                        help = "run a headless relay that any number of "
+                                "applications can connect to")
+    parser.add_argument("--host", default = Relay.DEFAULT_HOST, 
+                        help = "address the relay listens on, all by "
+                                "default")
+    parser.add_argument("--port", type = int, default = Relay.DEFAULT_PORT, 
+                        help = "port the relay listens on")
+
 def main():
     """
     Create the parser, logger, and application controller, then start up the 
-    application.
+    application, or the relay if serving.
     """
     parser = create_argument_parser(APPLICATION_NAME, VERSION, 
                                     APPLICATION_DESCRIPTION)
+    add_arguments(parser)
     args = parser.parse_args()
 
     logger = create_logger(args.debug, args.logfile)
 
-    controller = create_application_controller()
+    if args.serve:
+        Relay(args.host, args.port).run()
+        return
+
+    controller = create_application_controller(
+                                SIMPLIFIERS[args.simplify](args.tolerance), 
+                                args.flush_interval, args.flush_size, 
+                                args.async_network, args.remote_preview, 
+                                args.raster_tiles, args.metrics)
     controller.start()
 
 if __name__ == "__main__":
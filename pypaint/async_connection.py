@@ -0,0 +1,211 @@
+from asyncio            import Protocol, new_event_loop
+from logging            import getLogger
+
+from .sender            import Sender
+
+
+class PaintProtocol(Protocol):
+    """
+    Passes the events of a single connection on to the component.
+    """
+
+    def __init__(self, component):
+        self.component = component
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.component.connection_made(transport)
+
+    def data_received(self, data):
+        self.component.controller.process_received_data(data)
+
+    def connection_lost(self, exc):
+        self.component.connection_lost(self.transport, exc)
+
+    def pause_writing(self):
+        self.component.paused = True
+
+    def resume_writing(self):
+        self.component.paused = False
+        self.component.flush()
+
+
+class AsyncConnComponent:
+    """
+    Alternative to ConnComponent that runs the connection on an asyncio
+    event loop, stepped from the GUI loop so it shares the GUI thread.
+
+    Received data goes straight to the controller as it arrives, and the
+    component is the application state's send sink, gathering drawings
+    into a batch that is written straight to the transport.  There are no
+    network threads, and no locked queues between them and the GUI.
+
+    Batches are flushed once the flush interval passes or enough drawings
+    are waiting, and keep coalescing while the transport has paused writing
+    because the peer is slow to read.  A peer that leaves the sender's 
+    pending limit of drawings waiting is dropped, as the relay drops its 
+    slow clients, and can sync again after reconnecting.
+    """
+
+    STEP_INTERVAL = 5       # milliseconds between steps of the event loop
+    WRITE_BUFFER_LIMIT = 1 << 20
+    PENDING_LIMIT = Sender.PENDING_LIMIT
+    MAX_PORT = 65535
+
+    def __init__(self, controller, port, application_state, wire_codec,
+                    flush_interval = Sender.FLUSH_INTERVAL,
+                    flush_size = Sender.FLUSH_SIZE):
+        self.controller = controller
+        self.port = port
+        self.application_state = application_state
+        self.wire_codec = wire_codec
+        self.flush_interval = flush_interval / 1000
+        self.flush_size = flush_size
+
+        self.loop = new_event_loop()
+        self.server = None
+        self.transport = None
+        self.pending = []
+        self.flush_handle = None
+        self.paused = False
+        self.widget = None
+
+    def start(self, widget):
+        """
+        Start stepping the event loop from the widget's GUI loop.
+        """
+        self.widget = widget
+        self.widget.after(self.STEP_INTERVAL, self._step)
+
+    def _step(self):
+        if not self.loop.is_closed():
+            self._step_loop()
+            self.widget.after(self.STEP_INTERVAL, self._step)
+
+    def _step_loop(self):
+        """
+        Run the callbacks that are ready, including any for sockets that
+        are ready, without blocking.
+        """
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    def stop(self):
+        self.close()
+        if self.server is not None:
+            self.server.close()
+        self._step_loop()
+        self.loop.close()
+
+    def get_menu_data(self, menu_setup):
+        menu_setup.add_submenu_item("Network", "Host", self.host, "Alt-h")
+        menu_setup.add_submenu_item("Network", "Connect",
+                                    self.create_address_entry, "Alt-c")
+        menu_setup.add_submenu_item("Network", "Disconnect", self.close,
+                                    "Alt-d")
+        return menu_setup
+
+    def host(self):
+        """
+        Listen for the other application to connect.
+        """
+        if self.server is None:
+            try:
+                self.server = self.loop.run_until_complete(
+                                self.loop.create_server(self._create_protocol, 
+                                                        None, self.port))
+            except OSError as err:
+                getLogger(__name__).warning("Hosting failed: {}".format(err))
+                return
+            self.port = self.server.sockets[0].getsockname()[1]
+            getLogger(__name__).debug("Hosting on port {}.".format(self.port))
+
+    def create_address_entry(self):
+        self.controller.current_view.create_address_entry(self.connect)
+
+    def connect(self, address):
+        """
+        Start connecting to the address, given as host or host:port.
+        """
+        host, _, port = address.strip().partition(":")
+        try:
+            port = int(port) if port else self.port
+            if not 0 < port <= self.MAX_PORT:
+                raise ValueError("port {} out of range".format(port))
+        except ValueError as err:
+            self._connect_failed(err)
+            return
+        task = self.loop.create_task(self.loop.create_connection(
+                                            self._create_protocol, host, 
+                                            port))
+        task.add_done_callback(self._connect_done)
+
+    def _connect_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self._connect_failed(task.exception())
+
+    def _connect_failed(self, err):
+        getLogger(__name__).warning("Connecting failed: {}".format(err))
+
+    def _create_protocol(self):
+        return PaintProtocol(self)
+
+    def connection_made(self, transport):
+        """
+        Take the connection if there is none yet, offering frames and
+        starting to send.
+        """
+        if self.transport is not None:
+            transport.close()
+            return
+        self.transport = transport
+        transport.set_write_buffer_limits(high = self.WRITE_BUFFER_LIMIT)
+        self.wire_codec.reset()
+        self.pending = []
+        self.paused = False
+        transport.write(self.wire_codec.offer())
+        self.application_state.send_active = True
+        getLogger(__name__).debug("Connected to {}.".format(
+                                        transport.get_extra_info("peername")))
+
+    def connection_lost(self, transport, exc):
+        if transport is not self.transport:     # a refused connection
+            return
+        getLogger(__name__).debug("Connection lost: {}".format(exc))
+        self.transport = None
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.pending = []
+        self.controller.disconnect()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def send(self, drawing):
+        """
+        Add the drawing to the batch waiting to be written.
+        """
+        if self.transport is None:
+            return
+        self.pending.append(drawing)
+        if len(self.pending) >= self.PENDING_LIMIT:
+            getLogger(__name__).warning("Dropping slow peer {}.".format(
+                                self.transport.get_extra_info("peername")))
+            self.transport.abort()
+            self.pending = []
+        elif len(self.pending) >= self.flush_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(self.flush_interval,
+                                                        self.flush)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.pending and self.transport is not None and not self.paused:
+            self.transport.write(self.wire_codec.encode(self.pending))
+            self.pending = []
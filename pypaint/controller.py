@@ -1,9 +1,21 @@
+from json               import dumps
+from logging            import getLogger
+from threading          import Thread
+from time               import monotonic, perf_counter, sleep
+
 from chadlib.gui        import (ConnComponent, ConnController, ControllerBase, 
                                 SLComponent, SLController)
 
+from .async_connection  import AsyncConnComponent
 from .drawing           import Drawing
+from .drawing_file      import DrawingFile
 from .drawing_type      import DrawingType
+from .metrics           import METRICS
+from .paint_canvas      import PaintCanvas
 from .paint_view        import PaintView
+from .sender            import Sender
+from .stroke_simplifier import StrokeSimplifier
+from .wire_codec        import WireCodec
 
 
 class Controller(ConnController, SLController, ControllerBase):
@@ -14,46 +26,153 @@ class Controller(ConnController, SLController, ControllerBase):
     TEXT_SIZE_LIMIT = 128
     DEFAULT_PORT = 2423
 
+    # points gathered into a stroke drawing before it is drawn and sent
+    STROKE_BATCH_SIZE = 64
+
+    # pixels past the eraser's thickness that still count as touching
+    HIT_TOLERANCE = 3
+
+    # drawings a file is decoded ahead of the draw queue by while loading, 
+    # and the seconds to wait for it to drain when it is that far behind
+    LOAD_AHEAD = 4096
+    LOAD_WAIT = 0.01
+
+    # milliseconds between samples of the queue depths, when metrics are on
+    METRICS_SAMPLE_INTERVAL = 100
+    RESYNC_INTERVAL = 500   # milliseconds between checks for a peer behind
+
     # aliases for tkinter event types
     KEYPRESS = '2'
     BUTTON_PRESS = '4'
     BUTTON_RELEASE = '5'
     MOTION = '6'
 
-    def __init__(self, application_name, application_state):
+    def __init__(self, application_name, application_state, 
+                    simplifier = None, 
+                    flush_interval = Sender.FLUSH_INTERVAL, 
+                    flush_size = Sender.FLUSH_SIZE, async_network = False, 
+                    remote_preview_rate = 0, raster_tiles = False, 
+                    metrics_interval = None):
+        self.simplifier = (StrokeSimplifier() if simplifier is None 
+                            else simplifier)
+        # seconds between drag previews sent, None to keep them local
+        self.remote_preview_interval = (1 / remote_preview_rate 
+                                            if remote_preview_rate > 0 
+                                            else None)
+        self.raster_tiles = raster_tiles    # read by the view
+        # seconds between metrics written to the log, None to not record any
+        self.metrics_interval = metrics_interval
+        if metrics_interval is not None:
+            METRICS.enable()
+        self.metrics_logged_time = monotonic()
+        self.wire_codec = WireCodec()
+
         FILE_EXTENSION = "." + application_name.lower()
         self.sl_component = SLComponent(self, FILE_EXTENSION, 
                                     (("pypaint files", "*" + FILE_EXTENSION),), 
                                     application_name)
-        self.conn_component = ConnComponent(self, self.DEFAULT_PORT, 
-                                            application_state.send_queue, 
+        if async_network:
+            self.sender = None
+            self.conn_component = AsyncConnComponent(self, self.DEFAULT_PORT, 
+                                                    application_state, 
+                                                    self.wire_codec, 
+                                                    flush_interval, 
+                                                    flush_size)
+            # drawings to send go straight to the connection's batch
+            application_state.set_send_sink(self.conn_component)
+        else:
+            self.sender = Sender(application_state, flush_interval, 
+                                    flush_size)
+            self.conn_component = ConnComponent(self, self.DEFAULT_PORT, 
+                                            application_state.write_queue, 
                                             application_state.receive_queue)
 
         super().__init__(application_name, application_state, PaintView)
 
     def process_received_data(self, data):
-        for drawing in Drawing.decode_drawings(data):
-            if drawing.shape is not DrawingType.SYNC:
+        """
+        Decode the data received, drawing what it holds and answering syncs.
+
+        The codec here only decodes, the sender encodes with its own, so it 
+        is told once the connected application has offered frames.
+        """
+        history = self.application_state.drawing_history
+        framed = self.wire_codec.peer_framed
+        drawings = self.wire_codec.decode(data)
+        if (self.sender is not None and self.wire_codec.peer_framed 
+                and not framed):
+            self.sender.set_peer_framed(True)
+        for drawing in drawings:
+            if (drawing.shape is not DrawingType.SYNC 
+                    or drawing.coords[3] == history.SYNC_POSITION):
+                if METRICS.enabled:
+                    METRICS.start_timer(drawing, "receive_draw_ms")
                 self.application_state.add_to_draw_queue(drawing)
             else:   # if a sync was received, trigger sending history
-                self._sync_to_connected()
+                self._sync_to_connected(drawing)
 
     def start(self):
         self.current_view.start_processing_draw_queue()
+        if self.sender is not None:
+            self.sender.start()
+            self.window.root.after(self.RESYNC_INTERVAL, 
+                                    self._resync_if_behind)
+        else:
+            self.conn_component.start(self.window.root)
         # TODO CJR:  find a better place for this
-        self.window.root.bind("<Escape>", self.handle_event)
+        for key in ["<Escape>", "<Delete>", "<BackSpace>"]:
+            self.window.root.bind(key, self.handle_event)
+        if METRICS.enabled:
+            self.window.root.after(self.METRICS_SAMPLE_INTERVAL, 
+                                    self._sample_metrics)
         super().start() # must be called at the end, starts the GUI loop
 
     def connection_start(self):
+        """
+        Start sending, offering the connected application compressed frames.
+        """
+        self.wire_codec.reset()
+        if self.sender is not None:
+            self.sender.set_peer_framed(False)
+        write_queue = self.application_state.write_queue
+        while not write_queue.empty():  # left over from an old connection
+            write_queue.get_nowait()
+        write_queue.put(self.wire_codec.offer())
+        self.application_state.send_behind = False
         self.application_state.send_active = True
 
     def stop(self):
         self.application_state.stop()
+        self.current_view.stop_rendering()
+        if self.sender is not None:
+            self.sender.stop()
         self.conn_component.stop()
         super().stop()
 
     def disconnect(self):
         self.application_state.send_active = False
+        self.application_state.send_behind = False
+        self.wire_codec.reset()
+
+    def _resync_if_behind(self):
+        """
+        Once a peer that drawings to send were dropped for is reading again, 
+        send it the whole history after a clear, in place of the drawings 
+        it missed.
+
+        A peer that understands frames gets the position marker, so its 
+        later syncs carry on from there.
+        """
+        state = self.application_state
+        if state.send_behind and state.send_queue.empty():
+            state.send_behind = False
+            markers = (state.drawing_history.SYNC_REQUEST 
+                        if self.wire_codec.peer_framed else 0)
+            self._sync_to_connected(Drawing(DrawingType.SYNC, 0, "", 
+                                            (0, 0, 0, markers)))
+        if state.draw_active:
+            self.window.root.after(self.RESYNC_INTERVAL, 
+                                    self._resync_if_behind)
 
     def handle_event(self, event):
         """
@@ -72,67 +191,232 @@ class Controller(ConnController, SLController, ControllerBase):
         """
         Save the start point for the drawing, create a text box if that is 
         the current drawing mode.
+
+        The object eraser starts erasing under the cursor, and the select 
+        tool drops the last selection to start a new one.
         """
         self.application_state.start_pos = event.x, event.y
         if self.application_state.current_type is DrawingType.TEXT:
             self.current_view.create_text_entry(
                                             self.application_state.start_pos 
                                                 + (0, 0))
+        elif self.application_state.current_type is DrawingType.OBJECT_ERASER:
+            self._erase_at(event.x, event.y)
+        elif self.application_state.current_type is DrawingType.SELECT:
+            self._select([])
 
     def _handle_motion_event(self, event):
         """
-        Create a new drawing if it triggers off of motion events.
+        Extend the current stroke, or preview the drawing being dragged out.
+
+        Strokes gather their points into one drawing instead of creating a 
+        drawing per motion event, and reset the start position for the next 
+        point.
 
-        If this is the first motion event since a button press, trigger the 
-        dragging state so that undos are created for the following motion 
-        events.
+        Dragged shapes move a single local preview item as the cursor moves, 
+        nothing is drawn into the history or sent until the button is 
+        released, apart from rate limited previews if they are enabled.
 
-        If it is not a draggable shape, then reset the start position for the 
-        next drawing.
+        The object eraser erases whatever it passes over, the select tool 
+        previews the box being selected.
         """
-        if (self.application_state.start_pos is not None 
-                and DrawingType.is_motion_related(
-                                        self.application_state.current_type)):
-            if self.application_state.dragging:
-                self.create_undo()
+        if self.application_state.start_pos is None:
+            return
+
+        if self.application_state.current_type is DrawingType.OBJECT_ERASER:
+            self._erase_at(event.x, event.y)
+        elif self.application_state.current_type is DrawingType.SELECT:
+            self.current_view.show_preview(
+                    Drawing(DrawingType.RECT, 1, PaintCanvas.SELECTION_COLOR, 
+                            self.application_state.start_pos 
+                                + (event.x, event.y)))
+        elif DrawingType.is_motion_related(
+                                        self.application_state.current_type):
             event_coords = event.x, event.y
-            self._create_drawing(self.application_state.current_type, 
+            if DrawingType.is_stroke(self.application_state.current_type):
+                self._extend_stroke(event_coords)
+                self.application_state.start_pos = event_coords
+            else:
+                preview = Drawing(self.application_state.current_type, 
                                     self.application_state.current_thickness, 
-                                    self.application_state.current_color,
+                                    self.application_state.current_color, 
                                     self.application_state.start_pos 
                                         + event_coords)
+                self.current_view.show_preview(preview)
+                self._send_remote_preview(preview)
 
-            if not DrawingType.is_draggable(
-                                        self.application_state.current_type):
-                self.application_state.start_pos = event_coords
-            else:   # used to start undoing on the second motion event
-                self.application_state.dragging = True
+    def _send_remote_preview(self, drawing):
+        """
+        Send the drawing as a preview to the connected application, at most 
+        once per remote preview interval.
 
-    def _handle_button_release_event(self, event):
+        Previews carry this application's author id, with no sequence 
+        number, so that applications behind a relay each get a preview item 
+        of their own.
         """
-        Create the final drawing in the sequence, undoing the last one if 
-        necessary, and clearing the drawing state.
+        if self.remote_preview_interval is not None:
+            now = monotonic()
+            last_sent = self.application_state.preview_sent_time
+            if (last_sent is None 
+                    or now - last_sent >= self.remote_preview_interval):
+                drawing.preview = True
+                drawing.author = self.application_state.author_id
+                self.application_state.add_to_send_queue(drawing)
+                self.application_state.preview_sent_time = now
+
+    def _handle_button_release_event(self, event):
         """
-        if (DrawingType.is_draggable(self.application_state.current_type) 
-                and self.application_state.dragging):
-            self.create_undo()
+        Create the final drawing in the sequence, and clear the drawing 
+        state along with any preview.
 
+        The select tool selects the drawings its box touches instead.
+        """
         if (self.application_state.start_pos is not None
-            and self.application_state.current_type != DrawingType.TEXT):
+            and DrawingType.is_stroke(self.application_state.current_type)):
+            self._extend_stroke((event.x, event.y), True)
+            self._flush_stroke()
+        elif (self.application_state.start_pos is not None
+            and self.application_state.current_type is DrawingType.SELECT):
+            x1, x2 = sorted((self.application_state.start_pos[0], event.x))
+            y1, y2 = sorted((self.application_state.start_pos[1], event.y))
+            self._select(self.application_state.drawings_in((x1, y1, 
+                                                                x2, y2)))
+        elif (self.application_state.start_pos is not None
+            and self.application_state.current_type != DrawingType.TEXT
+            and not DrawingType.is_tool(self.application_state.current_type)):
             self._create_drawing(self.application_state.current_type, 
                                     self.application_state.current_thickness, 
                                     self.application_state.current_color,
                                     self.application_state.start_pos 
                                         + (event.x, event.y))
-        self.application_state.clear_drawing_state()
+        self._clear_drawing_state()
 
     def _handle_keyboard_event(self, event):
         """
-        Cancel current drawing when Escape key is pressed.
+        Cancel current drawing and the selection when Escape key is 
+        pressed, erase the selection when Delete or BackSpace is.
+
+        Only a stroke has anything to undo, the pieces of it that have been 
+        sent are one action so a single undo removes them all.
         """
         if event.keysym == "Escape":
-            self.create_undo()
-            self.application_state.clear_drawing_state()
+            if self.application_state.stroke_pieces:
+                self.create_undo()
+            self._clear_drawing_state()
+            self._select([])
+        elif event.keysym in {"Delete", "BackSpace"}:
+            self.erase_selection()
+
+    def _erase_at(self, x, y):
+        """
+        Erase the drawings touching the point, each with an undo aimed at 
+        it, whoever drew it.
+
+        Everything erased in one drag is a single action to undo.
+        """
+        distance = (self.application_state.current_thickness 
+                    + self.HIT_TOLERANCE)
+        erased = self.application_state.erased
+        for op_id in self.application_state.drawings_near(x, y, distance):
+            if op_id not in erased:
+                self.application_state.record_erase(op_id, 
+                                                    join = bool(erased))
+                erased.add(op_id)
+                self._create_drawing(DrawingType.UNDO, 0, "", (0, 0, 0, 0), 
+                                        op_id = op_id)
+
+    def _select(self, op_ids):
+        """
+        Make the drawings with the op ids the selection, highlighting them.
+        """
+        self.application_state.selection = op_ids
+        history = self.application_state.drawing_history
+        self.current_view.show_selection([drawing.bounding_box() 
+                                            for drawing in map(history.live, 
+                                                                op_ids)
+                                                if drawing is not None])
+
+    def erase_selection(self):
+        """
+        Erase the selected drawings that have not been undone since they 
+        were selected, as a single action to undo.
+        """
+        history = self.application_state.drawing_history
+        join = False
+        for op_id in self.application_state.selection:
+            if history.live(op_id) is not None:
+                self.application_state.record_erase(op_id, join)
+                join = True
+                self._create_drawing(DrawingType.UNDO, 0, "", (0, 0, 0, 0), 
+                                        op_id = op_id)
+        self._select([])
+
+    def _extend_stroke(self, point, is_last = False):
+        """
+        Add the point to the current stroke and preview the part of it that 
+        has not been sent, flushing it once a full batch of points is 
+        waiting.
+
+        Points the simplifier rejects are dropped, unless it is the last 
+        point of the stroke.
+        """
+        stroke_coords = self.application_state.stroke_coords
+        if not stroke_coords:
+            stroke_coords.extend(self.application_state.start_pos)
+        elif tuple(stroke_coords[-2:]) == point and len(stroke_coords) >= 4:
+            return
+        elif not (is_last or self.simplifier.accept(
+                                        tuple(stroke_coords[-2:]), point)):
+            return
+
+        stroke_coords.extend(point)
+        unsent_coords = stroke_coords[self._unsent_stroke_start():]
+        self.current_view.show_preview(
+                        Drawing(self.application_state.current_type, 
+                                self.application_state.current_thickness, 
+                                self.application_state.current_color, 
+                                unsent_coords))
+        if len(unsent_coords) >= 2 * self.STROKE_BATCH_SIZE:
+            self._flush_stroke()
+
+    def _flush_stroke(self):
+        """
+        Create a single drawing out of the stroke points that have not been 
+        sent yet, starting from the last sent point so the pieces join up.
+
+        The simplifier reduces each piece on its own, as the stroke is sent 
+        while it is drawn, and keeps its end points, so the next piece still 
+        starts where this one ends.  The pieces of a stroke are undone 
+        together.
+        """
+        stroke_coords = self.application_state.stroke_coords
+        unsent_start = self._unsent_stroke_start()
+        if len(stroke_coords) - unsent_start >= 4:
+            joined = self.application_state.stroke_pieces > 0
+            self._create_drawing(self.application_state.current_type, 
+                                    self.application_state.current_thickness, 
+                                    self.application_state.current_color,
+                                    self.simplifier.simplify(
+                                            stroke_coords[unsent_start:]),
+                                    joined = joined)
+            self.application_state.stroke_sent = len(stroke_coords)
+            self.application_state.stroke_pieces += 1
+
+    def _unsent_stroke_start(self):
+        return max(self.application_state.stroke_sent - 2, 0)
+
+    def _clear_drawing_state(self):
+        """
+        Clear the drawing state and the local preview, telling the connected 
+        application to remove its copy of the preview if one was sent.
+        """
+        if self.application_state.preview_sent_time is not None:
+            self.application_state.add_to_send_queue(
+                    Drawing(DrawingType.CLEAR, 0, "", (0, 0, 0, 0), 
+                            preview = True, 
+                            op_id = (self.application_state.author_id, 0)))
+        self.current_view.clear_preview()
+        self.application_state.clear_drawing_state()
 
     def get_menu_data(self):
         menu_setup = super().get_menu_data()
@@ -140,8 +424,41 @@ class Controller(ConnController, SLController, ControllerBase):
         menu_setup = self.conn_component.get_menu_data(menu_setup)
         menu_setup.add_submenu_item("Network", "Sync Canvas", 
                                     self.create_sync, "Alt-s")
+        if METRICS.enabled:
+            menu_setup.add_submenu_item("Debug", "Show Metrics", 
+                                        self.show_metrics)
         return menu_setup
 
+    def show_metrics(self):
+        self.current_view.show_metrics(self._metrics_json(indent = 4))
+
+    def _metrics_json(self, indent = None):
+        return dumps(METRICS.snapshot(), indent = indent)
+
+    def _sample_metrics(self):
+        """
+        Record the depths of the queues, writing the metrics to the log once 
+        the interval since they were last written has passed.
+
+        The drawings to send include those the sender or the connection is 
+        holding back to coalesce, not only those still queued.
+        """
+        state = self.application_state
+        METRICS.observe("draw_queue", state.draw_queue.qsize())
+        METRICS.observe("receive_queue", state.receive_queue.qsize())
+        METRICS.observe("write_queue", state.write_queue.qsize())
+        METRICS.observe("send_queue", state.send_queue.qsize() 
+                                            + self.sender.pending_count
+                                        if self.sender is not None 
+                                        else len(self.conn_component.pending))
+        if monotonic() - self.metrics_logged_time >= self.metrics_interval:
+            self.metrics_logged_time = monotonic()
+            getLogger(__name__).info("Metrics {}".format(
+                                                        self._metrics_json()))
+        if METRICS.enabled:
+            self.window.root.after(self.METRICS_SAMPLE_INTERVAL, 
+                                    self._sample_metrics)
+
     def create_text(self, text, coords):
         """
         A specialized version of _create_drawing for use by the text tool.
@@ -155,58 +472,105 @@ class Controller(ConnController, SLController, ControllerBase):
         self._create_drawing(DrawingType.CLEAR, 0, "", (0, 0, 0, 0))
 
     def create_undo(self):
-        self._create_drawing(DrawingType.UNDO, 0, "", (0, 0, 0, 0))
+        """
+        Undo this application's last action, whatever has been drawn by the 
+        connected applications since.  Undoing an erase redoes the drawings 
+        it erased.
+        """
+        erase, op_ids = self.application_state.pop_undo()
+        for op_id in reversed(op_ids):
+            self._create_drawing(DrawingType.REDO if erase 
+                                    else DrawingType.UNDO, 
+                                    0, "", (0, 0, 0, 0), op_id = op_id)
+
+    def create_redo(self):
+        """
+        Redo this application's last undone action, erasing the drawings 
+        again if it was an erase.
+        """
+        erase, op_ids = self.application_state.pop_redo()
+        for op_id in op_ids:
+            self._create_drawing(DrawingType.UNDO if erase 
+                                    else DrawingType.REDO, 
+                                    0, "", (0, 0, 0, 0), op_id = op_id)
 
     def create_sync(self):
-        self._create_drawing(DrawingType.SYNC, 0, "", (0, 0, 0, 0))
+        """
+        Request the connected application's history, sending the length and 
+        digests of ours so that only what is missing has to be sent back.
+        """
+        history = self.application_state.drawing_history
+        self._create_drawing(DrawingType.SYNC, 0, "", 
+                                history.sync_token() 
+                                    + (history.removed_digest(), 
+                                        history.SYNC_REQUEST))
 
     def _create_drawing(self, drawing_type, thickness, color, coords, 
-                        text = None):
+                        text = None, op_id = None, joined = False):
         """
         Create, draw, and queue up the drawing to send out.
+
+        Drawings that go into the history are given the next op id and 
+        recorded as a new undoable action, or as part of the last one if 
+        joined.
         """
-        drawing = Drawing(drawing_type, thickness, color, coords, text)
+        if op_id is None and DrawingType.is_recorded(drawing_type):
+            op_id = self.application_state.next_op_id()
+            self.application_state.record_op(op_id, joined)
+        drawing = Drawing(drawing_type, thickness, color, coords, text, 
+                            op_id = op_id)
         self.application_state.add_to_draw_queue(drawing)
-
-        encoded_drawing = drawing.encode()
-        if encoded_drawing is not None:
-            self.application_state.add_to_send_queue(encoded_drawing)
+        self.application_state.add_to_send_queue(drawing)
 
     def save_logic(self, filename):
         """
-        Encode the entire drawing history and write it to the given file.
+        Encode the entire drawing history and write it to the given file, a 
+        block at a time.
         """
-        data = b''.join([drawing.encode() for drawing in 
-                                self.application_state.drawing_history
-                                if drawing is not None])
+        history = self.application_state.drawing_history
         with open(filename, "wb") as cur_file:
-            cur_file.write(data)
+            DrawingFile.write(cur_file, history, history.snapshot_length)
 
     def load_logic(self, filename):
         """
-        Clear the current canvas, then decode the drawing data from the file, 
-        and put it on the draw queue to be drawn.
+        Clear the current canvas, then decode the drawing data from the file 
+        in the background, putting each drawing on the draw queue as it is 
+        decoded so the canvas starts painting before the file is fully read.
+
+        Blocks are paged in through the file's index as the draw queue 
+        drains, so only the drawings about to be drawn are held decoded.
         """
-        with open(filename, "rb") as cur_file:
-            self.application_state.add_to_draw_queue(self._create_clear())
-            data = cur_file.read()
-            for drawing in Drawing.decode_drawings(data):
+        cur_file = open(filename, "rb")
+        self.application_state.add_to_draw_queue(self._create_clear())
+        Thread(target = self._load_drawings, args = (cur_file,), 
+                daemon = True).start()
+
+    def _load_drawings(self, cur_file):
+        draw_queue = self.application_state.draw_queue
+        with cur_file:
+            for drawing in DrawingFile.read(cur_file):
+                while (draw_queue.qsize() >= self.LOAD_AHEAD 
+                        and self.application_state.draw_active):
+                    sleep(self.LOAD_WAIT)
                 self.application_state.add_to_draw_queue(drawing)
+        getLogger(__name__).debug("Loading {} done.".format(cur_file.name))
 
-
-    def _sync_to_connected(self):
+    def _sync_to_connected(self, sync):
         """
-        Enqueue the entire drawing history to send to connected application.
+        Enqueue the part of the drawing history the connected application is 
+        missing, using the history length and digest carried by its sync.
 
-        Put a clear at the front to clear their canvas before updating them 
-        with the history.
+        If their history is a prefix of ours only the rest of ours is sent, 
+        otherwise put a clear at the front to clear their canvas before 
+        updating them with the entire history.
         """
-        self.application_state.add_to_send_queue(self._create_clear().encode())
-        for drawing in self.application_state.drawing_history:
-            if drawing.shape not in {DrawingType.PING, DrawingType.SYNC}:
-                encoded_drawing = drawing.encode()
-                if encoded_drawing is not None:
-                    self.application_state.add_to_send_queue(encoded_drawing)
+        if METRICS.enabled:
+            begin = perf_counter()
+        reply = list(self.application_state.drawing_history.sync_reply(sync))
+        self.application_state.add_all_to_send_queue(reply)
+        if METRICS.enabled:
+            METRICS.observe("sync_ms", 1000 * (perf_counter() - begin))
+            METRICS.count("sync_drawings", len(reply))
 
     def _create_clear(self):
         return Drawing(DrawingType.CLEAR, 0, "", (0, 0, 0, 0))
@@ -1,5 +1,6 @@
 from logging        import getLogger
-from struct         import calcsize, error, pack, unpack
+from math           import hypot
+from struct         import Struct, calcsize, error, pack, unpack
 
 from .drawing_type import DrawingType
 
@@ -11,16 +12,76 @@ class Drawing:
     """
 
     # shape, thickness, # character + 6 hex digits for color, 4 coord values, 
-    # text length
+    # payload length
     MSG_PACK_STR = "iI7s4iI"      
     MSG_SIZE = calcsize(MSG_PACK_STR)
+    MSG_STRUCT = Struct(MSG_PACK_STR)
 
-    def __init__(self, shape, thickness, color, coords, text = None):
+    # the payload is the text for text drawings, and the coord values past 
+    # the first 4 for strokes
+    HEADER_COORDS = 4
+    COORD_PACK_STR = "{}i"
+    COORD_SIZE = calcsize(COORD_PACK_STR.format(1))
+
+    # the payload length is the last header field
+    PAYLOAD_LENGTH_STRUCT = Struct("I")
+    PAYLOAD_LENGTH_OFFSET = MSG_SIZE - PAYLOAD_LENGTH_STRUCT.size
+
+    # set in the encoded shape value of drawings that are only a preview of 
+    # one being dragged out, kept out of the drawing history
+    PREVIEW_FLAG = 0x100
+
+    # set in the encoded shape value of drawings with an op id, the author 
+    # and sequence number that start their payload
+    OP_ID_FLAG = 0x200
+    OP_ID_STRUCT = Struct("II")
+
+    # sizes of the drawings that are not just their coords, shared by 
+    # everything that draws them or estimates their extent
+    TEXT_BASE_SIZE = 10     # point size of text of thickness 1
+    PING_COUNT = 3          # circles a ping grows through
+    PING_RADIUS_STEP = 10   # pixels each circle is larger than the last
+    PING_EXTENT = PING_COUNT * PING_RADIUS_STEP
+
+    __slots__ = ("shape", "thickness", "color", "coords", "text", "preview", 
+                    "author", "seq")
+
+    def __init__(self, shape, thickness, color, coords, text = None, 
+                    preview = False, op_id = None):
         self.shape = shape
         self.thickness = thickness
         self.color = color
         self.coords = coords
         self.text = text
+        self.preview = preview
+        self.author, self.seq = (0, 0) if op_id is None else op_id
+
+    @property
+    def op_id(self):
+        """
+        Return the (author, seq) id of the operation, None if it has none.
+
+        Drawings in the history are identified by their op id, while an undo 
+        or redo with an op id is aimed at the drawing with that id.
+        """
+        return (self.author, self.seq) if self.author else None
+
+    @property
+    def shape_value(self):
+        """
+        Return the encoded shape value, carrying the flags.
+        """
+        return (self.shape.value 
+                | (self.PREVIEW_FLAG if self.preview else 0)
+                | (self.OP_ID_FLAG if self.author else 0))
+
+    @staticmethod
+    def split_shape_value(shape_value):
+        """
+        Return the shape and the flags held in an encoded shape value.
+        """
+        flags = shape_value & (Drawing.PREVIEW_FLAG | Drawing.OP_ID_FLAG)
+        return DrawingType(shape_value & ~flags), flags
 
     def encode(self):
         """
@@ -28,63 +89,198 @@ class Drawing:
         """
         bytes_msg = None
         try:
-            text_length = 0 if self.text is None else len(self.text)
-            bytes_msg = pack(self.MSG_PACK_STR, self.shape.value, 
-                                self.thickness, self.color.encode(), 
-                                *self.coords, text_length)
-            if text_length > 0:
-                text_pack_str = "{}s".format(text_length)
-                bytes_msg += pack(text_pack_str, self.text.encode())
+            payload = self._encode_payload()
+            bytes_msg = self.MSG_STRUCT.pack(self.shape_value, 
+                                        self.thickness, 
+                                        self.color.encode(), 
+                                        *self.coords[:self.HEADER_COORDS], 
+                                        len(payload)) + payload
 
         except error as err:    # struct.error
             getLogger(__name__).debug("Error in encoding: {}".format(err))
 
         return bytes_msg
 
+    def _encode_payload(self):
+        """
+        Return the bytes that follow the fixed size header.
+        """
+        payload = b''
+        if self.text is not None:
+            payload = self.text.encode()
+        elif DrawingType.is_stroke(self.shape):
+            extra_coords = self.coords[self.HEADER_COORDS:]
+            payload = pack(self.COORD_PACK_STR.format(len(extra_coords)), 
+                            *extra_coords)
+        if self.author:
+            payload = self.OP_ID_STRUCT.pack(self.author, self.seq) + payload
+        return payload
+
+    @staticmethod
+    def record_length(byte_array, offset = 0):
+        """
+        Return the length of the record at the offset, or None if the byte 
+        array does not hold all of it yet.
+        """
+        if len(byte_array) - offset < Drawing.MSG_SIZE:
+            return None
+        payload_length, = Drawing.PAYLOAD_LENGTH_STRUCT.unpack_from(
+                            byte_array, offset + Drawing.PAYLOAD_LENGTH_OFFSET)
+        length = Drawing.MSG_SIZE + payload_length
+        return length if len(byte_array) - offset >= length else None
+
     @staticmethod
     def decode_drawings(byte_array):
         """
         Return a list of the decoded drawings in the byte array.
         """
-        drawings = []
+        return list(Drawing.iter_decode(byte_array))
+
+    @staticmethod
+    def iter_decode(byte_array):
+        """
+        Yield the drawings decoded from the byte array, stopping at the first 
+        record that fails to decode.
+
+        The buffer is walked through a memoryview so no record is copied 
+        before it is unpacked.  Runs of fixed-size records without a payload 
+        are unpacked in bulk with iter_unpack, a record with a payload ends 
+        the run and a new one starts after its payload.
+        """
         i = 0
-        try:
-            while i < len(byte_array):
-                drawing, length = Drawing.decode_drawing(byte_array[i:])
-                drawings.append(drawing)
-                i += length
-            assert i == len(byte_array) # decoded all drawings exactly as sent
-
-        except (ValueError, error) as err:  # struct.error
-            getLogger(__name__).debug("Error in decoding: {}".format(err))
-        except AssertionError as err:
-            getLogger(__name__).debug("Error decoding, decoded length does "
-                                    "not match byte length\n Decoded - "
-                                    "{} bytes - {}".format(i, len(byte_array)))
-        return drawings
+        length = len(byte_array)
+        with memoryview(byte_array) as view:
+            try:
+                while i < length:
+                    run_end = i + ((length - i) // Drawing.MSG_SIZE 
+                                    * Drawing.MSG_SIZE)
+                    assert run_end > i  # a whole header is left to decode
+                    for fields in Drawing.MSG_STRUCT.iter_unpack(
+                                                        view[i:run_end]):
+                        i += Drawing.MSG_SIZE
+                        payload_length = fields[-1]
+                        yield Drawing._from_fields(fields, view, i)
+                        i += payload_length
+                        if payload_length > 0:
+                            break
+
+            except (ValueError, error) as err:  # struct.error
+                getLogger(__name__).debug("Error in decoding: {}".format(err))
+            except AssertionError as err:
+                getLogger(__name__).debug("Error decoding, decoded length "
+                                        "does not match byte length\n "
+                                        "Decoded - {} bytes - {}".format(i, 
+                                                                    length))
 
     @staticmethod
-    def decode_drawing(byte_array):
+    def decode_drawing(byte_array, offset = 0):
         """
         Return a Drawing instance, and its length, using the data from the 
-        byte array.
+        byte array starting at the given offset.
         """
-        drawing = None
-        length = Drawing.MSG_SIZE
-        shape_val, thickness, color, *coords, text_length = unpack(
-                                                Drawing.MSG_PACK_STR, 
-                                                byte_array[:Drawing.MSG_SIZE])
+        fields = Drawing.MSG_STRUCT.unpack_from(byte_array, offset)
+        with memoryview(byte_array) as view:
+            drawing = Drawing._from_fields(fields, view, 
+                                            offset + Drawing.MSG_SIZE)
+        return drawing, Drawing.MSG_SIZE + fields[-1]
+
+    @staticmethod
+    def _from_fields(fields, view, payload_offset):
+        """
+        Return a Drawing instance built from the unpacked header fields and 
+        the payload stored in the view at the offset.
+
+        Raises a struct.error if the view ends before the payload does.
+        """
+        shape_val, thickness, color, *coords, payload_length = fields
+        shape, flags = Drawing.split_shape_value(shape_val)
         text = None
-        if text_length > 0:
-            # [0].decode() because unpack will always returns a singleton 
-            # list of a bytes object
-            text = unpack(str(text_length) + "s", 
-                            byte_array[Drawing.MSG_SIZE:])[0].decode()
-            length += text_length
+        op_id = None
+        if payload_length > 0:
+            payload = view[payload_offset:payload_offset + payload_length]
+            if len(payload) != payload_length:
+                raise error("payload requires a buffer of {} bytes".format(
+                                                            payload_length))
+            if flags & Drawing.OP_ID_FLAG:
+                op_id = Drawing.OP_ID_STRUCT.unpack_from(payload)
+                payload = payload[Drawing.OP_ID_STRUCT.size:]
+            if DrawingType.is_stroke(shape):
+                coords.extend(unpack(Drawing.COORD_PACK_STR.format(
+                                    len(payload) // Drawing.COORD_SIZE), 
+                                    payload))
+            elif payload:
+                text = bytes(payload).decode()
+        # the color is padded with null bytes when it is shorter than 7
+        return Drawing(shape, thickness, color.rstrip(b"\0").decode(), 
+                        coords, text, bool(flags & Drawing.PREVIEW_FLAG), 
+                        op_id)
+
+    @classmethod
+    def font_size(cls, thickness):
+        """
+        Return the point size of text drawn at the thickness.
+        """
+        return cls.TEXT_BASE_SIZE + (thickness - 1) * 2
 
-        drawing = Drawing(DrawingType(shape_val), thickness, color.decode(), 
-                            coords, text)
-        return drawing, length
+    def bounding_box(self):
+        """
+        Return the (x1, y1, x2, y2) canvas region covered by the drawing, or 
+        None if it has no location.
+        """
+        if DrawingType.has_no_location(self.shape):
+            return None
+
+        x, y = self.coords[0], self.coords[1]
+        if self.shape is DrawingType.TEXT:
+            size = self.font_size(self.thickness)
+            width = size * len(self.text or "")
+            return (x, y - size, x + width, y + size)
+        elif self.shape is DrawingType.PING:
+            extent = self.PING_EXTENT + self.thickness
+            return (x - extent, y - extent, x + extent, y + extent)
+
+        xs, ys = self.coords[0::2], self.coords[1::2]
+        return (min(xs) - self.thickness, min(ys) - self.thickness, 
+                max(xs) + self.thickness, max(ys) + self.thickness)
+
+    def is_near(self, x, y, distance):
+        """
+        Return whether the drawing, as it is drawn with its thickness, comes 
+        within the distance of the point.
+
+        Lines are measured to each of their segments and rectangles and 
+        ovals to their outlines, anything else to its bounding box.
+        """
+        reach = distance + self.thickness / 2
+        if self.shape in {DrawingType.PEN, DrawingType.LINE, 
+                            DrawingType.ERASER}:
+            points = list(zip(self.coords[0::2], self.coords[1::2]))
+            return any(self._segment_distance(x, y, *start, *end) <= reach 
+                        for start, end in zip(points, points[1:] or points))
+
+        if self.shape in {DrawingType.RECT, DrawingType.OVAL}:
+            x1, x2 = sorted(self.coords[0::2][:2])
+            y1, y2 = sorted(self.coords[1::2][:2])
+            if self.shape is DrawingType.RECT:
+                outside = hypot(max(x1 - x, 0, x - x2), 
+                                max(y1 - y, 0, y - y2))
+                inside = min(x - x1, x2 - x, y - y1, y2 - y)
+                return max(outside, inside) <= reach
+            rx, ry = max((x2 - x1) / 2, 1), max((y2 - y1) / 2, 1)
+            scaled = hypot((x - (x1 + x2) / 2) / rx, (y - (y1 + y2) / 2) / ry)
+            return abs(scaled - 1) * min(rx, ry) <= reach
+
+        box = self.bounding_box()
+        return (box is not None and box[0] - distance <= x <= box[2] + distance
+                and box[1] - distance <= y <= box[3] + distance)
+
+    @staticmethod
+    def _segment_distance(x, y, x1, y1, x2, y2):
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = (0 if length == 0 
+                else min(max(((x - x1) * dx + (y - y1) * dy) / length, 0), 1))
+        return hypot(x - x1 - t * dx, y - y1 - t * dy)
 
     def __str__(self):
         return "{}:{}:{}:{}:{}".format(self.shape, self.thickness, self.color, 
@@ -94,6 +290,8 @@ class Drawing:
         equal = False
         if isinstance(self, other.__class__):
             equal = (self.shape == other.shape
+                        and self.preview == other.preview
+                        and self.op_id == other.op_id
                         and self.thickness == other.thickness
                         and self.color == other.color
                         and tuple(self.coords) == tuple(other.coords))
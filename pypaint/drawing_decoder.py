@@ -0,0 +1,110 @@
+from logging        import getLogger
+from struct         import error
+
+from .drawing       import Drawing
+
+
+class DrawingDecoder:
+    """
+    Stateful decoder for drawing records that arrive in pieces, like the
+    reads from a socket or a file, which can split a record anywhere.
+
+    Data is appended to one reusable buffer and records are decoded in place
+    from a read offset, so a record split across reads is decoded as soon as
+    its last byte arrives without being copied out first.  The space of the
+    records already read is only reclaimed once it outweighs the unread
+    data, so on average each byte is moved at most once.
+    """
+
+    COMPACT_SIZE = 1 << 12      # read bytes worth reclaiming
+    DECODE_ERRORS = (ValueError, IndexError, error)     # struct.error
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Drop any buffered data, ready for a new stream.
+        """
+        self._drop()
+        self.failed = False
+
+    def _drop(self):
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def __len__(self):
+        """
+        Return the number of bytes buffered that are not decoded yet.
+        """
+        return len(self.buffer) - self.offset
+
+    def feed(self, data):
+        """
+        Add the received data to the end of the buffer.
+        """
+        if self.offset >= self.COMPACT_SIZE and self.offset >= len(self):
+            del self.buffer[:self.offset]
+            self.offset = 0
+        self.buffer += data
+
+    def drawings(self):
+        """
+        Yield the drawings completed by the data fed so far, keeping any
+        partial record for the next feed.
+
+        Data that fails to decode is dropped, along with the rest of the
+        buffer, since the record boundaries after it cannot be trusted, and
+        the decoder is marked as failed.
+        """
+        try:
+            while True:
+                length = self._record_length(self.buffer, self.offset)
+                if length is None:
+                    break
+                drawings = self._decode_record(self.buffer, self.offset,
+                                                length)
+                self.offset += length
+                yield from drawings
+
+        except self.DECODE_ERRORS as err:
+            getLogger(__name__).debug("Error in decoding, dropping {} "
+                                        "bytes: {}".format(len(self), err))
+            self._drop()
+            self.failed = True
+
+    def decode(self, data):
+        """
+        Return the list of drawings completed by the data.
+        """
+        self.feed(data)
+        return list(self.drawings())
+
+    def _record_length(self, buffer, offset):
+        """
+        Return the length of the record at the offset, or None if the buffer
+        does not hold all of it yet.
+        """
+        return Drawing.record_length(buffer, offset)
+
+    def _decode_record(self, buffer, offset, length):
+        """
+        Return the drawings in the complete record at the offset.
+        """
+        return (Drawing.decode_drawing(buffer, offset)[0],)
+
+    @classmethod
+    def decode_stream(cls, stream, chunk_size):
+        """
+        Yield the drawings decoded from the binary stream as each chunk of it
+        is read, stopping at the first record that fails to decode.
+        """
+        decoder = cls()
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            decoder.feed(chunk)
+            yield from decoder.drawings()
+            if decoder.failed:
+                return
+        if len(decoder) > 0:
+            getLogger(__name__).debug("Error decoding, {} bytes left in "
+                                        "stream".format(len(decoder)))
@@ -0,0 +1,237 @@
+from collections       import namedtuple
+from io                import SEEK_END
+from logging           import getLogger
+from mmap              import ACCESS_READ, mmap
+from struct            import Struct, error
+from zlib              import compress, crc32, decompress
+from zlib              import error as zlib_error
+
+from .drawing          import Drawing
+from .drawing_decoder  import DrawingDecoder
+
+
+Block = namedtuple("Block", ["offset", "stored_length", "raw_length",
+                                "record_count", "checksum", "flags"])
+
+
+class DrawingFile:
+    """
+    Reads and writes drawings in .pypaint files, streaming them so neither
+    side needs the whole file in memory at once.
+
+    Files are written in the v2 container format, a header followed by
+    blocks of encoded drawings and an index of the blocks:
+
+        header  | magic, version
+        block   | stored length, raw length, record count, crc32, flags,
+                | then the (optionally zlib compressed) encoded drawings
+        ...
+        index   | offset and block header of every block
+        trailer | index offset, block count, end magic
+
+    Each block is checked against its crc32, so a corrupt block is skipped
+    instead of losing the rest of the file.  The blocks holding the history
+    snapshot are flagged, and the index allows paging in any range of
+    blocks.  Files without the header are raw concatenated drawings, the
+    original format, and are still read.
+    """
+
+    MAGIC = b"PYPAINT\x00"
+    END_MAGIC = b"\x00PYPAINT"
+    VERSION = 2
+
+    HEADER_STRUCT = Struct("<8sI")
+    BLOCK_STRUCT = Struct("<IIIIB")
+    INDEX_STRUCT = Struct("<Q")     # block offset, followed by block header
+    TRAILER_STRUCT = Struct("<QI8s")
+
+    COMPRESSED = 1
+    SNAPSHOT = 2
+    BLOCK_FLAGS = COMPRESSED | SNAPSHOT
+
+    BLOCK_SIZE = 1 << 16
+    COMPRESSION_LEVEL = 6
+    CHUNK_SIZE = 1 << 16
+    MMAP_THRESHOLD = 1 << 24    # raw files at least this large are mapped
+
+    @staticmethod
+    def write(cur_file, drawings, snapshot_length = 0, compressed = True):
+        """
+        Encode the drawings and write them to the open binary file a block
+        at a time, flagging the blocks holding the first snapshot_length
+        drawings as the snapshot.
+        """
+        cur_file.write(DrawingFile.HEADER_STRUCT.pack(DrawingFile.MAGIC,
+                                                        DrawingFile.VERSION))
+        index = []
+        data = bytearray()
+        count = 0
+        for i, drawing in enumerate(drawings):
+            if i == snapshot_length and count > 0:
+                index.append(DrawingFile._write_block(cur_file, data, count,
+                                                        DrawingFile.SNAPSHOT,
+                                                        compressed))
+                data.clear()
+                count = 0
+
+            encoded_drawing = drawing.encode()
+            if encoded_drawing is not None:
+                data += encoded_drawing
+                count += 1
+            if len(data) >= DrawingFile.BLOCK_SIZE:
+                flags = DrawingFile.SNAPSHOT if i < snapshot_length else 0
+                index.append(DrawingFile._write_block(cur_file, data, count,
+                                                        flags, compressed))
+                data.clear()
+                count = 0
+        if count > 0:
+            index.append(DrawingFile._write_block(cur_file, data, count, 0,
+                                                    compressed))
+
+        index_offset = cur_file.tell()
+        for block in index:
+            cur_file.write(DrawingFile.INDEX_STRUCT.pack(block.offset)
+                            + DrawingFile.BLOCK_STRUCT.pack(*block[1:]))
+        cur_file.write(DrawingFile.TRAILER_STRUCT.pack(index_offset,
+                                                        len(index),
+                                                        DrawingFile.END_MAGIC))
+
+    @staticmethod
+    def _write_block(cur_file, data, count, flags, compressed):
+        """
+        Write the block of encoded drawings and return its index entry.
+        """
+        stored = bytes(data)
+        if compressed:
+            compressed_data = compress(stored, DrawingFile.COMPRESSION_LEVEL)
+            if len(compressed_data) < len(stored):
+                stored = compressed_data
+                flags |= DrawingFile.COMPRESSED
+
+        block = Block(cur_file.tell(), len(stored), len(data), count,
+                        crc32(data), flags)
+        cur_file.write(DrawingFile.BLOCK_STRUCT.pack(*block[1:]))
+        cur_file.write(stored)
+        return block
+
+    @staticmethod
+    def read(cur_file, start = 0, stop = None):
+        """
+        Yield the drawings from the open binary file as they are decoded,
+        from the blocks in the given range for v2 files.
+        """
+        if DrawingFile.is_v2(cur_file):
+            index = DrawingFile.read_index(cur_file)
+            for block in index[start:stop]:
+                yield from DrawingFile.read_block(cur_file, block)
+        else:
+            yield from DrawingFile._read_raw(cur_file)
+
+    @staticmethod
+    def is_v2(cur_file):
+        cur_file.seek(0)
+        header = cur_file.read(DrawingFile.HEADER_STRUCT.size)
+        cur_file.seek(0)
+        return (len(header) == DrawingFile.HEADER_STRUCT.size
+                and DrawingFile.HEADER_STRUCT.unpack(header)[0]
+                    == DrawingFile.MAGIC)
+
+    @staticmethod
+    def read_index(cur_file):
+        """
+        Return the blocks of a v2 file, from its index if it is intact or
+        else by walking the block headers from the start of the file, up to
+        the index if the trailer still says where it starts.
+        """
+        blocks_end = None
+        try:
+            cur_file.seek(-DrawingFile.TRAILER_STRUCT.size, SEEK_END)
+            trailer = cur_file.read(DrawingFile.TRAILER_STRUCT.size)
+            index_offset, count, end_magic = DrawingFile.TRAILER_STRUCT.unpack(
+                                                                    trailer)
+            if end_magic == DrawingFile.END_MAGIC:
+                blocks_end = index_offset
+                cur_file.seek(index_offset)
+                entry_size = (DrawingFile.INDEX_STRUCT.size
+                                + DrawingFile.BLOCK_STRUCT.size)
+                data = cur_file.read(count * entry_size)
+                return [Block(*DrawingFile.INDEX_STRUCT.unpack_from(data, i),
+                                *DrawingFile.BLOCK_STRUCT.unpack_from(data,
+                                    i + DrawingFile.INDEX_STRUCT.size))
+                            for i in range(0, count * entry_size, entry_size)]
+        except (OSError, error) as err:     # struct.error
+            getLogger(__name__).debug("Error reading index: {}".format(err))
+
+        getLogger(__name__).debug("Index missing, scanning blocks.")
+        return DrawingFile._scan_blocks(cur_file, blocks_end)
+
+    @staticmethod
+    def _scan_blocks(cur_file, end = None):
+        """
+        Return the blocks found by walking the block headers from the start
+        of the file to the end offset, or to the end of the file, stopping
+        at anything that cannot be a block header, such as the index.
+        """
+        cur_file.seek(0, SEEK_END)
+        size = cur_file.tell()
+        end = size if end is None else min(end, size)
+        blocks = []
+        offset = DrawingFile.HEADER_STRUCT.size
+        while offset + DrawingFile.BLOCK_STRUCT.size <= end:
+            cur_file.seek(offset)
+            block = Block(offset, *DrawingFile.BLOCK_STRUCT.unpack(
+                                cur_file.read(DrawingFile.BLOCK_STRUCT.size)))
+            offset += DrawingFile.BLOCK_STRUCT.size + block.stored_length
+            if (offset > end or not block.raw_length 
+                    or not block.record_count 
+                    or block.flags & ~DrawingFile.BLOCK_FLAGS):
+                break
+            blocks.append(block)
+        return blocks
+
+    @staticmethod
+    def read_block(cur_file, block):
+        """
+        Return the drawings stored in the block, or an empty list if it
+        fails its checksum.
+        """
+        cur_file.seek(block.offset + DrawingFile.BLOCK_STRUCT.size)
+        data = cur_file.read(block.stored_length)
+        try:
+            if block.flags & DrawingFile.COMPRESSED:
+                data = decompress(data)
+        except zlib_error as err:
+            getLogger(__name__).debug("Error decompressing block at {}: "
+                                        "{}".format(block.offset, err))
+            return []
+
+        if len(data) != block.raw_length or crc32(data) != block.checksum:
+            getLogger(__name__).debug("Skipping corrupt block at {}".format(
+                                                                block.offset))
+            return []
+        return Drawing.decode_drawings(data)
+
+    @staticmethod
+    def snapshot_end(index):
+        """
+        Return the position of the first block after the snapshot blocks.
+        """
+        return sum(1 for block in index if block.flags & DrawingFile.SNAPSHOT)
+
+    @staticmethod
+    def _read_raw(cur_file):
+        """
+        Yield the drawings from a file in the original raw format.
+
+        Large files are memory mapped and decoded in place, smaller ones are
+        read through the file buffer a chunk at a time.
+        """
+        cur_file.seek(0, SEEK_END)
+        size = cur_file.tell()
+        cur_file.seek(0)
+        if size >= DrawingFile.MMAP_THRESHOLD:
+            with mmap(cur_file.fileno(), 0, access = ACCESS_READ) as mapped:
+                yield from Drawing.iter_decode(mapped)
+        else:
+            yield from DrawingDecoder.decode_stream(cur_file, 
+                                                    DrawingFile.CHUNK_SIZE)
@@ -0,0 +1,522 @@
+from array          import array
+from bisect         import bisect_left, bisect_right, insort
+from struct         import pack, unpack
+from zlib           import crc32
+
+from .drawing       import Drawing
+from .drawing_type  import DrawingType
+from .spatial_index import SpatialIndex
+
+
+class DrawingHistory:
+    """
+    Columnar store for the drawing history, holding the fields of every
+    drawing in parallel typed arrays instead of as Drawing instances.
+
+    Drawings are rebuilt as they are read back out, so a long session only
+    costs a few machine words per drawing.
+
+    Each drawing is kept with the canvas items it is currently drawn as, so
+    undoing it removes both together and the two can never drift apart.
+    Only the drawn drawings have an entry for their items, so setting them
+    costs the same however long the history is, and their indices are kept
+    in order so a drawing can be stacked under the next one drawn.
+    The drawings are partitioned into tiles by their bounding boxes, so the
+    ones in a region of the canvas can be drawn on demand, and have no
+    items while they are not.  The ones that can still be undone are kept
+    in a finer grid of their own, so finding them under the cursor never
+    looks at the snapshot.
+
+    Drawings with an op id are indexed by it, so an undo or redo aimed at
+    one finds it directly however much has been drawn since.  An undone
+    drawing is left in place as a tombstone, skipped when iterating, until
+    it is redone, truncated, or compacted away.
+
+    Every drawing appended is counted, and a running digest of the encoded
+    drawings is kept along with the count up to each one, so two histories
+    can tell whether one is a prefix of the other.  Undoing leaves those
+    alone, so a digest of the op ids of the removed drawings is kept as
+    well, telling whether the two have undone the same drawings.
+
+    Drawings older than the undo horizon can be compacted into a snapshot,
+    where strokes that continue one another are joined into single drawings
+    and can no longer be undone.  A joined drawing keeps the count and
+    digest of the last drawing joined into it, so compacting leaves the
+    sync token alone and a peer holding a prefix still only needs the rest.
+    """
+
+    # marks a color that is not "#rrggbb", kept in the color name table
+    NAMED_COLOR = -1
+    COLOR_FORMAT = "#{:06x}"
+
+    # points a stroke can be joined up to during compaction
+    MAX_JOINED_POINTS = 2048
+
+    TILE_SIZE = 512
+
+    # coords[3] of a sync from a history that takes position markers in the 
+    # reply, and of the markers themselves
+    SYNC_REQUEST = 1
+    SYNC_POSITION = 2
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._shapes = array("i")
+        self._thicknesses = array("i")
+        self._colors = array("i")
+        self._coord_starts = array("q", [0])
+        self._coords = array("i")
+        self._texts = {}
+        self._color_names = {}
+        self._items = {}        # index -> canvas items, of drawn drawings
+        self._drawn = []        # sorted indices of the drawn drawings
+        self._authors = array("I")
+        self._seqs = array("I")
+        self._removed = bytearray()
+        self._ops = {}          # op id -> index
+        self.tiles = SpatialIndex(self.TILE_SIZE)   # of the live indices
+        self._undoable = SpatialIndex()     # of those past the snapshot
+        self._ends = array("q")     # count of drawings appended up to each
+        self._digests = array("I")
+        self._removed_digest = 0    # xor of the digests of removed op ids
+        self.snapshot_length = 0
+
+    def append(self, drawing, items = ()):
+        """
+        Add the drawing to the end of the history, along with the canvas 
+        items it was drawn as.
+        """
+        last_end, last_digest = ((self._ends[-1], self._digests[-1]) 
+                                    if self._ends else (0, 0))
+        self._append(drawing, items, last_end + 1, 
+                        crc32(drawing.encode() or b'', last_digest))
+
+    def _append(self, drawing, items, end, digest):
+        index = len(self._shapes)
+        self._shapes.append(drawing.shape.value)
+        self._thicknesses.append(drawing.thickness)
+        self._colors.append(self._pack_color(index, drawing.color))
+        self._coords.extend(drawing.coords)
+        self._coord_starts.append(len(self._coords))
+        if drawing.text is not None:
+            self._texts[index] = drawing.text
+        self.set_items(index, items)
+        self._authors.append(drawing.author)
+        self._seqs.append(drawing.seq)
+        self._removed.append(False)
+        if drawing.op_id is not None:
+            self._ops[drawing.op_id] = index
+        self._tile(index, drawing)
+        self._ends.append(end)
+        self._digests.append(digest)
+
+    def pop(self):
+        """
+        Remove the last drawing in the history, which cannot be part of the 
+        snapshot, returning it along with its canvas items.
+
+        Any tombstones after it are removed as well.
+        """
+        index = self._last_live()
+        if index < self.snapshot_length:
+            raise IndexError("pop from empty history")
+        drawing, items = self[index], self.items(index)
+        self._truncate(index)
+        return drawing, items
+
+    def remove(self, op_id):
+        """
+        Undo the drawing with the op id, leaving a tombstone in its place, 
+        and return its canvas items.
+
+        Nothing is removed from the snapshot, or if the drawing is unknown 
+        or already removed.
+        """
+        index = self._ops.get(op_id)
+        if (index is None or index < self.snapshot_length 
+                or self._removed[index]):
+            return []
+        self._removed[index] = True
+        self._removed_digest ^= self._op_digest(op_id)
+        self._untile(index)
+        items = self.items(index)
+        self.set_items(index, ())
+        return items
+
+    def restore(self, op_id, items = ()):
+        """
+        Redo the removed drawing with the op id, recording the canvas items 
+        it is drawn as again.
+        """
+        index = self._ops.get(op_id)
+        if index is not None and self._removed[index]:
+            self._removed[index] = False
+            self._removed_digest ^= self._op_digest(op_id)
+            self._tile(index, self[index])
+            self.set_items(index, items)
+
+    def _tile(self, index, drawing):
+        box = drawing.bounding_box()
+        if box is not None:
+            self.tiles.insert(index, box)
+            if drawing.op_id is not None and index >= self.snapshot_length:
+                self._undoable.insert(index, box)
+
+    def _untile(self, index):
+        self.tiles.discard(index)
+        self._undoable.discard(index)
+
+    def target(self, drawing):
+        """
+        Return the drawing that the undo or redo would apply to, or None if 
+        it would do nothing.
+
+        An undo without an op id applies to the last drawing.
+        """
+        if drawing.op_id is None:
+            index = (self._last_live() 
+                        if drawing.shape is DrawingType.UNDO else -1)
+            return self[index] if index >= self.snapshot_length else None
+        elif drawing.shape is DrawingType.UNDO:
+            return self.live(drawing.op_id)
+        index = self._ops.get(drawing.op_id)
+        return (self[index] if index is not None and self._removed[index] 
+                    else None)
+
+    def live(self, op_id):
+        """
+        Return the drawing with the op id if it can still be undone, or None 
+        if it is unknown, removed, or part of the snapshot.
+        """
+        index = self._ops.get(op_id)
+        if (index is None or index < self.snapshot_length 
+                or self._removed[index]):
+            return None
+        return self[index]
+
+    def past_snapshot(self, op_id):
+        """
+        Return whether the drawing with the op id is still in the history 
+        and past the snapshot, so it can be undone or redone.
+        """
+        index = self._ops.get(op_id)
+        return index is not None and index >= self.snapshot_length
+
+    def undoable_in(self, box):
+        """
+        Return the op ids of the drawings that can still be undone with 
+        bounding boxes intersecting the box, latest first.
+        """
+        return [(self._authors[index], self._seqs[index]) for index 
+                    in sorted(self._undoable.query(box), reverse = True)]
+
+    def text_indices(self):
+        """
+        Return the indices of the text drawings, in order.
+        """
+        return sorted(self._texts)
+
+    def position(self, op_id):
+        """
+        Return the index of the drawing with the op id.
+        """
+        return self._ops[op_id]
+
+    def items(self, index):
+        """
+        Return the canvas items the drawing at the index was drawn as.
+        """
+        if index < 0:
+            index += len(self._shapes)
+        return list(self._items.get(index, ()))
+
+    def set_items(self, index, items):
+        """
+        Replace the canvas items of the drawing at the index.
+        """
+        if items:
+            if index not in self._items:
+                insort(self._drawn, index)
+            self._items[index] = tuple(items)
+        elif self._items.pop(index, None) is not None:
+            del self._drawn[bisect_left(self._drawn, index)]
+
+    def next_drawn(self, index):
+        """
+        Return the index of the first drawing after the index that has 
+        canvas items, or None if there is none.
+        """
+        position = bisect_right(self._drawn, index)
+        return self._drawn[position] if position < len(self._drawn) else None
+
+    @property
+    def undoable(self):
+        return self._last_live() >= self.snapshot_length
+
+    def _last_live(self):
+        """
+        Return the index of the last drawing that has not been removed, or 
+        -1 if there is none.
+        """
+        index = len(self._shapes) - 1
+        while index >= 0 and self._removed[index]:
+            index -= 1
+        return index
+
+    def compact(self, horizon):
+        """
+        Fold the drawings older than the last horizon drawings into the 
+        snapshot, joining up the strokes that continue one another.
+
+        Only the drawings past the current snapshot are looked at, and the 
+        last snapshot drawing can still be extended by them.  Every drawing 
+        keeps its count and digest, a joined one those of its last part, 
+        and the removed drawings dropped stay in the removed digest.
+
+        A drawn stroke is only joined to one that is drawn as well, or its 
+        items would cover part of the joined drawing and the rest would 
+        never be drawn.
+        """
+        end = len(self._shapes) - horizon
+        if end <= self.snapshot_length:
+            return
+
+        start = max(self.snapshot_length - 1, 0)
+        compacted = []
+        for index in range(start, end):
+            if self._removed[index]:    # can no longer be redone
+                continue
+            record = self._record(index)
+            if (compacted and self._continues(compacted[-1][0], record[0])
+                    and bool(compacted[-1][1]) == bool(record[1])):
+                drawing, items, _, _ = compacted[-1]
+                drawing.coords.extend(record[0].coords[2:])
+                compacted[-1] = (drawing, items + record[1]) + record[2:]
+            else:
+                compacted.append(record)
+        tail = [(self._record(index), self._removed[index]) 
+                    for index in range(end, len(self._shapes))]
+
+        removed_digest = self._removed_digest
+        self._truncate(start)
+        self._removed_digest = removed_digest
+        self.snapshot_length = start + len(compacted)
+        for record in compacted:
+            self._append(*record)
+        for record, removed in tail:
+            self._append(*record)
+            if removed:
+                self._removed[-1] = True
+                self._untile(len(self._shapes) - 1)
+
+    def _record(self, index):
+        return (self[index], self.items(index), self._ends[index], 
+                self._digests[index])
+
+    def _continues(self, drawing, other):
+        """
+        Return whether the other drawing is a stroke continuing on from the 
+        end of the drawing in the same style.
+        """
+        return (DrawingType.is_stroke(drawing.shape)
+                and other.shape is drawing.shape
+                and other.thickness == drawing.thickness
+                and other.color == drawing.color
+                and other.coords[:2] == drawing.coords[-2:]
+                and (len(drawing.coords) + len(other.coords) 
+                        <= 2 * self.MAX_JOINED_POINTS))
+
+    def _truncate(self, index):
+        """
+        Remove the drawings from the index onwards.
+        """
+        del self._shapes[index:]
+        del self._thicknesses[index:]
+        del self._colors[index:]
+        del self._coords[self._coord_starts[index]:]
+        del self._coord_starts[index + 1:]
+        for i in range(index, len(self._authors)):
+            self._untile(i)
+            if self._authors[i]:
+                op_id = self._authors[i], self._seqs[i]
+                self._ops.pop(op_id, None)
+                if self._removed[i]:
+                    self._removed_digest ^= self._op_digest(op_id)
+        del self._authors[index:]
+        del self._seqs[index:]
+        del self._removed[index:]
+        del self._ends[index:]
+        del self._digests[index:]
+        del self._drawn[bisect_left(self._drawn, index):]
+        for table in (self._texts, self._color_names, self._items):
+            for key in [key for key in table if key >= index]:
+                del table[key]
+        self.snapshot_length = min(self.snapshot_length, index)
+
+    def drawings_from(self, start):
+        """
+        Yield the drawings from the index onwards, skipping the ones that 
+        have been removed.
+        """
+        for index in range(start, len(self._shapes)):
+            if not self._removed[index]:
+                yield self[index]
+
+    def sync_token(self):
+        """
+        Return the count of drawings appended to the history and its digest, 
+        with the digest as a signed value so it fits in a drawing's coords.
+        """
+        if not self._ends:
+            return 0, 0
+        return self._ends[-1], self._signed(self._digests[-1])
+
+    def appended_before(self, index):
+        """
+        Return the count of drawings appended before the drawing at the 
+        index, which compacting leaves alone.
+        """
+        return self._ends[index - 1] if index > 0 else 0
+
+    def index_past(self, count):
+        """
+        Return the index just past the drawing that the count of drawings 
+        appended ends in, taking a drawing joined across it as before it.
+        """
+        if count <= 0:
+            return 0
+        return min(bisect_left(self._ends, count) + 1, len(self._ends))
+
+    def removed_digest(self):
+        """
+        Return the digest of the op ids of the removed drawings, signed like 
+        the sync token's.
+        """
+        return self._signed(self._removed_digest)
+
+    def _removed_digest_to(self, length):
+        """
+        Return the removed digest leaving out the drawings appended after 
+        the first length of them.
+        """
+        digest = self._removed_digest
+        for index in range(bisect_right(self._ends, length), 
+                            len(self._shapes)):
+            if self._removed[index]:
+                digest ^= self._op_digest((self._authors[index], 
+                                            self._seqs[index]))
+        return digest
+
+    @staticmethod
+    def _op_digest(op_id):
+        return crc32(pack("II", *op_id))
+
+    def sync_start(self, length, digest, removed = None):
+        """
+        Return the index to send another history from, given its sync token 
+        and, if it sent one, its removed digest.
+
+        That is just past the drawing its count and digest end at when it 
+        is a prefix of this history that has had the same drawings undone, 
+        or 0 when the histories have diverged or it is empty and everything 
+        is sent.
+        """
+        index = bisect_left(self._ends, length)
+        if (length > 0 and index < len(self._ends) 
+                and self._ends[index] == length
+                and self._digests[index] == digest & 0xffffffff
+                and (removed is None or self._removed_digest_to(length) 
+                                            == removed & 0xffffffff)):
+            return index + 1
+        return 0
+
+    def sync_reply(self, sync):
+        """
+        Yield the drawings that bring the history the sync came from up to 
+        date with this one, starting with a clear if all of it is sent.
+
+        A removed drawing is sent followed by an undo of it, so the other 
+        history counts it the same and can still redo it.
+
+        The joined drawings of the snapshot do not add up to the same count 
+        and digest as the drawings they were joined from, so if the sync 
+        asks for them, a position marker follows the snapshot for the other 
+        history to take this one's count and digests from.  Such a sync 
+        also carries its removed digest, checked along with its token.
+        """
+        markers = sync.coords[3] == self.SYNC_REQUEST
+        start = self.sync_start(sync.coords[0], sync.coords[1], 
+                                sync.coords[2] if markers else None)
+        if start == 0:
+            yield Drawing(DrawingType.CLEAR, 0, "", (0, 0, 0, 0))
+        for index in range(start, len(self._shapes)):
+            drawing = self[index]
+            yield drawing
+            if self._removed[index]:
+                yield Drawing(DrawingType.UNDO, 0, "", (0, 0, 0, 0), 
+                                op_id = drawing.op_id)
+            if markers and index == self.snapshot_length - 1:
+                end = self._ends[index]
+                removed = self._removed_digest_to(end)
+                yield Drawing(DrawingType.SYNC, 0, "", 
+                                (end, self._signed(self._digests[index]), 
+                                    self._signed(removed), self.SYNC_POSITION))
+
+    def set_position(self, length, digest, removed):
+        """
+        Take the count and digest from a position marker as those of the 
+        last drawing, as it is the last of the snapshot it followed, and 
+        the removed digest as this history's.
+        """
+        if self._ends:
+            self._ends[-1] = length
+            self._digests[-1] = digest & 0xffffffff
+        self._removed_digest = removed & 0xffffffff
+
+    @staticmethod
+    def _signed(digest):
+        return unpack("i", pack("I", digest))[0]
+
+    def __getitem__(self, index):
+        length = len(self._shapes)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("history index out of range")
+
+        coords = self._coords[self._coord_starts[index]:
+                                self._coord_starts[index + 1]]
+        return Drawing(DrawingType(self._shapes[index]),
+                        self._thicknesses[index],
+                        self._unpack_color(index), coords.tolist(),
+                        self._texts.get(index), 
+                        op_id = (self._authors[index], self._seqs[index]) 
+                                    if self._authors[index] else None)
+
+    def __iter__(self):
+        return self.drawings_from(0)
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def _pack_color(self, index, color):
+        """
+        Return the color as a packed RGB integer, falling back to the color
+        name table for anything that would not round trip exactly.
+        """
+        try:
+            value = int(color[1:], 16)
+            if self.COLOR_FORMAT.format(value) == color:
+                return value
+        except ValueError:
+            pass
+        self._color_names[index] = color
+        return self.NAMED_COLOR
+
+    def _unpack_color(self, index):
+        value = self._colors[index]
+        if value == self.NAMED_COLOR:
+            return self._color_names[index]
+        return self.COLOR_FORMAT.format(value)
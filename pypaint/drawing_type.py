@@ -17,9 +17,14 @@ class DrawingType(Enum):
     CLEAR = auto()
     UNDO = auto()
     SYNC = auto()
+    REDO = auto()
+
+    # tools, acting on the drawings already made without being sent
+    OBJECT_ERASER = auto()
+    SELECT = auto()
 
     def __str__(self):
-        return self.name.capitalize()
+        return self.name.replace("_", " ").capitalize()
 
     @staticmethod
     def is_draggable(drawing_type):
@@ -32,7 +37,24 @@ class DrawingType(Enum):
                                 DrawingType.OVAL, DrawingType.LINE, 
                                 DrawingType.ERASER} 
 
+    @staticmethod
+    def is_stroke(drawing_type):
+        return drawing_type in {DrawingType.PEN, DrawingType.ERASER}
+
     @staticmethod
     def has_no_location(drawing_type):
         return drawing_type in {DrawingType.CLEAR, DrawingType.UNDO, 
-                                DrawingType.SYNC}
+                                DrawingType.SYNC, DrawingType.REDO}
+
+    @staticmethod
+    def is_recorded(drawing_type):
+        """
+        Return whether drawings of the type are kept in the history.
+        """
+        return drawing_type in {DrawingType.PEN, DrawingType.RECT, 
+                                DrawingType.OVAL, DrawingType.LINE, 
+                                DrawingType.ERASER, DrawingType.TEXT}
+
+    @staticmethod
+    def is_tool(drawing_type):
+        return drawing_type in {DrawingType.OBJECT_ERASER, DrawingType.SELECT}
@@ -0,0 +1,92 @@
+"""
+Convert .pypaint files to PNG and SVG images without a display, many files
+at a time across a pool of processes.
+
+Run with `python -m pypaint.export FILE...`.
+"""
+from argparse           import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from logging            import getLogger
+from os                 import cpu_count
+from pathlib            import Path
+from sys                import exit
+
+from .drawing_file      import DrawingFile
+from .headless_renderer import HeadlessRenderer
+
+
+FORMATS = ("png", "svg")
+
+
+def export_file(path, formats, output_dir = None):
+    """
+    Render the drawing file into an image of each format next to it, or in
+    the output directory, returning the paths written.
+    """
+    path = Path(path)
+    with open(path, "rb") as cur_file:
+        drawings = HeadlessRenderer.replay(DrawingFile.read(cur_file))
+
+    outputs = []
+    stem = Path(output_dir or path.parent) / path.stem
+    if "png" in formats:
+        outputs.append(stem.with_suffix(".png"))
+        outputs[-1].write_bytes(
+                HeadlessRenderer.render_raster(drawings).encode_png())
+    if "svg" in formats:
+        outputs.append(stem.with_suffix(".svg"))
+        outputs[-1].write_text(HeadlessRenderer.render_svg(drawings))
+    return outputs
+
+def _export_job(job):
+    """
+    Export one file in a worker, returning the error instead of raising it
+    so one bad file does not stop the batch, whatever is wrong with it.
+    """
+    path, formats, output_dir = job
+    try:
+        return path, export_file(path, formats, output_dir), None
+    except Exception as err:
+        return path, [], err
+
+def export_files(paths, formats = FORMATS, output_dir = None,
+                    workers = None):
+    """
+    Export the files in parallel, yielding the path, outputs, and error of
+    each as it finishes, in order.
+    """
+    jobs = [(path, formats, output_dir) for path in paths]
+    workers = min(workers or cpu_count() or 1, max(len(jobs), 1))
+    with ProcessPoolExecutor(workers) as executor:
+        yield from executor.map(_export_job, jobs,
+                                chunksize = max(len(jobs) // (workers * 4),
+                                                1))
+
+def main():
+    parser = ArgumentParser(description = "Render .pypaint files to images "
+                                            "without a display.")
+    parser.add_argument("files", nargs = "+", help = "files to convert")
+    parser.add_argument("--format", choices = FORMATS + ("all",),
+                        default = "all", help = "image format to write")
+    parser.add_argument("--output-dir",
+                        help = "directory the images are written to, the "
+                                "one of each file by default")
+    parser.add_argument("--workers", type = int,
+                        help = "processes to convert with, one per CPU by "
+                                "default")
+    args = parser.parse_args()
+
+    formats = FORMATS if args.format == "all" else (args.format,)
+    failed = 0
+    for path, outputs, err in export_files(args.files, formats,
+                                            args.output_dir, args.workers):
+        if err is None:
+            print("{} -> {}".format(path, ", ".join(map(str, outputs))))
+        else:
+            getLogger(__name__).error("Error exporting {}: {}".format(path,
+                                                                        err))
+            failed += 1
+    exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
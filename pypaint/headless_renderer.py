@@ -0,0 +1,316 @@
+from math             import ceil, hypot, sqrt
+from struct           import pack
+from xml.sax.saxutils import escape
+from zlib             import compress, crc32
+
+from .drawing         import Drawing
+from .drawing_history import DrawingHistory
+from .drawing_type    import DrawingType
+
+
+class Framebuffer:
+    """
+    RGB raster of part of the canvas held in one bytearray, with the
+    shapes filled in a scanline span at a time.
+
+    Coordinates are canvas coordinates, the raster covering the width by
+    height pixels from its x, y corner, and anything outside of it is
+    clipped.  Coordinates are pixel centers, as they are in Tk, and a
+    pixel is filled when its center is inside the shape, counting the top
+    and left edges but not the bottom and right ones so shapes that share
+    an edge do not overlap.
+    """
+
+    def __init__(self, width, height, background, x = 0, y = 0):
+        self.width = width
+        self.height = height
+        self.x = x
+        self.y = y
+        self.pixels = bytearray(background * (width * height))
+
+    def pixel(self, x, y):
+        """
+        Return the RGB bytes of the pixel at the canvas position.
+        """
+        offset = ((y - self.y) * self.width + x - self.x) * 3
+        return bytes(self.pixels[offset:offset + 3])
+
+    def fill_span(self, row, x1, x2, rgb):
+        """
+        Fill the pixels of the canvas row with their centers between x1 and
+        x2.
+        """
+        y = row - self.y
+        if not 0 <= y < self.height:
+            return
+        start = max(ceil(x1) - self.x, 0)
+        end = min(ceil(x2) - self.x, self.width)
+        if start < end:
+            offset = y * self.width * 3
+            self.pixels[offset + start * 3:offset + end * 3] = rgb * (end
+                                                                    - start)
+
+    def _rows(self, y1, y2):
+        """
+        Return the range of canvas rows with their centers between y1 and
+        y2 that are inside the raster.
+        """
+        return range(max(ceil(y1), self.y),
+                        min(ceil(y2), self.y + self.height))
+
+    def fill_box(self, x1, y1, x2, y2, rgb):
+        for row in self._rows(y1, y2):
+            self.fill_span(row, x1, x2, rgb)
+
+    def fill_disc(self, cx, cy, r, rgb):
+        for row in self._rows(cy - r, cy + r):
+            dy = row - cy
+            half = sqrt(max(r * r - dy * dy, 0))
+            self.fill_span(row, cx - half, cx + half, rgb)
+
+    def fill_polygon(self, points, rgb):
+        """
+        Fill the polygon through the flat list of points, using the even-odd
+        rule.
+        """
+        xs, ys = points[0::2], points[1::2]
+        edges = [(xs[i - 1], ys[i - 1], xs[i], ys[i])
+                    for i in range(len(xs)) if ys[i - 1] != ys[i]]
+        for row in self._rows(min(ys), max(ys)):
+            crossings = sorted(x1 + (row - y1) * (x2 - x1) / (y2 - y1)
+                                for x1, y1, x2, y2 in edges
+                                    if min(y1, y2) <= row < max(y1, y2))
+            for left, right in zip(crossings[0::2], crossings[1::2]):
+                self.fill_span(row, left, right, rgb)
+
+    def stroke_line(self, coords, thickness, rgb):
+        """
+        Draw a line through the points with round caps and joins, as a
+        quadrilateral for each segment and a disc at each point.
+        """
+        r = max(thickness, 1) / 2
+        points = list(zip(coords[0::2], coords[1::2]))
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            length = hypot(x2 - x1, y2 - y1)
+            if length:
+                nx, ny = (y1 - y2) * r / length, (x2 - x1) * r / length
+                self.fill_polygon([x1 + nx, y1 + ny, x2 + nx, y2 + ny,
+                                    x2 - nx, y2 - ny, x1 - nx, y1 - ny], rgb)
+        for x, y in points:
+            self.fill_disc(x, y, r, rgb)
+
+    def stroke_rect(self, coords, thickness, rgb):
+        """
+        Draw the outline of the rectangle, centered on its edges.
+        """
+        x1, x2 = sorted(coords[0::2][:2])
+        y1, y2 = sorted(coords[1::2][:2])
+        r = max(thickness, 1) / 2
+        self.fill_box(x1 - r, y1 - r, x2 + r, y1 + r, rgb)
+        self.fill_box(x1 - r, y2 - r, x2 + r, y2 + r, rgb)
+        self.fill_box(x1 - r, y1 + r, x1 + r, y2 - r, rgb)
+        self.fill_box(x2 - r, y1 + r, x2 + r, y2 - r, rgb)
+
+    def stroke_oval(self, coords, thickness, rgb):
+        """
+        Draw the outline of the oval in the box, as the spans between an
+        outer and inner ellipse on each row.
+        """
+        x1, x2 = sorted(coords[0::2][:2])
+        y1, y2 = sorted(coords[1::2][:2])
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        r = max(thickness, 1) / 2
+        outer_x, outer_y = (x2 - x1) / 2 + r, (y2 - y1) / 2 + r
+        inner_x, inner_y = outer_x - 2 * r, outer_y - 2 * r
+        for row in self._rows(cy - outer_y, cy + outer_y):
+            dy = row - cy
+            outer = outer_x * sqrt(max(1 - (dy / outer_y) ** 2, 0))
+            if inner_x > 0 and inner_y > 0 and abs(dy) < inner_y:
+                inner = inner_x * sqrt(1 - (dy / inner_y) ** 2)
+                self.fill_span(row, cx - outer, cx - inner, rgb)
+                self.fill_span(row, cx + inner, cx + outer, rgb)
+            else:
+                self.fill_span(row, cx - outer, cx + outer, rgb)
+
+    def encode_png(self):
+        """
+        Return the raster as an 8 bit RGB PNG image.
+        """
+        stride = self.width * 3
+        raw = bytearray()
+        for offset in range(0, len(self.pixels), stride):
+            raw.append(0)       # no filter
+            raw += self.pixels[offset:offset + stride]
+        return (b"\x89PNG\r\n\x1a\n"
+                + self._png_chunk(b"IHDR", pack(">IIBBBBB", self.width,
+                                                    self.height, 8, 2, 0, 0,
+                                                    0))
+                + self._png_chunk(b"IDAT", compress(raw))
+                + self._png_chunk(b"IEND", b""))
+
+    def encode_ppm(self):
+        """
+        Return the raster as a binary PPM image, which Tk reads natively.
+        """
+        return (b"P6\n%d %d\n255\n" % (self.width, self.height)
+                + bytes(self.pixels))
+
+    @staticmethod
+    def _png_chunk(chunk_type, data):
+        return (pack(">I", len(data)) + chunk_type + data
+                + pack(">I", crc32(data, crc32(chunk_type))))
+
+
+class HeadlessRenderer:
+    """
+    Renders drawing histories without Tk, so saved drawings can be turned
+    into PNG or SVG images on a machine with no display.
+
+    The drawings are replayed the way the application applies them, so
+    undone and cleared drawings are left out.  Text is only drawn in SVG,
+    as there is no font to rasterize it with.
+    """
+
+    # match PaintCanvas, without depending on Tk
+    CANVAS_WIDTH = 800
+    CANVAS_HEIGHT = 600
+    BACKGROUND_COLOR = "#ffffff"
+
+    # the Tk color names that are likely to turn up in a history
+    NAMED_COLORS = {
+        "black" : "#000000", "white" : "#ffffff", "red" : "#ff0000",
+        "green" : "#00ff00", "blue" : "#0000ff", "yellow" : "#ffff00",
+        "cyan" : "#00ffff", "magenta" : "#ff00ff", "gray" : "#bebebe",
+        "grey" : "#bebebe", "orange" : "#ffa500", "purple" : "#a020f0",
+        "brown" : "#a52a2a", "pink" : "#ffc0cb"
+    }
+    DEFAULT_COLOR = "#000000"
+
+    @staticmethod
+    def replay(drawings):
+        """
+        Return the drawings left in the history after applying all of them.
+        """
+        history = DrawingHistory()
+        for drawing in drawings:
+            if drawing.preview:
+                continue
+            elif drawing.shape is DrawingType.UNDO:
+                if drawing.op_id is not None:
+                    history.remove(drawing.op_id)
+                elif history.undoable:
+                    history.pop()
+            elif drawing.shape is DrawingType.REDO:
+                if drawing.op_id is not None:
+                    history.restore(drawing.op_id)
+            elif drawing.shape is DrawingType.CLEAR:
+                history.clear()
+            elif DrawingType.is_recorded(drawing.shape):
+                history.append(drawing)
+        return list(history)
+
+    @staticmethod
+    def hex_color(color):
+        """
+        Return the color as "#rrggbb", falling back to the default for
+        colors that are not recognized.
+        """
+        color = HeadlessRenderer.NAMED_COLORS.get(color.lower(), color)
+        if len(color) == 4 and color.startswith("#"):     # "#rgb"
+            color = "#" + "".join(c * 2 for c in color[1:])
+        try:
+            if len(color) == 7 and color.startswith("#"):
+                int(color[1:], 16)
+                return color.lower()
+        except ValueError:
+            pass
+        return HeadlessRenderer.DEFAULT_COLOR
+
+    @staticmethod
+    def rgb(color):
+        return bytes.fromhex(HeadlessRenderer.hex_color(color)[1:])
+
+    @staticmethod
+    def render_raster(drawings, width = CANVAS_WIDTH, height = CANVAS_HEIGHT,
+                        x = 0, y = 0, scale = 1):
+        """
+        Return a framebuffer of the canvas region with the drawings, which
+        should already be replayed, drawn into it in order.
+
+        The drawings are scaled before they are drawn, with the region in
+        the scaled coordinates.
+        """
+        background = HeadlessRenderer.rgb(HeadlessRenderer.BACKGROUND_COLOR)
+        framebuffer = Framebuffer(width, height, background, x, y)
+        for drawing in drawings:
+            HeadlessRenderer.draw(framebuffer, drawing, scale)
+        return framebuffer
+
+    @staticmethod
+    def draw(framebuffer, drawing, scale = 1):
+        """
+        Draw the drawing into the framebuffer.
+        """
+        rgb = HeadlessRenderer.rgb(drawing.color)
+        coords = ([coord * scale for coord in drawing.coords] if scale != 1
+                    else drawing.coords)
+        thickness = drawing.thickness * scale
+        if drawing.shape in {DrawingType.PEN, DrawingType.LINE}:
+            framebuffer.stroke_line(coords, thickness, rgb)
+        elif drawing.shape is DrawingType.ERASER:
+            framebuffer.stroke_line(coords, thickness,
+                                    HeadlessRenderer.rgb(
+                                        HeadlessRenderer.BACKGROUND_COLOR))
+        elif drawing.shape is DrawingType.RECT:
+            framebuffer.stroke_rect(coords, thickness, rgb)
+        elif drawing.shape is DrawingType.OVAL:
+            framebuffer.stroke_oval(coords, thickness, rgb)
+
+    @staticmethod
+    def render_svg(drawings, width = CANVAS_WIDTH, height = CANVAS_HEIGHT):
+        """
+        Return an SVG document of the canvas with the drawings, which should
+        already be replayed.
+        """
+        lines = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0}" '
+                    'height="{1}" viewBox="0 0 {0} {1}">'.format(width,
+                                                                    height),
+                 '<rect width="100%" height="100%" fill="{}"/>'.format(
+                                            HeadlessRenderer.BACKGROUND_COLOR)]
+        for drawing in drawings:
+            element = HeadlessRenderer._svg_element(drawing)
+            if element is not None:
+                lines.append(element)
+        lines.append("</svg>")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _svg_element(drawing):
+        color = HeadlessRenderer.hex_color(drawing.color)
+        stroke = 'fill="none" stroke="{}" stroke-width="{}"'.format(
+                                                color, drawing.thickness)
+        coords = drawing.coords
+        if DrawingType.is_stroke(drawing.shape) or (drawing.shape
+                                                    is DrawingType.LINE):
+            if drawing.shape is DrawingType.ERASER:
+                stroke = stroke.replace(color,
+                                        HeadlessRenderer.BACKGROUND_COLOR)
+            return ('<polyline points="{}" {} stroke-linecap="round" '
+                    'stroke-linejoin="round"/>'.format(
+                                        " ".join(map(str, coords)), stroke))
+        elif drawing.shape in {DrawingType.RECT, DrawingType.OVAL}:
+            x1, x2 = sorted(coords[0::2][:2])
+            y1, y2 = sorted(coords[1::2][:2])
+            if drawing.shape is DrawingType.RECT:
+                return ('<rect x="{}" y="{}" width="{}" height="{}" '
+                        '{}/>'.format(x1, y1, x2 - x1, y2 - y1, stroke))
+            return ('<ellipse cx="{}" cy="{}" rx="{}" ry="{}" {}/>'.format(
+                                (x1 + x2) / 2, (y1 + y2) / 2, (x2 - x1) / 2,
+                                (y2 - y1) / 2, stroke))
+        elif drawing.shape is DrawingType.TEXT:
+            size = Drawing.font_size(drawing.thickness)
+            return ('<text x="{}" y="{}" font-family="Arial" font-size="{}pt" '
+                    'dominant-baseline="central" fill="{}">{}</text>'.format(
+                                    coords[0], coords[1], size, color,
+                                    escape(drawing.text or "")))
+        return None
@@ -0,0 +1,160 @@
+from math           import frexp
+from threading      import Lock
+from time           import monotonic, perf_counter
+
+
+class Histogram:
+    """
+    Summary of observed values, keeping their count, total and extremes
+    along with counts in power of two buckets, enough for percentiles
+    within a factor of two without storing the values.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    ZERO_EXPONENT = -1100   # bucket of values of zero or less
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.buckets = {}       # exponent -> count of values below 2**exp
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        exponent = frexp(value)[1] if value > 0 else self.ZERO_EXPONENT
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def percentile(self, fraction):
+        """
+        Return the upper bound of the bucket holding the value at the
+        fraction of the way through the observed values, capped at the
+        largest value, or None if there are none.
+        """
+        if not self.count:
+            return None
+        remaining = fraction * self.count
+        for exponent in sorted(self.buckets):
+            remaining -= self.buckets[exponent]
+            if remaining <= 0:
+                break
+        if exponent == self.ZERO_EXPONENT:
+            return 0
+        return min(2 ** exponent, self.max)
+
+    def summary(self):
+        return {
+            "count" : self.count,
+            "mean" : self.total / self.count if self.count else None,
+            "min" : self.min,
+            "max" : self.max,
+            "p50" : self.percentile(0.5),
+            "p90" : self.percentile(0.9),
+            "p99" : self.percentile(0.99)
+            }
+
+
+class Metrics:
+    """
+    Opt-in counters and histograms for the hot paths, such as queue depths,
+    draw times, and the bytes encoded and decoded.
+
+    Recording is off until enabled, and every call site checks enabled
+    before measuring anything, so instrumentation costs one attribute
+    lookup while it is off.
+
+    Timers measure how long an object takes to get from one place to
+    another, such as a drawing from being queued to send to being encoded,
+    and hold onto the object in between so its id cannot be reused.
+
+    The GUI, sender and connection threads all record into it, so every
+    change and snapshot is made holding a lock.
+    """
+
+    MAX_TIMERS = 10000      # running timers, the oldest are dropped past it
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.timers = {}    # (id of object, name) -> (object, start time)
+            self.start_time = self.snapshot_time = monotonic()
+            self.snapshot_counters = {}
+
+    def enable(self):
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        with self.lock:
+            self.timers.clear()
+
+    def count(self, name, amount = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self.lock:
+            self._observe(name, value)
+
+    def _observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def start_timer(self, key, name):
+        """
+        Start timing the object for the named histogram.
+        """
+        with self.lock:
+            if len(self.timers) >= self.MAX_TIMERS:
+                del self.timers[next(iter(self.timers))]
+            self.timers[id(key), name] = key, perf_counter()
+
+    def stop_timer(self, key, name):
+        """
+        Observe the milliseconds since the object's timer for the named
+        histogram was started into it, if it has one.
+        """
+        with self.lock:
+            timer = self.timers.pop((id(key), name), None)
+            if timer is not None and timer[0] is key:
+                self._observe(name, 1000 * (perf_counter() - timer[1]))
+
+    def snapshot(self):
+        """
+        Return the counters, with their rates per second since the last
+        snapshot, and the summaries of the histograms, as a JSON compatible
+        dict.
+        """
+        with self.lock:
+            now = monotonic()
+            seconds = max(now - self.snapshot_time, 1e-9)
+            rates = {name : (total - self.snapshot_counters.get(name, 0))
+                                / seconds
+                        for name, total in self.counters.items()}
+            self.snapshot_time = now
+            self.snapshot_counters = dict(self.counters)
+            return {
+                "uptime" : now - self.start_time,
+                "interval" : seconds,
+                "counters" : dict(sorted(self.counters.items())),
+                "rates" : dict(sorted(rates.items())),
+                "histograms" : {name : histogram.summary() for name, histogram
+                                    in sorted(self.histograms.items())}
+                }
+
+
+# shared by the whole application, like a logger
+METRICS = Metrics()
@@ -1,70 +1,127 @@
-from time               import sleep
 from tkinter            import Canvas, ALL, ROUND, W
 
+from .drawing           import Drawing
+
 
 class PaintCanvas(Canvas):
     """
     Specialized canvas for drawing, holds logic for different PyPaint 
     drawings and binds the correct events to the canvas.
+
+    The canvas can be scrolled anywhere and zoomed, drawings are given in 
+    drawing coordinates and scaled by the zoom as they are drawn, and the 
+    events passed on to the controller are in drawing coordinates too.
     """
     
     CANVAS_HEIGHT = 600
     CANVAS_WIDTH = 800
     CANVAS_BACKGROUND_COLOR = "#ffffff"
 
-    PING_DELAY = 0.1
-    NUM_PINGS = 3
-    PING_RADIUS_FACTOR = 10
+    PING_DELAY = 100    # milliseconds each circle is shown
+
+    SELECTION_COLOR = "#3399ff"
+    SELECTION_DASH = (4, 2)
 
-    FONT_BASE_SIZE = 10
+    # no scroll units, so the view is not snapped to them and can be 
+    # scrolled by any number of pixels
+    SCROLL_INCREMENT = 0
 
     def __init__(self, controller, root, application_state):
         super().__init__(root, width = self.CANVAS_WIDTH, 
                             height = self.CANVAS_HEIGHT,
-                            background = self.CANVAS_BACKGROUND_COLOR)
+                            background = self.CANVAS_BACKGROUND_COLOR,
+                            confine = False, 
+                            xscrollincrement = self.SCROLL_INCREMENT,
+                            yscrollincrement = self.SCROLL_INCREMENT)
 
         self.controller = controller
         self.application_state = application_state
+        self.zoom = 1
 
         for event_type in ["<Button-1>", "<ButtonRelease-1>", "<B1-Motion>"]:
-            self.bind(event_type, self.controller.handle_event)
+            self.bind(event_type, self._forward_event)
+
+    def _forward_event(self, event):
+        """
+        Pass the event on to the controller with its position in drawing 
+        coordinates.
+        """
+        event.x, event.y = self.to_drawing(event.x, event.y)
+        self.controller.handle_event(event)
+
+    def to_drawing(self, x, y):
+        """
+        Return the drawing coordinates of the point in the window.
+        """
+        return (round(self.canvasx(x) / self.zoom), 
+                round(self.canvasy(y) / self.zoom))
+
+    def visible_box(self):
+        """
+        Return the region of the drawing shown in the window.
+        """
+        return (self.canvasx(0) / self.zoom, self.canvasy(0) / self.zoom,
+                self.canvasx(self.winfo_width()) / self.zoom, 
+                self.canvasy(self.winfo_height()) / self.zoom)
+
+    def scroll_by(self, dx, dy):
+        """
+        Scroll the view by the number of canvas pixels.
+        """
+        self.scan_mark(0, 0)
+        self.scan_dragto(-round(dx), -round(dy), gain = 1)
+
+    def _scaled(self, coords):
+        return [coord * self.zoom for coord in coords]
+
+    def move_item(self, item_id, coords):
+        """
+        Move the item to the drawing coordinates.
+        """
+        self.coords(item_id, *self._scaled(coords))
 
     def draw_rect(self, coords, thickness, color):
         """
         Draw a rectangle using the opposite corner pairs specified in coords.
         """
-        return self.create_rectangle(*coords, width = thickness, 
-                                            outline = color)
+        return self.create_rectangle(*self._scaled(coords), 
+                                        width = thickness * self.zoom, 
+                                        outline = color)
 
     def draw_oval(self, coords, thickness, color):
         """
         Draw an oval using the corners specificed in coords.
         """
-        return self.create_oval(*coords, width = thickness, 
+        return self.create_oval(*self._scaled(coords), 
+                                        width = thickness * self.zoom, 
                                         outline = color)
 
     def draw_line(self, coords, thickness, color):
         """
-        Draw a line with the start/end pairs specified in coords.
+        Draw a line through the points specified in coords.
         """
-        return self.create_line(*coords, width = thickness, 
-                                        capstyle = ROUND, fill = color)
+        return self.create_line(*self._scaled(coords), 
+                                        width = thickness * self.zoom, 
+                                        capstyle = ROUND, joinstyle = ROUND,
+                                        fill = color)
 
     def draw_eraser_line(self, coords, thickness, color):
         """
         Draw a line that is white, to "erase" previous drawings.
         """
-        return self.create_line(*coords, width = thickness,
-                                        capstyle = ROUND, 
+        return self.create_line(*self._scaled(coords), 
+                                        width = thickness * self.zoom, 
+                                        capstyle = ROUND, joinstyle = ROUND,
                                         fill = self.CANVAS_BACKGROUND_COLOR)
 
-    def undo(self):
+    def draw_selection(self, box):
         """
-        Clear the last drawing available from the history.
+        Draw a dashed box around a selected drawing, which is not part of 
+        the history.
         """
-        if self.application_state.id_available:
-            drawing_id = self.application_state.get_last_drawing_id()
-            self.delete(drawing_id)
+        return self.create_rectangle(*self._scaled(box), 
+                                        outline = self.SELECTION_COLOR, 
+                                        dash = self.SELECTION_DASH)
 
     def clear_canvas(self):
         """
@@ -74,24 +131,35 @@ class PaintCanvas(Canvas):
 
     def draw_ping(self, coords, thickness, color):
         """
-        Draw increasingly large circles around the center point.
+        Start an animation of increasingly large circles around the center 
+        point, without blocking other drawing while it runs.
+
+        The circles are not part of the history, so no item is returned for 
+        it.
+        """
+        self._animate_ping(coords[0], coords[1], thickness, color, 1, None)
+
+    def _animate_ping(self, x, y, thickness, color, ping, last_id):
+        """
+        Replace the last circle with the next larger one, scheduling the 
+        following step until all of the circles have been shown.
         """
-        x, y = coords[0], coords[1]
-        for i in range(1, self.NUM_PINGS + 1):
-            r = i * self.PING_RADIUS_FACTOR
+        if last_id is not None:
+            self.delete(last_id)
+        if ping <= Drawing.PING_COUNT:
+            r = ping * Drawing.PING_RADIUS_STEP
             circle_coords = [x - r, y - r, x + r, y + r]
-            drawing_id = self.draw_oval(circle_coords, thickness, color)
-            self.application_state.add_last_drawing_id(drawing_id)
-            self.controller.update()  # force the canvas to visually update
-            sleep(self.PING_DELAY)
-            self.undo()
+            circle_id = self.draw_oval(circle_coords, thickness, color)
+            self.after(self.PING_DELAY, self._animate_ping, x, y, thickness, 
+                        color, ping + 1, circle_id)
 
     def draw_text(self, coords, thickness, color, drawing_text):
         """
         Render text at the first point.
         """
-        font_size = self.FONT_BASE_SIZE + (thickness - 1) * 2
-        return self.create_text(coords[0], coords[1], anchor = W,
+        font_size = max(round(Drawing.font_size(thickness) * self.zoom), 1)
+        x, y = self._scaled(coords[:2])
+        return self.create_text(x, y, anchor = W,
                                     font = "Arial {}".format(font_size),
                                     text = drawing_text,
                                     fill = color)
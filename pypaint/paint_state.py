@@ -1,14 +1,25 @@
-from queue              import Queue
-
-from chadlib.collection import Stack
+from queue              import Full, Queue
+from random             import randrange
 
+from .drawing_history   import DrawingHistory
 from .drawing_type      import DrawingType
+from .metrics           import METRICS
 
 
 class PaintState:
 
     THICKNESS_MIN = 1
     THICKNESS_MAX = 10
+
+    # drawings that stay undoable, and how many more are added before the 
+    # older ones are compacted into the history snapshot
+    UNDO_HORIZON = 1000
+    COMPACTION_INTERVAL = 1000
+
+    # writes waiting for the connection before the sender holds back, and 
+    # drawings waiting for the sender before more are dropped
+    WRITE_QUEUE_LIMIT = 8
+    SEND_QUEUE_LIMIT = 4096
     
     def __init__(self):
         self.current_type = DrawingType.PEN
@@ -16,28 +27,157 @@ class PaintState:
         self.current_color = "#000000"      # default to black
 
         self.start_pos = None
-        self.drawing_ids = Stack()
-        self.drawing_history = []
+        self.stroke_coords = []
+        self.stroke_sent = 0
+        self.stroke_pieces = 0
+        self.preview_sent_time = None
+        self.drawing_history = DrawingHistory()
+        self.erased = set()     # op ids erased during the current drag
+        self.selection = []     # op ids picked by the select tool
+
+        # this application's drawings are identified by (author, seq) op 
+        # ids, and undone or redone by them, an action at a time
+        self.author_id = randrange(1, 1 << 31)
+        self.last_seq = 0
+        self.undo_stack = []    # (erase, list of op ids), one per action
+        self.redo_stack = []
 
-        self.send_queue = Queue()
+        self.send_queue = Queue(self.SEND_QUEUE_LIMIT)  # drawings to send
+        self.send_sink = None   # takes them instead, see set_send_sink
+        self.write_queue = Queue(self.WRITE_QUEUE_LIMIT)  # bytes to write
         self.receive_queue = Queue()
         self.draw_queue = Queue()
 
         self.draw_active = True
         self.send_active = False
-        self.dragging = False
+        self.send_behind = False    # drawings to send have been dropped
 
     def clear_drawing_state(self):
         self.start_pos = None
-        self.dragging = False
+        self.stroke_coords = []
+        self.stroke_sent = 0
+        self.stroke_pieces = 0
+        self.preview_sent_time = None
+        self.erased = set()
 
-    def add_to_send_queue(self, data):
-        if self.send_active:
-            self.send_queue.put(data)
+    def add_to_send_queue(self, drawing):
+        """
+        Queue the drawing to send while connected.
+
+        This never waits, as it is called from the GUI thread.  The send 
+        queue is bounded, and only fills once the sender is holding back 
+        all it can for a peer that has stopped reading, so a drawing that 
+        does not fit is dropped and the peer marked as behind, to be sent 
+        the whole history again once it reads.  Previews are dropped 
+        without marking it, as a newer one is on its way, apart from the 
+        clear that removes them.
+
+        With a send sink set, the drawing is handed straight to it.
+        """
+        if not self.send_active:
+            return
+        if METRICS.enabled:
+            METRICS.start_timer(drawing, "send_wait_ms")
+        if self.send_sink is not None:
+            self.send_sink.send(drawing)
+            return
+        self._put_to_send(drawing, not drawing.preview 
+                                    or drawing.shape is DrawingType.CLEAR)
+
+    def add_all_to_send_queue(self, drawings):
+        """
+        Queue the drawings to send while connected as a single item, so a 
+        sync reply takes one place in the send queue however long it is.
+        """
+        if not self.send_active:
+            return
+        drawings = list(drawings)
+        if METRICS.enabled:
+            for drawing in drawings:
+                METRICS.start_timer(drawing, "send_wait_ms")
+        if self.send_sink is not None:
+            for drawing in drawings:
+                self.send_sink.send(drawing)
+            return
+        self._put_to_send(drawings, True)
+
+    def _put_to_send(self, item, needed):
+        try:
+            self.send_queue.put_nowait(item)
+        except Full:
+            if needed:
+                self.send_behind = True
+
+    def set_send_sink(self, sink):
+        """
+        Hand the drawings to send to the sink's send method rather than 
+        queueing them for the sender thread, for a connection that batches 
+        them itself on the GUI thread.
+        """
+        self.send_sink = sink
+
+    @property
+    def undo_available(self):
+        return bool(self.undo_stack)
 
     @property
-    def id_available(self):
-        return not self.drawing_ids.is_empty
+    def redo_available(self):
+        return bool(self.redo_stack)
+
+    def next_op_id(self):
+        self.last_seq += 1
+        return (self.author_id, self.last_seq)
+
+    def record_op(self, op_id, join = False):
+        """
+        Record the op id of a new drawing by this application as an action 
+        that can be undone, or as part of the last action if joined.
+
+        A new action cannot come after actions that were undone, so they 
+        can no longer be redone.
+        """
+        self._record(False, op_id, join)
+
+    def record_erase(self, op_id, join = False):
+        """
+        Record the op id of a drawing this application erased, whoever drew 
+        it, as an action that can be undone by redoing the drawing, or as 
+        part of the last action if joined and that was an erase too.
+        """
+        self._record(True, op_id, join)
+
+    def _record(self, erase, op_id, join):
+        if join and self.undo_stack and self.undo_stack[-1][0] == erase:
+            self.undo_stack[-1][1].append(op_id)
+        else:
+            self.undo_stack.append((erase, [op_id]))
+            if len(self.undo_stack) > self.UNDO_HORIZON:
+                del self.undo_stack[0]
+        self.redo_stack.clear()
+
+    def pop_undo(self):
+        """
+        Return whether the last action to undo was an erase along with its 
+        op ids, moving it onto the redo stack, or no op ids if there is 
+        none.
+        """
+        if not self.undo_stack:
+            return False, []
+        action = self.undo_stack.pop()
+        self.redo_stack.append(action)
+        return action
+
+    def pop_redo(self):
+        """
+        Return whether the last undone action was an erase along with its 
+        op ids, moving it back onto the undo stack, or no op ids if there 
+        is none.
+        """
+        if not self.redo_stack:
+            return False, []
+        action = self.redo_stack.pop()
+        self.undo_stack.append(action)
+        return action
 
     def add_to_draw_queue(self, drawing):
         """
@@ -50,27 +190,116 @@ class PaintState:
         """
         self.draw_queue.put(drawing)
 
-    def get_last_drawing_id(self):
-        return self.drawing_ids.pop()
+    def add_last_drawing(self, drawing, items = ()):
+        """
+        Add the drawing to the history along with the canvas items it was 
+        drawn as, or apply it to the history if it is an undo, redo or 
+        clear.
+
+        An undo or redo with an op id targets the drawing with that op id, 
+        whoever drew it.  An undo without one, from an application that 
+        predates op ids, removes the last drawing.  A sync reaching the 
+        history is a position marker from a sync reply.
 
-    def add_last_drawing_id(self, id_value):
-        if id_value is not None:
-            self.drawing_ids.push(id_value)
+        An undo of one of this application's drawings that it did not undo 
+        or erase itself, such as a connected application erasing it, takes 
+        the drawing out of the action that drew it, so undoing and redoing 
+        that action cannot bring it back.
 
-    def add_last_drawing(self, drawing):
+        Return the canvas items of the drawing an undo removed, so that they 
+        are deleted along with it.
+        """
+        removed_items = []
+        history = self.drawing_history
         if drawing is not None:
-            if drawing.shape is DrawingType.UNDO and self.drawing_history:
-                self.drawing_history.pop()
+            if drawing.shape is DrawingType.UNDO:
+                if drawing.op_id is not None:
+                    removed_items = history.remove(drawing.op_id)
+                    self._forget_erased(drawing.op_id)
+                elif history.undoable:
+                    _, removed_items = history.pop()
+            elif drawing.shape is DrawingType.REDO:
+                if drawing.op_id is not None:
+                    history.restore(drawing.op_id, items)
             elif drawing.shape is DrawingType.CLEAR:
-                self.clear_drawing_ids()
-            elif drawing.shape not in {DrawingType.PING, DrawingType.SYNC}:
-                self.drawing_history.append(drawing)
+                history.clear()
+                self.undo_stack.clear()
+                self.redo_stack.clear()
+                self.selection = []
+            elif drawing.shape is DrawingType.SYNC:
+                if drawing.coords[3] == history.SYNC_POSITION:
+                    history.set_position(*drawing.coords[:3])
+            elif drawing.shape is not DrawingType.PING:
+                history.append(drawing, items)
+                self._compact_history()
+        return removed_items
+
+    def _forget_erased(self, op_id):
+        """
+        Drop the op id from the action on the undo stack that drew it, and 
+        the action if nothing is left in it, unless this application's own 
+        erase of it is on the undo stack too.
+        """
+        if op_id[0] != self.author_id:
+            return
+        drawn_in = None
+        for index in range(len(self.undo_stack) - 1, -1, -1):
+            erase, op_ids = self.undo_stack[index]
+            if op_id in op_ids:
+                if erase:
+                    return
+                drawn_in = index
+        if drawn_in is not None:
+            op_ids = self.undo_stack[drawn_in][1]
+            op_ids.remove(op_id)
+            if not op_ids:
+                del self.undo_stack[drawn_in]
 
-    def clear_drawing_ids(self):
-        self.drawing_history = []
-        self.drawing_ids.clear()
+    def drawings_near(self, x, y, distance):
+        """
+        Return the op ids of the drawings that can be undone and pass within 
+        the distance of the point, latest first.
+        """
+        history = self.drawing_history
+        return [op_id for op_id in history.undoable_in(
+                                                (x - distance, y - distance, 
+                                                x + distance, y + distance))
+                    if history.live(op_id).is_near(x, y, distance)]
+
+    def drawings_in(self, box):
+        """
+        Return the op ids of the drawings that can be undone with bounding 
+        boxes intersecting the box, latest first.
+        """
+        return self.drawing_history.undoable_in(box)
+
+    def _compact_history(self):
+        """
+        Compact the drawings past the undo horizon once enough of them have 
+        built up, bounding the memory and replay time of long sessions.
+        """
+        history = self.drawing_history
+        if (len(history) - history.snapshot_length 
+                >= self.UNDO_HORIZON + self.COMPACTION_INTERVAL):
+            history.compact(self.UNDO_HORIZON)
+            self._drop_compacted()
+
+    def _drop_compacted(self):
+        """
+        Drop the op ids compacted into the snapshot from the actions on the 
+        undo and redo stacks, and the actions left with none, so undoing 
+        and redoing never hand out an action that does nothing.
+
+        The horizon counts the drawings of every application, so actions 
+        fall out of reach long before the stacks fill up.
+        """
+        history = self.drawing_history
+        for stack in (self.undo_stack, self.redo_stack):
+            actions = [(erase, [op_id for op_id in op_ids 
+                                    if history.past_snapshot(op_id)]) 
+                        for erase, op_ids in stack]
+            stack[:] = [action for action in actions if action[1]]
 
     def stop(self):
         self.draw_active = False
         self.send_active = False
-        self.add_to_draw_queue(None)  # release drawing thread
@@ -1,16 +1,64 @@
 from logging            import getLogger
-from threading          import Thread
-from tkinter            import BOTH, LEFT, RIGHT
+from math               import inf
+from time               import perf_counter
+from tkinter            import (BOTH, END, LEFT, NW, RIGHT, PhotoImage, 
+                                Text, Toplevel)
 
 from chadlib.gui        import View
 from chadlib.gui.dialog import TextEntryDialog
 
 from .drawing_type      import DrawingType
+from .metrics           import METRICS
 from .paint_canvas      import PaintCanvas
+from .raster_layer      import RasterLayer
+from .render_scheduler  import RenderScheduler
+from .spatial_index     import SpatialIndex
 from .toolbar           import Toolbar
+from .viewport          import TiledViewport
 
 
 class PaintView(View):
+    """
+    Only the drawings in the tiles of the history around the visible part 
+    of the canvas are drawn as canvas items, the rest are drawn when they 
+    are scrolled or zoomed into view.
+
+    With raster tiles on, the older drawings in each loaded tile are drawn 
+    as a single image under the recent ones instead.  The images are 
+    rendered in the background and swapped in as they finish, the items 
+    they replace staying on the canvas until then.
+    """
+
+    ZOOM_STEP = 1.25
+    TILE_POLL_INTERVAL = 20     # milliseconds between checks on renders
+    SCROLL_STEP = 20    # canvas pixels scrolled per mouse wheel step
+    UNBOUNDED_BOX = (-inf, -inf, inf, inf)  # changed by a clear
+
+    # event state bits of the modifier keys
+    SHIFT_MASK = 0x1
+    CONTROL_MASK = 0x4
+
+    def __init__(self, *args, **kwargs):
+        self.preview_id = None
+        self.remote_preview_ids = {}    # author -> preview item
+        self.selection_ids = []
+        self.selection_boxes = []
+        super().__init__(*args, **kwargs)
+        self.render_scheduler = RenderScheduler(self, self.application_state, 
+                                                self._apply_drawing, 
+                                                self._repaint)
+        self.viewport = TiledViewport(
+                            self.application_state.drawing_history.TILE_SIZE, 
+                            self._load_tiles, self._unload_tiles)
+        self.raster_layer = (RasterLayer(
+                                    self.application_state.drawing_history)
+                                if self.controller.raster_tiles else None)
+        self.tile_images = {}   # tile -> (canvas item, PhotoImage)
+        self.tile_renders = {}  # tile -> future of its latest render
+        self.tile_poll = None
+        self.stale_tiles = set()    # tiles to render again this frame
+        self.flattening = []    # (items, box) of flattened drawings whose 
+                                # tile images are still rendering
 
     def _create_widgets(self):
         self.canvas = PaintCanvas(self.controller, self, 
@@ -22,26 +70,431 @@ class PaintView(View):
         self.canvas.pack(side = RIGHT, fill = BOTH, expand = True)
         self.toolbar.pack(side = LEFT, fill = BOTH, expand = True)
 
+    def _bind_actions(self):
+        self.canvas.bind("<Configure>", self._update_viewport)
+        self.canvas.bind("<ButtonPress-2>", self._start_pan)
+        self.canvas.bind("<B2-Motion>", self._pan)
+        for event_type in ["<MouseWheel>", "<Button-4>", "<Button-5>"]:
+            self.canvas.bind(event_type, self._scroll)
+
     def start_processing_draw_queue(self):
-        def f():
-            getLogger(__name__).debug("Draw thread starting.")
-            while self.application_state.draw_active:
-                drawing = self.application_state.draw_queue.get()
-                if drawing is not None:
-                    drawing_id = self.draw_shape(drawing)
-                    self.application_state.add_last_drawing_id(drawing_id)
-                    self.application_state.add_last_drawing(drawing)
-            getLogger(__name__).debug("Draw thread done.")
-        Thread(target = f).start()
+        """
+        Start applying the draw queue in frames from the GUI loop, so that 
+        the canvas is only ever touched from the GUI thread.
+        """
+        self.render_scheduler.start()
+
+    def _start_pan(self, event):
+        self.canvas.scan_mark(event.x, event.y)
+
+    def _pan(self, event):
+        self.canvas.scan_dragto(event.x, event.y, gain = 1)
+        self._update_viewport()
+
+    def _scroll(self, event):
+        """
+        Scroll with the mouse wheel, sideways with Shift held, or zoom about 
+        the cursor with Control held.
+        """
+        step = -1 if event.num == 4 or event.delta > 0 else 1
+        if event.state & self.CONTROL_MASK:
+            self.zoom(self.ZOOM_STEP ** -step, event.x, event.y)
+        elif event.state & self.SHIFT_MASK:
+            self.canvas.scroll_by(step * self.SCROLL_STEP, 0)
+        else:
+            self.canvas.scroll_by(0, step * self.SCROLL_STEP)
+        self._update_viewport()
+
+    def zoom(self, factor, x, y):
+        """
+        Zoom by the factor, keeping the drawing under the window point in 
+        place.
+
+        Every loaded tile is dropped and the visible ones drawn again at the 
+        new scale, so the cost depends on what is visible.
+        """
+        old_zoom = self.canvas.zoom
+        new_zoom = self.viewport.clamp_zoom(old_zoom * factor)
+        if new_zoom == old_zoom:
+            return
+
+        anchor_x, anchor_y = self.canvas.canvasx(x), self.canvas.canvasy(y)
+        self.viewport.reset()
+        self._delete_flattened_items(every = True)
+        self.clear_preview()
+        for item_id in self.remote_preview_ids.values():
+            self._delete_preview_item(item_id)
+        self.remote_preview_ids = {}
+        self.canvas.zoom = new_zoom
+        if self.raster_layer is not None:
+            self.raster_layer.zoom = new_zoom
+        self.canvas.scroll_by(anchor_x * (new_zoom / old_zoom - 1), 
+                                anchor_y * (new_zoom / old_zoom - 1))
+        self.show_selection(self.selection_boxes)
+        self._update_viewport()
+
+    def _update_viewport(self, event = None):
+        self.viewport.update(self.canvas.visible_box())
+
+    def _load_tiles(self, tiles):
+        """
+        Draw the drawings in the tiles that are not drawn yet, stacking each 
+        one under the next drawing that is already drawn.
+        """
+        history = self.application_state.drawing_history
+        for index in sorted({index for tile in tiles 
+                                for index in history.tiles.cell_keys(tile)
+                                    if not history.items(index)}):
+            drawing = history[index]
+            if not self._is_flat(index, drawing):
+                drawing_id = self.draw_shape(drawing)
+                if drawing_id is not None:
+                    history.set_items(index, (drawing_id,))
+                    self._restack(index)
+        for tile in tiles:
+            self._render_tile(tile)
+
+    def _restack(self, index):
+        """
+        Move the items of the drawing at the index, drawn on top of the 
+        canvas, under the items of the next drawing that is drawn, or keep 
+        the preview and selection items above them if there is none.
+        """
+        history = self.application_state.drawing_history
+        later = history.next_drawn(index)
+        if later is not None:
+            below = history.items(later)[0]
+            for item in history.items(index):
+                self.canvas.tag_lower(item, below)
+            return
+        for item in ([self.preview_id] 
+                        + list(self.remote_preview_ids.values()) 
+                        + self.selection_ids):
+            if item is not None:
+                self.canvas.tag_raise(item)
+
+    def _unload_tiles(self, tiles):
+        """
+        Delete the items of the drawings in the tiles that are not also in 
+        a tile that is still loaded.
+        """
+        history = self.application_state.drawing_history
+        for index in {index for tile in tiles 
+                        for index in history.tiles.cell_keys(tile)}:
+            if not self.viewport.is_resident(history.tiles.boxes[index]):
+                self._delete_items(index)
+        for tile in tiles:
+            self._cancel_render(tile)
+            self._delete_tile_image(tile)
+
+    def _delete_items(self, index):
+        history = self.application_state.drawing_history
+        for item in history.items(index):
+            self.canvas.delete(item)
+        history.set_items(index, ())
+
+    def _is_flat(self, index, drawing):
+        return (self.raster_layer is not None 
+                    and self.raster_layer.is_flat(index, drawing))
+
+    def _render_tile(self, tile):
+        """
+        Start rendering the flattened drawings in the tile in the background, 
+        its current image staying until the new one is swapped in, or 
+        delete its image if nothing in it is flattened.
+
+        Only the latest render of a tile is kept, an earlier one still 
+        running is cancelled or its image dropped.
+        """
+        self._cancel_render(tile)
+        future = (None if self.raster_layer is None 
+                    else self.raster_layer.submit(tile))
+        if future is None:
+            self._delete_tile_image(tile)
+            return
+        self.tile_renders[tile] = future
+        if self.tile_poll is None:
+            self.tile_poll = self.after(self.TILE_POLL_INTERVAL, 
+                                        self._swap_tile_images)
+
+    def _cancel_render(self, tile):
+        future = self.tile_renders.pop(tile, None)
+        if future is not None:
+            future.cancel()
+
+    def _swap_tile_images(self):
+        """
+        Replace the images of the tiles that finished rendering, placing 
+        them under every other item, then delete the items of flattened 
+        drawings that are in the images now, checking again later while 
+        any tiles are still rendering.
+        """
+        self.tile_poll = None
+        done = [tile for tile, future in self.tile_renders.items() 
+                    if future.done()]
+        for tile in done:
+            future = self.tile_renders.pop(tile)
+            try:
+                x, y, data = future.result()
+            except Exception as err:
+                getLogger(__name__).warning(
+                                "Rendering tile {} failed: {}".format(tile, 
+                                                                    err))
+                continue
+            self._delete_tile_image(tile)
+            image = PhotoImage(data = data, format = "PPM")
+            item = self.canvas.create_image(x, y, image = image, anchor = NW)
+            self.canvas.tag_lower(item)
+            self.tile_images[tile] = item, image
+        if done:
+            self._delete_flattened_items()
+        if self.tile_renders:
+            self.tile_poll = self.after(self.TILE_POLL_INTERVAL, 
+                                        self._swap_tile_images)
+
+    def _delete_tile_image(self, tile):
+        item, _ = self.tile_images.pop(tile, (None, None))
+        if item is not None:
+            self.canvas.delete(item)
+
+    def stop_rendering(self):
+        """
+        Cancel the tile renders and shut down the workers doing them.
+        """
+        if self.tile_poll is not None:
+            self.after_cancel(self.tile_poll)
+            self.tile_poll = None
+        for tile in list(self.tile_renders):
+            self._cancel_render(tile)
+        if self.raster_layer is not None:
+            self.raster_layer.stop()
+
+    def _flatten(self):
+        """
+        Render the tiles under the drawings the flattening line moved past 
+        again, taking their items out of the history to be deleted once 
+        the images they are drawn into are swapped in.
+
+        If the whole history moved the visible tiles are loaded again.
+        """
+        flattened = self.raster_layer.flattened
+        if flattened is None:
+            self.viewport.reset()
+            self._delete_flattened_items(every = True)
+            self._update_viewport()
+            return
+
+        history = self.application_state.drawing_history
+        stale = set()
+        for index in flattened:
+            items = history.items(index)
+            if items and self._is_flat(index, history[index]):
+                box = history.tiles.boxes[index]
+                history.set_items(index, ())
+                self.flattening.append((items, box))
+                stale.update(tile for tile in SpatialIndex.cells_for(box, 
+                                                            history.TILE_SIZE)
+                                if tile in self.viewport.resident)
+        for tile in stale:
+            self._render_tile(tile)
+        self._delete_flattened_items()
+
+    def _delete_flattened_items(self, every = False):
+        """
+        Delete the items of the flattened drawings, or only those with none 
+        of their tiles still rendering.
+        """
+        waiting = []
+        for items, box in self.flattening:
+            if not every and any(tile in self.tile_renders 
+                                    for tile in SpatialIndex.cells_for(box, 
+                                                self.viewport.tile_size)):
+                waiting.append((items, box))
+            else:
+                for item in items:
+                    self.canvas.delete(item)
+        self.flattening = waiting
+
+    def _apply_drawing(self, drawing):
+        """
+        Draw the drawing and add it to the history, returning the canvas 
+        region that it changed.
+
+        An undo deletes the canvas items of the drawing it removed from the 
+        history, a redo draws that drawing again, back in its place in the 
+        stacking order.  Previews from the connected application only move 
+        its preview item, a preview clear removes it.
+
+        Drawings outside of the loaded tiles are only added to the history, 
+        to be drawn once they are scrolled into view.  An undo or redo of a 
+        flattened drawing marks the tiles under it to be rendered again 
+        when the frame is repainted, unless the redo puts it or a text out 
+        of order with the flattened drawings and every tile is loaded again.
+        """
+        if METRICS.enabled:
+            METRICS.stop_timer(drawing, "receive_draw_ms")
+        if drawing.preview:
+            return self._apply_remote_preview(drawing)
+
+        dirty_box = self._dirty_box(drawing)
+        flat_target = self._has_flat_target(drawing)
+        if flat_target or not self._in_view(drawing, dirty_box):
+            drawing_id = None
+        elif drawing.shape is DrawingType.REDO:
+            drawing_id = self._redraw(drawing)
+        else:
+            drawing_id = self.draw_shape(drawing)
+        items = () if drawing_id is None else (drawing_id,)
+        for item in self.application_state.add_last_drawing(drawing, items):
+            self.canvas.delete(item)
+        if drawing.shape is DrawingType.REDO and items:
+            history = self.application_state.drawing_history
+            self._restack(history.position(drawing.op_id))
+
+        if flat_target:
+            history = self.application_state.drawing_history
+            self.stale_tiles.update(SpatialIndex.cells_for(dirty_box, 
+                                                            history.TILE_SIZE))
+        if self.raster_layer is not None and (self.raster_layer.update() 
+                or (drawing.shape is DrawingType.REDO 
+                    and drawing.op_id is not None 
+                    and self.raster_layer.redone(drawing.op_id))):
+            self._flatten()
+        return dirty_box
+
+    def _repaint(self, dirty_box):
+        """
+        Bring what the frame's drawings changed in the region up to date, 
+        starting one render of each stale tile in it however many of their 
+        drawings changed, and dropping the highlight of selected drawings 
+        that were undone.
+        """
+        for tile in self.stale_tiles & self.viewport.resident:
+            self._render_tile(tile)
+        self.stale_tiles.clear()
+
+        if any(self._overlaps(box, dirty_box) 
+                for box in self.selection_boxes):
+            history = self.application_state.drawing_history
+            self.show_selection([drawing.bounding_box() 
+                                    for drawing in map(history.live, 
+                                            self.application_state.selection)
+                                        if drawing is not None])
+
+    @staticmethod
+    def _overlaps(box, other):
+        return (box[0] <= other[2] and other[0] <= box[2] 
+                and box[1] <= other[3] and other[1] <= box[3])
+
+    def _has_flat_target(self, drawing):
+        """
+        Return whether the drawing is an undo or redo of a flattened drawing.
+        """
+        if (self.raster_layer is None 
+                or drawing.shape not in {DrawingType.UNDO, DrawingType.REDO}):
+            return False
+        history = self.application_state.drawing_history
+        target = history.target(drawing)
+        return (target is not None and target.op_id is not None 
+                and self._is_flat(history.position(target.op_id), target))
+
+    def _in_view(self, drawing, box):
+        if (DrawingType.is_recorded(drawing.shape) 
+                or drawing.shape is DrawingType.REDO):
+            return box is not None and self.viewport.is_resident(box)
+        return True
+
+    def _redraw(self, redo):
+        target = self.application_state.drawing_history.target(redo)
+        return None if target is None else self.draw_shape(target)
+
+    def _apply_remote_preview(self, drawing):
+        """
+        Move the preview item of the drawing's author, each connected 
+        application having one of its own, or remove it on a clear.
+        """
+        if drawing.shape is DrawingType.CLEAR:
+            self._delete_preview_item(
+                            self.remote_preview_ids.pop(drawing.author, None))
+        else:
+            self.remote_preview_ids[drawing.author] = (
+                        self._update_preview_item(
+                                self.remote_preview_ids.get(drawing.author), 
+                                drawing))
+        return drawing.bounding_box()
+
+    def _dirty_box(self, drawing):
+        """
+        Return the region of the canvas the drawing changes, all of it for 
+        a clear as the canvas has no bounds, or None if it changes nothing.
+        """
+        if drawing.shape is DrawingType.CLEAR:
+            return self.UNBOUNDED_BOX
+        elif drawing.shape in {DrawingType.UNDO, DrawingType.REDO}:
+            target = self.application_state.drawing_history.target(drawing)
+            return None if target is None else target.bounding_box()
+        return drawing.bounding_box()
 
     def create_text_entry(self, coords):
         TextEntryDialog("Enter text to display", self.controller.create_text, 
                         coords)
 
+    def create_address_entry(self, callback):
+        TextEntryDialog("Enter address to connect to", callback)
+
+    def show_metrics(self, text):
+        """
+        Show the metrics text in a window of its own.
+        """
+        window = Toplevel(self)
+        window.title("Metrics")
+        text_box = Text(window, width = 80, height = 40)
+        text_box.insert(END, text)
+        text_box.configure(state = "disabled")
+        text_box.pack(fill = BOTH, expand = True)
+
+    def show_preview(self, drawing):
+        """
+        Show the drawing as a temporary canvas item that is not part of the 
+        drawing history, moving the existing preview if there is one.
+        """
+        self.preview_id = self._update_preview_item(self.preview_id, drawing)
+
+    def clear_preview(self):
+        self._delete_preview_item(self.preview_id)
+        self.preview_id = None
+
+    def show_selection(self, boxes):
+        """
+        Replace the highlight of the last selection with one around each of 
+        the boxes.
+        """
+        self.selection_boxes = boxes
+        for item_id in self.selection_ids:
+            self.canvas.delete(item_id)
+        self.selection_ids = [self.canvas.draw_selection(box) 
+                                for box in boxes]
+
+    def _update_preview_item(self, item_id, drawing):
+        """
+        Return the preview item moved to the drawing's coords, drawing it 
+        if there is none yet.
+        """
+        if item_id is None:
+            return self.draw_shape(drawing)
+        self.canvas.move_item(item_id, drawing.coords)
+        return item_id
+
+    def _delete_preview_item(self, item_id):
+        if item_id is not None:
+            self.canvas.delete(item_id)
+
     def draw_shape(self, drawing):
         """
         Call the appropriate draw call based on the drawing type
         """
+        if METRICS.enabled:
+            begin = perf_counter()
         drawing_id = None
         if drawing.shape is DrawingType.PEN:
             drawing_id = self.canvas.draw_line(drawing.coords, 
@@ -69,14 +522,24 @@ class PaintView(View):
                                                 drawing.color)
         elif drawing.shape is DrawingType.CLEAR:
             self.canvas.clear_canvas()
+            self.preview_id = None
+            self.remote_preview_ids = {}
+            self.selection_ids = []
+            self.selection_boxes = []
+            self.tile_images = {}
+            for tile in list(self.tile_renders):
+                self._cancel_render(tile)
+            self.flattening = []
         elif drawing.shape is DrawingType.TEXT:
             drawing_id = self.canvas.draw_text(drawing.coords, 
                                                 drawing.thickness, 
                                                 drawing.color,
                                                 drawing.text)
-        elif drawing.shape is DrawingType.UNDO:
-            self.canvas.undo()
-        elif drawing.shape is DrawingType.SYNC:
-            pass
+        elif drawing.shape in {DrawingType.UNDO, DrawingType.REDO, 
+                                DrawingType.SYNC}:
+            pass    # applied to the history along with its canvas items
             
+        if METRICS.enabled:
+            METRICS.observe("draw_ms." + drawing.shape.name.lower(), 
+                            1000 * (perf_counter() - begin))
         return drawing_id
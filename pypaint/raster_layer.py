@@ -0,0 +1,207 @@
+from concurrent.futures import ProcessPoolExecutor
+from math               import ceil, floor
+from multiprocessing    import get_context
+
+from .drawing_type      import DrawingType
+from .headless_renderer import HeadlessRenderer
+
+
+def render_tile_image(drawings, size, x, y, zoom):
+    """
+    Return the canvas position and PPM image of the drawings rendered into
+    the square at it, run in a worker process.
+    """
+    framebuffer = HeadlessRenderer.render_raster(drawings, size, size, x, y,
+                                                    zoom)
+    return x, y, framebuffer.encode_ppm()
+
+
+class RasterLayer:
+    """
+    Flattens the older drawings of the history into one raster image per
+    tile, so the canvas only holds the recent drawings as vector items
+    however long the history grows.
+
+    Drawings before the flattening line are flattened.  The line is moved
+    up to the last keep_recent drawings once flatten_interval more have
+    been added, rather than on every drawing, since moving it means
+    rendering the tiles under the drawings it passes again.  Text stays a
+    vector item, as the renderer has no fonts to draw it with, so the line
+    stops at the first drawing over an earlier text, which would otherwise
+    end up under it.
+
+    Tiles are rendered in worker processes, started with spawn as the GUI
+    process has Tk running, so the GUI thread only gathers the drawings.
+
+    Tiles are only flattened up to MAX_ZOOM, past it they would be too
+    large to be worth rendering and few drawings are visible anyway.
+    """
+
+    KEEP_RECENT = 256
+    FLATTEN_INTERVAL = 512
+    MAX_ZOOM = 2
+    RENDER_WORKERS = 2
+
+    def __init__(self, history, keep_recent = KEEP_RECENT,
+                    flatten_interval = FLATTEN_INTERVAL,
+                    workers = RENDER_WORKERS):
+        self.history = history
+        self.keep_recent = keep_recent
+        self.flatten_interval = flatten_interval
+        self.workers = workers
+        self.executor = None
+        self.flat_end = 0
+        self.flat_count = 0     # drawings appended before the line
+        self.checked_count = 0  # drawings appended before it last moved to
+        self.flattened = None   # indices the line last moved past
+        self.snapshot_length = history.snapshot_length
+        self.zoom = 1
+
+    def update(self):
+        """
+        Move the flattening line for the drawings added since it was last
+        moved, returning whether it moved and tiles need rendering again.
+
+        When the line moves on, flattened is the range of indices it moved
+        past, the only drawings to change.  When the history is cleared or
+        shrinks behind the line it starts again, with flattened None as
+        every drawing may have changed.
+
+        The positions of the drawings change when the history is compacted,
+        so the line is carried over by the count of drawings appended
+        before it, which compacting leaves alone.
+        """
+        history = self.history
+        length = len(history)
+        if history.appended_before(length) < self.flat_count:
+            self._move(max(length - self.keep_recent, 0))
+            self.flattened = None
+            return True
+        if history.snapshot_length != self.snapshot_length:
+            self.snapshot_length = history.snapshot_length
+            self.flat_end = history.index_past(self.flat_count)
+
+        if (history.appended_before(length) - self.checked_count
+                < self.keep_recent + self.flatten_interval):
+            return False
+        end = max(length - self.keep_recent, 0)
+        self.checked_count = history.appended_before(end)
+        end = self._text_end(self.flat_end, end)
+        if end <= self.flat_end:
+            return False
+        self.flattened = range(self.flat_end, end)
+        self._move(end)
+        return True
+
+    def _text_end(self, start, end):
+        """
+        Return the end, or the first index from the start before it of a 
+        drawing over an earlier text, if there is one.
+        """
+        history = self.history
+        texts = history.text_indices()
+        text_set = set(texts)
+        for text in texts:
+            if text >= end:
+                break
+            box = history.tiles.boxes.get(text)
+            if box is None:     # removed
+                continue
+            for index in history.tiles.query(box):
+                if (max(start, text + 1) <= index < end 
+                        and index not in text_set):
+                    end = index
+        return end
+
+    def redone(self, op_id):
+        """
+        Move the flattening line back for the redone drawing with the op id 
+        if it is flattened over an earlier text, or is a text under later 
+        flattened drawings, returning whether it moved.
+        """
+        history = self.history
+        drawing = history.live(op_id)
+        if drawing is None:
+            return False
+        index = history.position(op_id)
+        box = history.tiles.boxes.get(index)
+        if index >= self.flat_end or box is None:
+            return False
+        texts = set(history.text_indices())
+        overlapping = history.tiles.query(box)
+        if index in texts:
+            later = [other for other in overlapping 
+                        if index < other < self.flat_end 
+                            and other not in texts]
+            end = min(later, default = self.flat_end)
+        else:
+            end = (index if any(other < index for other in overlapping 
+                                    if other in texts) 
+                        else self.flat_end)
+        if end == self.flat_end:
+            return False
+        self._move(end)
+        self.flattened = None
+        return True
+
+    def _move(self, end):
+        self.flat_end = end
+        self.flat_count = self.checked_count = self.history.appended_before(
+                                                                        end)
+        self.snapshot_length = self.history.snapshot_length
+
+    def is_flat(self, index, drawing):
+        """
+        Return whether the drawing at the index is drawn into its tiles
+        instead of as a canvas item.
+        """
+        return (index < self.flat_end and self.zoom <= self.MAX_ZOOM
+                and drawing.shape is not DrawingType.TEXT)
+
+    def render_job(self, tile):
+        """
+        Return the arguments of render_tile_image for the flattened drawings
+        in the tile at the current zoom, or None if it has none.
+        """
+        history = self.history
+        drawings = []
+        for index in sorted(history.tiles.cell_keys(tile)):
+            drawing = history[index]
+            if self.is_flat(index, drawing):
+                drawings.append(drawing)
+        if not drawings:
+            return None
+
+        size = history.TILE_SIZE * self.zoom
+        return (drawings, ceil(size), floor(tile[0] * size),
+                floor(tile[1] * size), self.zoom)
+
+    def render_tile(self, tile):
+        """
+        Return the canvas position and PPM image of the flattened drawings
+        in the tile at the current zoom, or None if it has none.
+        """
+        job = self.render_job(tile)
+        return None if job is None else render_tile_image(*job)
+
+    def submit(self, tile):
+        """
+        Start rendering the tile in a worker, returning the future of what
+        render_tile would return, or None if it has nothing flattened.
+        """
+        job = self.render_job(tile)
+        if job is None:
+            return None
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers,
+                                                mp_context = get_context(
+                                                                    "spawn"))
+        return self.executor.submit(render_tile_image, *job)
+
+    def stop(self):
+        """
+        Shut the workers down without waiting for their renders.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait = False)
+            self.executor = None
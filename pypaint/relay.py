@@ -0,0 +1,194 @@
+from asyncio            import current_task, gather, run, start_server
+from logging            import getLogger
+
+from .drawing_history   import DrawingHistory
+from .drawing_type      import DrawingType
+from .wire_codec        import WireCodec
+
+
+class Relay:
+    """
+    Headless server that any number of PyPaint applications connect to,
+    relaying each one's drawings to all of the others.
+
+    The relay keeps the authoritative drawing history, so it answers sync
+    requests itself with only the part of the history the requester is
+    missing.  Each client negotiates frames on its own, and a batch going
+    out is encoded once per kind of client rather than once per client.
+
+    A client that stops reading is disconnected once too much is waiting to
+    be written to it, instead of holding up everyone else; it can sync
+    again after reconnecting.
+    """
+
+    DEFAULT_HOST = ""           # all interfaces
+    DEFAULT_PORT = 2423         # same as the application's own
+    READ_SIZE = 1 << 16
+
+    WRITE_BUFFER_LIMIT = 1 << 24    # bytes waiting before a client is dropped
+    SYNC_BATCH_SIZE = 1024          # drawings encoded per sync reply write
+
+    # match PaintState so the history compacts at the same points as the
+    # clients', keeping the sync digests comparable
+    UNDO_HORIZON = 1000
+    COMPACTION_INTERVAL = 1000
+
+    def __init__(self, host = DEFAULT_HOST, port = DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.history = DrawingHistory()
+        self.clients = {}       # writer -> WireCodec
+        self.handlers = set()
+        self.server = None
+
+    def run(self):
+        """
+        Serve until interrupted.
+        """
+        try:
+            run(self._serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    async def _serve_forever(self):
+        await self.start()
+        getLogger(__name__).info("Relay listening on port {}.".format(
+                                                                self.port))
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def start(self):
+        """
+        Start listening, updating the port to the one bound if 0 was given.
+        """
+        self.server = await start_server(self._handle_client,
+                                            self.host or None, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        for writer in list(self.clients):
+            self._drop(writer)
+        await gather(*self.handlers)
+        await self.server.wait_closed()
+
+    async def _handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        getLogger(__name__).debug("Client {} connected.".format(peer))
+        codec = WireCodec()
+        self.clients[writer] = codec
+        self.handlers.add(current_task())
+        writer.write(codec.offer())
+        try:
+            while writer in self.clients:
+                data = await reader.read(self.READ_SIZE)
+                if not data:
+                    break
+                self._receive(writer, codec.decode(data))
+                await writer.drain()
+        except (ConnectionError, OSError) as err:
+            getLogger(__name__).debug("Client {} error: {}".format(peer,
+                                                                    err))
+        finally:
+            self._drop(writer)
+            self.handlers.discard(current_task())
+            getLogger(__name__).debug("Client {} disconnected.".format(peer))
+
+    def _receive(self, sender, drawings):
+        """
+        Apply the drawings from the sender to the history and relay them to
+        the other clients, answering any syncs directly.
+
+        Position markers only follow the snapshots of sync replies, and the 
+        relay sends those rather than receiving them, so one from a client 
+        is ignored instead of overwriting the authoritative history's count 
+        and digests.
+        """
+        relayed = []
+        for drawing in drawings:
+            if (drawing.shape is DrawingType.SYNC 
+                    and drawing.coords[3] == self.history.SYNC_POSITION):
+                continue
+            elif drawing.shape is DrawingType.SYNC:
+                self._broadcast(relayed, sender)
+                relayed = []
+                self._sync(sender, drawing)
+            else:
+                self._apply(drawing)
+                relayed.append(drawing)
+        self._broadcast(relayed, sender)
+
+    def _apply(self, drawing):
+        """
+        Update the history the same way an application does as it draws, 
+        leaving previews out of it.
+        """
+        history = self.history
+        if drawing.preview:
+            pass
+        elif drawing.shape is DrawingType.UNDO:
+            if drawing.op_id is not None:
+                history.remove(drawing.op_id)
+            elif history.undoable:
+                history.pop()
+        elif drawing.shape is DrawingType.REDO:
+            if drawing.op_id is not None:
+                history.restore(drawing.op_id)
+        elif drawing.shape is DrawingType.CLEAR:
+            history.clear()
+        elif drawing.shape is not DrawingType.PING:
+            history.append(drawing)
+            if (len(history) - history.snapshot_length
+                    >= self.UNDO_HORIZON + self.COMPACTION_INTERVAL):
+                history.compact(self.UNDO_HORIZON)
+
+    def _broadcast(self, drawings, sender):
+        """
+        Write the drawings to every client but the sender, encoding them
+        once for raw clients and once for framed ones.
+        """
+        if not drawings:
+            return
+        encoded = {}
+        for writer, codec in list(self.clients.items()):
+            if writer is sender:
+                continue
+            if codec.peer_framed not in encoded:
+                encoded[codec.peer_framed] = codec.encode(drawings)
+            self._write(writer, encoded[codec.peer_framed])
+
+    def _sync(self, writer, sync):
+        """
+        Send the client the part of the history it is missing, going by the
+        history length and digest carried by its sync.
+
+        The reply is written in one go, ahead of anything relayed after it,
+        and is not held to the write buffer limit since the client's reads
+        are held back until it drains.
+        """
+        codec = self.clients.get(writer)
+        if codec is None:
+            return
+        batch = []
+        for drawing in self.history.sync_reply(sync):
+            batch.append(drawing)
+            if len(batch) >= self.SYNC_BATCH_SIZE:
+                writer.write(codec.encode(batch))
+                batch = []
+        if batch:
+            writer.write(codec.encode(batch))
+
+    def _write(self, writer, data):
+        if writer not in self.clients:
+            return
+        if (writer.transport.get_write_buffer_size() + len(data)
+                > self.WRITE_BUFFER_LIMIT):
+            getLogger(__name__).warning("Dropping slow client {}.".format(
+                                        writer.get_extra_info("peername")))
+            self._drop(writer)
+        else:
+            writer.write(data)
+
+    def _drop(self, writer):
+        if self.clients.pop(writer, None) is not None:
+            writer.close()
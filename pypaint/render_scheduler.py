@@ -0,0 +1,112 @@
+from logging        import getLogger
+from queue          import Empty
+from time           import perf_counter
+
+
+class RenderScheduler:
+    """
+    Applies the drawings from the draw queue in frames at a capped frame
+    rate, so the canvas is repainted once per frame however many drawings
+    arrive in it.
+
+    The canvas region each frame changed is passed on to be repainted
+    once the frame's drawings are applied, and tracked along with frame
+    time and items per frame counters for tuning.
+    """
+
+    FRAME_RATE = 60
+    FRAME_BUDGET = 0.75     # share of a frame spent applying drawings
+
+    def __init__(self, widget, application_state, render, repaint = None):
+        """
+        The widget schedules the frames, and render applies a single drawing
+        and returns the (x1, y1, x2, y2) canvas region it changed, or None.
+        Repaint, if given, is called with the union of those regions after
+        each frame that changed one.
+        """
+        self.widget = widget
+        self.application_state = application_state
+        self.render = render
+        self.repaint = repaint
+
+        self.frame_interval = 1 / self.FRAME_RATE
+        self.frame_count = 0
+        self.item_count = 0
+        self.last_frame_time = 0
+        self.max_frame_time = 0
+        self.last_frame_items = 0
+        self.max_frame_items = 0
+        self.dirty_box = None
+
+    def start(self):
+        getLogger(__name__).debug("Render scheduler starting.")
+        self._schedule_frame(0)
+
+    def _schedule_frame(self, elapsed):
+        delay = max(1, round((self.frame_interval - elapsed) * 1000))
+        self.widget.after(delay, self._frame)
+
+    def _frame(self):
+        """
+        Apply queued drawings until the queue is empty or the frame budget
+        runs out, then schedule the next frame.
+        """
+        start = perf_counter()
+        deadline = start + self.frame_interval * self.FRAME_BUDGET
+        draw_queue = self.application_state.draw_queue
+        dirty_box = None
+        items = 0
+        while (self.application_state.draw_active
+                and perf_counter() < deadline):
+            try:
+                drawing = draw_queue.get_nowait()
+            except Empty:
+                break
+            if drawing is not None:
+                dirty_box = self._union(dirty_box, self.render(drawing))
+                items += 1
+        if dirty_box is not None and self.repaint is not None:
+            self.repaint(dirty_box)
+
+        elapsed = perf_counter() - start
+        if items > 0:
+            self._record_frame(elapsed, items, dirty_box)
+        if self.application_state.draw_active:
+            self._schedule_frame(elapsed)
+        else:
+            getLogger(__name__).debug("Render scheduler done, {}".format(
+                                                                self.stats()))
+
+    def _record_frame(self, frame_time, items, dirty_box):
+        self.frame_count += 1
+        self.item_count += items
+        self.last_frame_time = frame_time
+        self.max_frame_time = max(self.max_frame_time, frame_time)
+        self.last_frame_items = items
+        self.max_frame_items = max(self.max_frame_items, items)
+        self.dirty_box = dirty_box
+
+    def stats(self):
+        """
+        Return the frame counters, with times in milliseconds.
+        """
+        return {
+            "frames" : self.frame_count,
+            "items" : self.item_count,
+            "last_frame_ms" : self.last_frame_time * 1000,
+            "max_frame_ms" : self.max_frame_time * 1000,
+            "last_frame_items" : self.last_frame_items,
+            "max_frame_items" : self.max_frame_items,
+            "mean_frame_items" : (self.item_count / self.frame_count
+                                    if self.frame_count else 0),
+            "dirty_box" : self.dirty_box
+            }
+
+    @staticmethod
+    def _union(box, other):
+        if box is None:
+            return other
+        elif other is None:
+            return box
+        return (min(box[0], other[0]), min(box[1], other[1]),
+                max(box[2], other[2]), max(box[3], other[3]))
@@ -0,0 +1,116 @@
+from logging        import getLogger
+from queue          import Empty, Full
+from threading      import Thread
+from time           import monotonic, sleep
+
+from .wire_codec    import WireCodec
+
+
+class Sender:
+    """
+    Drains the drawings queued to send, coalescing them into a single write
+    per flush interval, or sooner once enough drawings are waiting.
+
+    The write queue to the connection is bounded, so while a slow peer
+    leaves it full the waiting drawings keep coalescing into one larger
+    write instead of piling up as many small ones.  Once the pending limit
+    is reached the sender stops taking drawings until the write goes out,
+    and once the bounded send queue fills behind it, the drawings that do
+    not fit are dropped and the peer is sent the whole history again later.
+    A list of drawings, such as a sync reply, is queued as a single item.
+
+    The sender encodes with a codec of its own, used only by its thread,
+    and is told whether the peer understands frames through the send queue,
+    in order with the drawings.
+    """
+
+    FLUSH_INTERVAL = 20         # milliseconds
+    FLUSH_SIZE = 256            # drawings
+    PENDING_LIMIT = 65536       # drawings held back before taking no more
+
+    def __init__(self, application_state, 
+                    flush_interval = FLUSH_INTERVAL, flush_size = FLUSH_SIZE):
+        self.application_state = application_state
+        self.encoder = WireCodec()
+        self.flush_interval = flush_interval / 1000
+        self.flush_size = flush_size
+        self.running = False
+        self._warned = False
+        self.pending_count = 0  # drawings taken but not written, for metrics
+
+    def start(self):
+        self.running = True
+        Thread(target = self._run, daemon = True).start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.application_state.send_queue.put_nowait(None)  # release it
+        except Full:
+            pass    # not waiting on the queue
+
+    def set_peer_framed(self, framed):
+        """
+        Have the drawings queued after this encoded for a peer that does, or 
+        does not, understand frames.
+        """
+        self.application_state.send_queue.put(framed)
+
+    def _run(self):
+        getLogger(__name__).debug("Sender thread starting.")
+        send_queue = self.application_state.send_queue
+        pending = []
+        deadline = None
+        while self.running:
+            taken = False
+            if len(pending) < self.PENDING_LIMIT:
+                timeout = (None if not pending
+                            else max(0, deadline - monotonic()))
+                try:
+                    item = send_queue.get(timeout = timeout)
+                    taken = True
+                    if isinstance(item, bool):  # from set_peer_framed
+                        self.encoder.peer_framed = item
+                    elif item is not None:
+                        if not pending:
+                            deadline = monotonic() + self.flush_interval
+                        if isinstance(item, list):
+                            pending.extend(item)
+                        else:
+                            pending.append(item)
+                except Empty:
+                    pass
+
+            if not self.application_state.send_active:
+                pending.clear()
+            elif pending and (len(pending) >= self.flush_size
+                                or monotonic() >= deadline):
+                if self._write(pending):
+                    pending = []
+                else:
+                    deadline = monotonic() + self.flush_interval
+            self.pending_count = len(pending)
+            if taken:
+                send_queue.task_done()
+        getLogger(__name__).debug("Sender thread done.")
+
+    def _write(self, pending):
+        """
+        Queue the pending drawings as a single write, returning False if the
+        write queue is full and they have to keep waiting.
+
+        Once the pending drawings reach their limit this waits a flush 
+        interval before giving up, as there is nothing else to do.
+        """
+        write_queue = self.application_state.write_queue
+        if write_queue.full():
+            if len(pending) >= self.PENDING_LIMIT:
+                if not self._warned:
+                    getLogger(__name__).warning("Peer is slow, holding back "
+                                                "drawings to send")
+                    self._warned = True
+                sleep(self.flush_interval)
+            return False
+        write_queue.put(self.encoder.encode(pending))
+        self._warned = False
+        return True
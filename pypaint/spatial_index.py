@@ -0,0 +1,81 @@
+from collections    import defaultdict
+from math           import floor
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the canvas, mapping each cell to the keys of the
+    drawings whose bounding boxes overlap it.
+
+    A query only looks at the cells its box covers, so finding the drawings
+    under the cursor costs the same however long the history is, instead
+    of a scan through all of it.
+    """
+
+    CELL_SIZE = 64
+
+    def __init__(self, cell_size = CELL_SIZE):
+        self.cell_size = cell_size
+        self.clear()
+
+    def clear(self):
+        self.cells = defaultdict(set)
+        self.boxes = {}         # key -> bounding box
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, key):
+        return key in self.boxes
+
+    def insert(self, key, box):
+        """
+        Add the key with its (x1, y1, x2, y2) bounding box, replacing any
+        box it already had.
+        """
+        self.discard(key)
+        self.boxes[key] = box
+        for cell in self.cells_for(box, self.cell_size):
+            self.cells[cell].add(key)
+
+    def discard(self, key):
+        """
+        Remove the key if it is in the index.
+        """
+        box = self.boxes.pop(key, None)
+        if box is not None:
+            for cell in self.cells_for(box, self.cell_size):
+                keys = self.cells[cell]
+                keys.discard(key)
+                if not keys:
+                    del self.cells[cell]
+
+    def query(self, box):
+        """
+        Return the set of keys with bounding boxes that intersect the box.
+        """
+        x1, y1, x2, y2 = box
+        found = set()
+        for cell in self.cells_for(box, self.cell_size):
+            for key in self.cells.get(cell, ()):
+                kx1, ky1, kx2, ky2 = self.boxes[key]
+                if kx1 <= x2 and x1 <= kx2 and ky1 <= y2 and y1 <= ky2:
+                    found.add(key)
+        return found
+
+    def cell_keys(self, cell):
+        """
+        Return the keys with bounding boxes overlapping the cell.
+        """
+        return self.cells.get(cell, ())
+
+    @staticmethod
+    def cells_for(box, size):
+        """
+        Return the (column, row) cells of the given size that the box 
+        overlaps.
+        """
+        x1, y1, x2, y2 = box
+        return [(col, row)
+                    for col in range(floor(x1 / size), floor(x2 / size) + 1)
+                    for row in range(floor(y1 / size), floor(y2 / size) + 1)]
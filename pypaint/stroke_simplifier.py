@@ -0,0 +1,100 @@
+from math     import hypot
+
+
+class StrokeSimplifier:
+    """
+    Simplification stage between the motion events and the stroke drawings
+    created from them, this base stage keeps every point.
+
+    Points are decimated as they arrive through accept, and the coords of
+    each completed stroke are reduced through simplify before the drawing
+    is created.
+    """
+
+    def __init__(self, tolerance = 0):
+        self.tolerance = tolerance
+
+    def accept(self, last_point, point):
+        """
+        Return whether the point should be added after the last point kept.
+        """
+        return True
+
+    def simplify(self, coords):
+        """
+        Return the flat coords of a completed stroke with any points that do
+        not add to its shape removed.
+        """
+        return coords
+
+
+class DistanceSimplifier(StrokeSimplifier):
+    """
+    Drops points closer than the tolerance to the last point kept.
+    """
+
+    def accept(self, last_point, point):
+        return (hypot(point[0] - last_point[0], point[1] - last_point[1])
+                    >= self.tolerance)
+
+
+class RDPSimplifier(StrokeSimplifier):
+    """
+    Reduces completed strokes with the Ramer-Douglas-Peucker algorithm,
+    keeping the points that are farther than the tolerance from the
+    simplified line.
+
+    Strokes are sent in batches of points while they are drawn, so each
+    batch is reduced on its own rather than the finished stroke.  The end
+    points of a batch are always kept, so the reduced pieces still join
+    up, and every dropped point is within the tolerance of its own piece.
+    A batch boundary can keep a point the whole stroke would have dropped.
+    """
+
+    def simplify(self, coords):
+        points = list(zip(coords[::2], coords[1::2]))
+        if len(points) < 3:
+            return coords
+
+        kept = [False] * len(points)
+        kept[0] = kept[-1] = True
+        spans = [(0, len(points) - 1)]
+        while spans:
+            first, last = spans.pop()
+            index, distance = self._farthest_point(points, first, last)
+            if distance > self.tolerance:
+                kept[index] = True
+                spans.append((first, index))
+                spans.append((index, last))
+
+        return [coord for point, keep in zip(points, kept) if keep
+                    for coord in point]
+
+    @staticmethod
+    def _farthest_point(points, first, last):
+        """
+        Return the index of the point between first and last that is
+        farthest from the line through them, and its distance.
+        """
+        x1, y1 = points[first]
+        x2, y2 = points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = hypot(dx, dy)
+
+        farthest, max_distance = first, 0
+        for index in range(first + 1, last):
+            x, y = points[index]
+            if length == 0:
+                distance = hypot(x - x1, y - y1)
+            else:
+                distance = abs(dy * x - dx * y + x2 * y1 - y2 * x1) / length
+            if distance > max_distance:
+                farthest, max_distance = index, distance
+        return farthest, max_distance
+
+
+SIMPLIFIERS = {
+    "none" : StrokeSimplifier,
+    "distance" : DistanceSimplifier,
+    "rdp" : RDPSimplifier
+    }
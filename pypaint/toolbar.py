@@ -32,6 +32,7 @@ class Toolbar(View):
                                 to = self.application_state.THICKNESS_MAX)
 
         self.undo_button = Button(self, text = str(DrawingType.UNDO))
+        self.redo_button = Button(self, text = str(DrawingType.REDO))
         self.clear_button = Button(self, text = str(DrawingType.CLEAR))
 
     def _arrange_widgets(self):
@@ -43,6 +44,7 @@ class Toolbar(View):
         self.thickness_scale.pack()
 
         self.clear_button.pack(side = BOTTOM)
+        self.redo_button.pack(side = BOTTOM)
         self.undo_button.pack(side = BOTTOM)
 
     def _bind_actions(self):
@@ -53,6 +55,7 @@ class Toolbar(View):
         self.thickness_scale["command"] = self._thickness_callback
 
         self.undo_button["command"] = self.controller.create_undo
+        self.redo_button["command"] = self.controller.create_redo
         self.clear_button["command"] = self.controller.create_clear
 
     def _thickness_callback(self, thickness_value):
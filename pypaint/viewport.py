@@ -0,0 +1,77 @@
+from collections        import OrderedDict
+
+from .spatial_index     import SpatialIndex
+
+
+class TiledViewport:
+    """
+    Tracks which tiles of the drawing history are materialized as canvas
+    items, loading the tiles around the visible region as it moves and
+    evicting the least recently visible ones past a budget.
+
+    Tiles are loaded and unloaded through the callbacks, a batch at a time,
+    so the cost of a pan or zoom depends on what comes into view rather
+    than on the size of the history.
+    """
+
+    MARGIN = 128            # drawing pixels loaded around the visible area
+    TILE_BUDGET = 48        # tiles kept loaded, if not all visible
+
+    ZOOM_MIN = 0.125
+    ZOOM_MAX = 8
+
+    def __init__(self, tile_size, load_tiles, unload_tiles,
+                    margin = MARGIN, tile_budget = TILE_BUDGET):
+        self.tile_size = tile_size
+        self.load_tiles = load_tiles
+        self.unload_tiles = unload_tiles
+        self.margin = margin
+        self.tile_budget = tile_budget
+        self.resident = OrderedDict()   # least recently visible first
+
+    def update(self, visible_box):
+        """
+        Load the tiles around the visible (x1, y1, x2, y2) region that are
+        not loaded yet, then evict the least recently visible tiles until
+        the budget is met, returning the tiles loaded and evicted.
+
+        The visible tiles are never evicted, however many of them there are.
+        """
+        x1, y1, x2, y2 = visible_box
+        wanted = SpatialIndex.cells_for((x1 - self.margin, y1 - self.margin,
+                                        x2 + self.margin, y2 + self.margin),
+                                        self.tile_size)
+        loaded = [tile for tile in wanted if tile not in self.resident]
+        for tile in wanted:
+            self.resident[tile] = True
+            self.resident.move_to_end(tile)
+
+        evicted = []
+        while len(self.resident) > max(self.tile_budget, len(wanted)):
+            evicted.append(self.resident.popitem(last = False)[0])
+
+        if evicted:
+            self.unload_tiles(evicted)
+        if loaded:
+            self.load_tiles(loaded)
+        return loaded, evicted
+
+    def is_resident(self, box):
+        """
+        Return whether any of the tiles the box overlaps are loaded.
+        """
+        return any(tile in self.resident
+                    for tile in SpatialIndex.cells_for(box, self.tile_size))
+
+    def reset(self):
+        """
+        Unload every tile, ready for the next update to load them again.
+        """
+        tiles = list(self.resident)
+        self.resident.clear()
+        if tiles:
+            self.unload_tiles(tiles)
+
+    @classmethod
+    def clamp_zoom(cls, zoom):
+        return min(max(zoom, cls.ZOOM_MIN), cls.ZOOM_MAX)
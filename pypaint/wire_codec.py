@@ -0,0 +1,284 @@
+from logging            import DEBUG, getLogger
+from struct             import Struct
+from time               import perf_counter
+from zlib               import compress, decompressobj
+from zlib               import error as zlib_error
+
+from .drawing           import Drawing
+from .drawing_decoder   import DrawingDecoder
+from .drawing_type      import DrawingType
+from .metrics           import METRICS
+
+
+class WireCodec(DrawingDecoder):
+    """
+    Encodes batches of drawings for the network connection and decodes the
+    data received from it.
+
+    Once the peer has shown it understands frames, by sending one, each
+    batch is sent as a single zlib compressed frame.  Inside a frame colors
+    are coded against a table built up over the frame, and coords are
+    zigzag varint deltas from the previous point.  Until then batches are
+    sent as raw encoded drawings in the form older peers still understand,
+    without op ids or anything else they would fail to decode.
+    Received data may hold either, split anywhere across reads, and is
+    decoded incrementally as a DrawingDecoder.
+
+    The offer sent on connecting is a raw ping with no color, far off the
+    canvas, which an older peer draws as nothing and keeps out of its
+    history, rather than something it fails to decode along with whatever
+    follows it in the same read.  A frame header with an empty payload is
+    still taken as an offer too.
+    """
+
+    OFFER_COORDS = (-1 << 30, 0x50460001, 0, 0)
+
+    # the first byte cannot start a raw drawing, whose shape value is small
+    FRAME_MAGIC = b"\xfePF\x01"
+    FRAME_HEADER_STRUCT = Struct("<4sI")
+    COMPRESSION_LEVEL = 6
+
+    # bytes a frame, or a raw drawing's payload, can hold and a frame can 
+    # decompress to, past which the peer is taken to be broken or hostile 
+    # rather than buffered for
+    MAX_FRAME_PAYLOAD = 16 << 20
+    MAX_FRAME_RAW = 64 << 20
+
+    DECODE_ERRORS = DrawingDecoder.DECODE_ERRORS + (zlib_error,)
+
+    def reset(self):
+        super().reset()
+        self.peer_framed = False
+
+    def offer(self):
+        """
+        Return the record announcing that this side understands frames.
+        """
+        return Drawing(DrawingType.PING, 0, "", self.OFFER_COORDS).encode()
+
+    def encode(self, drawings):
+        """
+        Return the bytes to send for the batch of drawings.
+        """
+        if not METRICS.enabled:
+            return self._encode(drawings)
+        begin = perf_counter()
+        data = self._encode(drawings)
+        METRICS.observe("encode_ms", 1000 * (perf_counter() - begin))
+        METRICS.count("encoded_bytes", len(data))
+        METRICS.count("encoded_drawings", len(drawings))
+        for drawing in drawings:
+            METRICS.stop_timer(drawing, "send_wait_ms")
+        return data
+
+    def _encode(self, drawings):
+        if not self.peer_framed:
+            return b''.join(encoded_drawing for encoded_drawing in
+                                (drawing.encode() for drawing in 
+                                    map(self.legacy_drawing, drawings)
+                                    if drawing is not None)
+                            if encoded_drawing is not None)
+
+        payload = compress(self.encode_payload(drawings),
+                            self.COMPRESSION_LEVEL)
+        logger = getLogger(__name__)
+        if logger.isEnabledFor(DEBUG):
+            raw_length = sum(len(drawing.encode() or b'')
+                                for drawing in drawings)
+            logger.debug("Framed {} drawings, {} bytes raw, {} bytes "
+                            "framed, ratio {:.2f}".format(len(drawings),
+                                raw_length, len(payload),
+                                raw_length / max(1, len(payload))))
+        return (self.FRAME_HEADER_STRUCT.pack(self.FRAME_MAGIC, len(payload))
+                    + payload)
+
+    @staticmethod
+    def legacy_drawing(drawing):
+        """
+        Return the drawing as a peer that predates frames would decode it, 
+        or None if it would not understand it at all.
+
+        Such a peer gives up on the rest of a read after a shape value it 
+        does not know, so op ids are stripped, previews and redos are left 
+        out, and an undo goes as a plain one, removing its last drawing.
+        """
+        if drawing.preview or drawing.shape is DrawingType.REDO:
+            return None
+        if drawing.author:
+            return Drawing(drawing.shape, drawing.thickness, drawing.color, 
+                            drawing.coords, drawing.text)
+        return drawing
+
+    def decode(self, data):
+        if not METRICS.enabled:
+            return super().decode(data)
+        begin = perf_counter()
+        drawings = super().decode(data)
+        METRICS.observe("decode_ms", 1000 * (perf_counter() - begin))
+        METRICS.count("decoded_bytes", len(data))
+        METRICS.count("decoded_drawings", len(drawings))
+        return drawings
+
+    def _record_length(self, buffer, offset):
+        if offset < len(buffer) and buffer[offset] == self.FRAME_MAGIC[0]:
+            return self._frame_length(buffer, offset)
+        length = super()._record_length(buffer, offset)
+        if length is None and len(buffer) - offset >= Drawing.MSG_SIZE:
+            payload_length, = Drawing.PAYLOAD_LENGTH_STRUCT.unpack_from(
+                            buffer, offset + Drawing.PAYLOAD_LENGTH_OFFSET)
+            if payload_length > self.MAX_FRAME_PAYLOAD:
+                raise ValueError("drawing of {} bytes is too long".format(
+                                                            payload_length))
+        return length
+
+    def _decode_record(self, buffer, offset, length):
+        if buffer[offset] != self.FRAME_MAGIC[0]:
+            drawings = super()._decode_record(buffer, offset, length)
+            if not self._is_offer(drawings[0]):
+                return drawings
+            self.peer_framed = True
+            return ()
+        self.peer_framed = True
+        start = offset + self.FRAME_HEADER_STRUCT.size
+        if start == offset + length:    # an offer
+            return ()
+        decompressor = decompressobj()
+        with memoryview(buffer) as view:
+            payload = decompressor.decompress(view[start:offset + length], 
+                                                self.MAX_FRAME_RAW)
+        if decompressor.unconsumed_tail:
+            raise ValueError("frame decompresses past {} bytes".format(
+                                                        self.MAX_FRAME_RAW))
+        return self.decode_payload(payload)
+
+    def _is_offer(self, drawing):
+        return (drawing.shape is DrawingType.PING and not drawing.color 
+                and tuple(drawing.coords) == self.OFFER_COORDS)
+
+    def _frame_length(self, buffer, offset):
+        """
+        Return the length of the frame at the offset, or None if the buffer
+        does not hold all of it yet.
+
+        Raises a ValueError for a frame too long to wait for.
+        """
+        if len(buffer) - offset < self.FRAME_HEADER_STRUCT.size:
+            return None
+        magic, payload_length = self.FRAME_HEADER_STRUCT.unpack_from(buffer,
+                                                                    offset)
+        if magic != self.FRAME_MAGIC:
+            raise ValueError("bad frame magic {}".format(magic))
+        if payload_length > self.MAX_FRAME_PAYLOAD:
+            raise ValueError("frame of {} bytes is too long".format(
+                                                            payload_length))
+        length = self.FRAME_HEADER_STRUCT.size + payload_length
+        return length if len(buffer) - offset >= length else None
+
+    @staticmethod
+    def encode_payload(drawings):
+        """
+        Return the compact, uncompressed encoding of the drawings.
+        """
+        out = bytearray()
+        colors = {}
+        last_x = last_y = 0
+        for drawing in drawings:
+            WireCodec._write_varint(out, drawing.shape_value)
+            if drawing.author:
+                WireCodec._write_varint(out, drawing.author)
+                WireCodec._write_varint(out, drawing.seq)
+            WireCodec._write_varint(out, drawing.thickness)
+            if drawing.color in colors:
+                WireCodec._write_varint(out, colors[drawing.color])
+            else:
+                color = drawing.color.encode()
+                WireCodec._write_varint(out, len(colors))
+                WireCodec._write_varint(out, len(color))
+                out += color
+                colors[drawing.color] = len(colors)
+
+            coords = drawing.coords
+            WireCodec._write_varint(out, len(coords))
+            for i in range(0, len(coords) - 1, 2):
+                x, y = coords[i], coords[i + 1]
+                WireCodec._write_varint(out, WireCodec._zigzag(x - last_x))
+                WireCodec._write_varint(out, WireCodec._zigzag(y - last_y))
+                last_x, last_y = x, y
+
+            if drawing.text is None:
+                WireCodec._write_varint(out, 0)
+            else:
+                text = drawing.text.encode()
+                WireCodec._write_varint(out, len(text) + 1)
+                out += text
+        return bytes(out)
+
+    @staticmethod
+    def decode_payload(payload):
+        """
+        Return the drawings in the compact encoding.
+        """
+        drawings = []
+        colors = []
+        last_x = last_y = 0
+        i = 0
+        while i < len(payload):
+            shape_val, i = WireCodec._read_varint(payload, i)
+            shape, flags = Drawing.split_shape_value(shape_val)
+            op_id = None
+            if flags & Drawing.OP_ID_FLAG:
+                author, i = WireCodec._read_varint(payload, i)
+                seq, i = WireCodec._read_varint(payload, i)
+                op_id = author, seq
+            thickness, i = WireCodec._read_varint(payload, i)
+            color_index, i = WireCodec._read_varint(payload, i)
+            if color_index == len(colors):
+                color_length, i = WireCodec._read_varint(payload, i)
+                colors.append(bytes(payload[i:i + color_length]).decode())
+                i += color_length
+
+            coord_count, i = WireCodec._read_varint(payload, i)
+            coords = []
+            for _ in range(coord_count // 2):
+                dx, i = WireCodec._read_varint(payload, i)
+                dy, i = WireCodec._read_varint(payload, i)
+                last_x += WireCodec._unzigzag(dx)
+                last_y += WireCodec._unzigzag(dy)
+                coords.extend((last_x, last_y))
+
+            text_length, i = WireCodec._read_varint(payload, i)
+            text = None
+            if text_length > 0:
+                text = bytes(payload[i:i + text_length - 1]).decode()
+                i += text_length - 1
+            drawings.append(Drawing(shape, thickness, colors[color_index], 
+                                    coords, text, 
+                                    bool(flags & Drawing.PREVIEW_FLAG), 
+                                    op_id))
+        return drawings
+
+    @staticmethod
+    def _write_varint(out, value):
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    @staticmethod
+    def _read_varint(data, i):
+        value = shift = 0
+        while True:
+            byte = data[i]
+            i += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, i
+            shift += 7
+
+    @staticmethod
+    def _zigzag(value):
+        return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+    @staticmethod
+    def _unzigzag(value):
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
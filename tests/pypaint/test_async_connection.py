@@ -0,0 +1,110 @@
+from select                    import select
+from socket                    import AF_INET, create_connection
+from time                      import monotonic
+from types                     import SimpleNamespace
+from unittest                  import TestCase
+from unittest.mock             import MagicMock
+
+from pypaint.async_connection  import AsyncConnComponent
+from pypaint.drawing           import Drawing
+from pypaint.drawing_type      import DrawingType
+from pypaint.wire_codec        import WireCodec
+
+
+class TestAsyncConnComponent(TestCase):
+
+    def setUp(self):
+        self.received = bytearray()
+        self.controller = SimpleNamespace(
+                                process_received_data = self.received.extend,
+                                disconnect = MagicMock())
+        self.state = SimpleNamespace(send_active = False)
+        self.component = AsyncConnComponent(self.controller, 0, self.state,
+                                            WireCodec(), flush_interval = 5,
+                                            flush_size = 100)
+        self.component.host()
+        self.address = next(sock.getsockname()
+                                for sock in self.component.server.sockets
+                                if sock.family == AF_INET)
+        self.peer = create_connection(self.address)
+        self.peer.settimeout(1)
+        self.peer_codec = WireCodec()
+        self._step_until(lambda: self.component.transport is not None)
+        self.drawings = [Drawing(DrawingType.LINE, 1, "#000000",
+                                    [i, i, i + 1, i + 1])
+                            for i in range(3)]
+
+    def tearDown(self):
+        self.peer.close()
+        self.component.stop()
+
+    def _step_until(self, condition):
+        deadline = monotonic() + 1
+        while not condition():
+            self.assertLess(monotonic(), deadline)
+            self.component._step_loop()
+
+    def _peer_receive(self, count):
+        drawings = []
+        while len(drawings) < count:
+            self._step_until(lambda: select([self.peer], [], [], 0)[0])
+            drawings.extend(self.peer_codec.decode(self.peer.recv(1 << 16)))
+        return drawings
+
+    def test_connecting_offers_frames(self):
+        self.assertTrue(self.state.send_active)
+        self.assertEqual([], self.peer_codec.decode(self.peer.recv(1 << 16)))
+        self.assertTrue(self.peer_codec.peer_framed)
+
+    def test_drawings_put_are_sent_as_one_batch(self):
+        self.peer.sendall(self.peer_codec.offer())
+        self._step_until(lambda: self.received)
+        for drawing in self.drawings:
+            self.component.send(drawing)
+        self.assertEqual(self.drawings, self._peer_receive(3))
+
+    def test_received_data_passed_to_controller(self):
+        data = self.peer_codec.encode(self.drawings)
+        self.peer.sendall(data)
+        self._step_until(lambda: len(self.received) == len(data))
+        self.assertEqual(data, self.received)
+
+    def test_second_connection_refused(self):
+        other = create_connection(self.address)
+        other.settimeout(1)
+        self._step_until(lambda: select([other], [], [], 0)[0])
+        self.assertEqual(b'', other.recv(1 << 16))
+        other.close()
+        self.controller.disconnect.assert_not_called()
+
+    def test_peer_closing_disconnects(self):
+        self.peer.close()
+        self._step_until(lambda: self.component.transport is None)
+        self.controller.disconnect.assert_called_once_with()
+
+    def test_bad_port_reported(self):
+        with self.assertLogs("pypaint.async_connection", "WARNING"):
+            self.component.connect("localhost:abc")
+        with self.assertLogs("pypaint.async_connection", "WARNING"):
+            self.component.connect("localhost:70000")
+
+    def test_hosting_on_a_used_port_reported(self):
+        other = AsyncConnComponent(self.controller, self.address[1], 
+                                    self.state, WireCodec())
+        try:
+            with self.assertLogs("pypaint.async_connection", "WARNING"):
+                other.host()
+            self.assertIsNone(other.server)
+        finally:
+            other.stop()
+
+    def test_slow_peer_dropped(self):
+        self.component.PENDING_LIMIT = 3
+        self.component.paused = True    # as if the peer stopped reading
+        with self.assertLogs("pypaint.async_connection", "WARNING"):
+            for drawing in self.drawings:
+                self.component.send(drawing)
+        self.assertEqual([], self.component.pending)
+        self._step_until(lambda: self.component.transport is None)
+        self.controller.disconnect.assert_called_once_with()
+
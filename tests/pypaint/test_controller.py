@@ -2,6 +2,7 @@ from unittest               import TestCase
 from unittest.mock          import MagicMock
 
 from pypaint.controller     import Controller
+from pypaint.drawing        import Drawing
 from pypaint.drawing_type   import DrawingType
 from pypaint.paint_state    import PaintState
 from pypaint.paint_view     import PaintView
@@ -65,3 +66,67 @@ class TestController(TestCase):
                 self.test_event.type = event_type
                 self.state.current_type = drawing_mode
                 self.controller.handle_event(self.test_event)
+
+    def test_stroke_creates_single_drawing(self):
+        self.state.start_pos = self.default_pos
+        self.test_event.type = Controller.MOTION
+        for x in range(2, 6):
+            self.test_event.x = x
+            self.controller.handle_event(self.test_event)
+        self.test_event.type = Controller.BUTTON_RELEASE
+        self.controller.handle_event(self.test_event)
+
+        drawing = self.state.draw_queue.get_nowait()
+        self.assertEqual([1, 1, 2, 3, 3, 3, 4, 3, 5, 3], drawing.coords)
+        self.assertTrue(self.state.draw_queue.empty())
+
+    def test_drag_creates_single_drawing_on_release(self):
+        self.controller.window.current_view = MagicMock()
+        self.state.start_pos = self.default_pos
+        self.state.current_type = DrawingType.RECT
+        self.test_event.type = Controller.MOTION
+        for x in range(2, 6):
+            self.test_event.x = x
+            self.controller.handle_event(self.test_event)
+        self.assertTrue(self.state.draw_queue.empty())
+        self.assertEqual(4, 
+                        self.controller.current_view.show_preview.call_count)
+
+        self.test_event.type = Controller.BUTTON_RELEASE
+        self.controller.handle_event(self.test_event)
+        drawing = self.state.draw_queue.get_nowait()
+        self.assertEqual([1, 1, 5, 3], list(drawing.coords))
+        self.assertTrue(self.state.draw_queue.empty())
+        self.controller.current_view.clear_preview.assert_called_once()
+
+    def test_drag_previews_sent_at_limited_rate(self):
+        self.controller.window.current_view = MagicMock()
+        self.controller.remote_preview_interval = 60
+        self.state.send_active = True
+        self.state.start_pos = self.default_pos
+        self.state.current_type = DrawingType.LINE
+        self.test_event.type = Controller.MOTION
+        for x in range(2, 6):
+            self.test_event.x = x
+            self.controller.handle_event(self.test_event)
+        self.test_event.type = Controller.BUTTON_RELEASE
+        self.controller.handle_event(self.test_event)
+
+        sent = [self.state.send_queue.get_nowait() for _ in range(3)]
+        self.assertEqual([True, False, True], 
+                            [drawing.preview for drawing in sent])
+        self.assertIs(DrawingType.CLEAR, sent[2].shape)
+        self.assertTrue(self.state.send_queue.empty())
+
+    def test_peer_behind_sent_whole_history(self):
+        line = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 5, 5])
+        self.state.add_last_drawing(line)
+        self.state.send_active = True
+        self.state.send_behind = True
+        self.controller._resync_if_behind()
+
+        self.assertFalse(self.state.send_behind)
+        reply = self.state.send_queue.get_nowait()
+        self.assertIs(DrawingType.CLEAR, reply[0].shape)
+        self.assertEqual([line], reply[1:])
+
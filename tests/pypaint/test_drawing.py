@@ -9,6 +9,8 @@ class TestDrawing(TestCase):
     def setUp(self):
         self.drawing = Drawing(DrawingType.RECT, 0, "#000000", [0, 0, 1, 1])
         self.text_drawing = Drawing(DrawingType.TEXT, 0, "#000000", [0, 0, 0, 0], "testing")
+        self.stroke_drawing = Drawing(DrawingType.PEN, 2, "#000000", 
+                                        [0, 0, 1, 1, 2, 3, 5, 8, 13, 21])
 
     def test_encoding_decoding_are_equal(self):
         bytes_array = self.drawing.encode()
@@ -27,3 +29,68 @@ class TestDrawing(TestCase):
         decoded, decoded_length = Drawing.decode_drawing(bytes_array)
         self.assertEqual(len(bytes_array), decoded_length)
         self.assertEqual(self.text_drawing, decoded)
+
+    def test_decoding_text_between_drawings(self):
+        drawings = [self.drawing, self.text_drawing, self.drawing]
+        bytes_array = b''.join(drawing.encode() for drawing in drawings)
+        self.assertEqual(drawings, Drawing.decode_drawings(bytes_array))
+
+    def test_decoding_keeps_drawings_before_truncation(self):
+        bytes_array = self.drawing.encode() + self.text_drawing.encode()
+        decoded = Drawing.decode_drawings(bytes_array[:-1])
+        self.assertEqual([self.drawing], decoded)
+
+    def test_decoding_memoryview(self):
+        bytes_array = bytearray(self.drawing.encode() * 3)
+        decoded = Drawing.decode_drawings(memoryview(bytes_array))
+        self.assertEqual([self.drawing] * 3, decoded)
+
+    def test_decoding_stroke(self):
+        bytes_array = self.stroke_drawing.encode()
+        decoded, decoded_length = Drawing.decode_drawing(bytes_array)
+        self.assertEqual(len(bytes_array), decoded_length)
+        self.assertEqual(self.stroke_drawing, decoded)
+
+    def test_decoding_strokes_between_drawings(self):
+        drawings = [self.stroke_drawing, self.drawing, self.stroke_drawing]
+        bytes_array = b''.join(drawing.encode() for drawing in drawings)
+        self.assertEqual(drawings, Drawing.decode_drawings(bytes_array))
+
+    def test_decoding_preview(self):
+        preview = Drawing(DrawingType.RECT, 1, "#000000", [0, 0, 5, 5], 
+                            preview = True)
+        decoded = Drawing.decode_drawings(preview.encode())
+        self.assertEqual([preview], decoded)
+        self.assertTrue(decoded[0].preview)
+        self.assertNotEqual(self.drawing, Drawing.decode_drawings(
+                        Drawing(DrawingType.RECT, 0, "#000000", [0, 0, 1, 1], 
+                                preview = True).encode())[0])
+
+    def test_decoding_op_id(self):
+        drawing = Drawing(DrawingType.TEXT, 1, "#000000", [1, 2, 0, 0], 
+                            "testing", op_id = (7, 3))
+        undo = Drawing(DrawingType.UNDO, 0, "", [0, 0, 0, 0], op_id = (7, 3))
+        decoded = Drawing.decode_drawings(drawing.encode() + undo.encode())
+        self.assertEqual([drawing, undo], decoded)
+        self.assertEqual((7, 3), decoded[1].op_id)
+        self.assertIsNone(self.drawing.op_id)
+
+    def test_decoding_preview_author(self):
+        preview = Drawing(DrawingType.CLEAR, 0, "", [0, 0, 0, 0], 
+                            preview = True, op_id = (7, 0))
+        decoded = Drawing.decode_drawings(preview.encode())[0]
+        self.assertTrue(decoded.preview)
+        self.assertEqual(7, decoded.author)
+
+    def test_is_near_follows_outline(self):
+        line = Drawing(DrawingType.LINE, 2, "#000000", [0, 0, 10, 0])
+        self.assertTrue(line.is_near(5, 2, 1))
+        self.assertFalse(line.is_near(5, 3, 1))
+        self.assertTrue(line.is_near(11, 0, 0))
+
+        rect = Drawing(DrawingType.RECT, 1, "#000000", [10, 10, 0, 0])
+        self.assertTrue(rect.is_near(10, 5, 0))
+        self.assertFalse(rect.is_near(5, 5, 1))
+        oval = Drawing(DrawingType.OVAL, 1, "#000000", [0, 0, 20, 10])
+        self.assertTrue(oval.is_near(20, 5, 1))
+        self.assertFalse(oval.is_near(10, 5, 1))
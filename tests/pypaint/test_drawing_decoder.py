@@ -0,0 +1,70 @@
+from io                         import BytesIO
+from random                     import Random
+from unittest                   import TestCase
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_decoder    import DrawingDecoder
+from pypaint.drawing_type       import DrawingType
+
+
+class TestDrawingDecoder(TestCase):
+    
+    def setUp(self):
+        self.decoder = DrawingDecoder()
+        self.drawings = [
+            Drawing(DrawingType.RECT, 0, "#000000", [0, 0, 1, 1]),
+            Drawing(DrawingType.TEXT, 0, "#000000", [0, 0, 0, 0], "testing"),
+            Drawing(DrawingType.PEN, 2, "#000000", 
+                    [0, 0, 1, 1, 2, 3, 5, 8, 13, 21])
+        ] * 20
+        self.data = b''.join(drawing.encode() for drawing in self.drawings)
+
+    def _decode_pieces(self, pieces):
+        drawings = []
+        for piece in pieces:
+            drawings.extend(self.decoder.decode(piece))
+        return drawings
+
+    def test_decoding_byte_at_a_time(self):
+        pieces = [self.data[i:i + 1] for i in range(len(self.data))]
+        self.assertEqual(self.drawings, self._decode_pieces(pieces))
+        self.assertEqual(0, len(self.decoder))
+
+    def test_decoding_random_fragments(self):
+        random = Random(2423)
+        for _ in range(50):
+            cuts = sorted(random.sample(range(1, len(self.data)), 
+                                        random.randint(1, 40)))
+            pieces = [self.data[i:j] for i, j 
+                        in zip([0] + cuts, cuts + [len(self.data)])]
+            self.assertEqual(self.drawings, self._decode_pieces(pieces))
+
+    def test_partial_record_kept_for_next_feed(self):
+        first = self.drawings[0].encode()
+        self.assertEqual([], self.decoder.decode(first[:-1]))
+        self.assertEqual(len(first) - 1, len(self.decoder))
+        self.assertEqual([self.drawings[0]], self.decoder.decode(first[-1:]))
+
+    def test_buffer_reclaimed_after_reading(self):
+        self.decoder.COMPACT_SIZE = 64
+        for _ in range(100):
+            self.decoder.decode(self.data)
+        self.assertLess(len(self.decoder.buffer), 2 * len(self.data))
+
+    def test_bad_data_dropped(self):
+        bad_data = Drawing.MSG_STRUCT.pack(99, 0, b"", 0, 0, 0, 0, 0)
+        self.assertEqual([], self.decoder.decode(bad_data + self.data))
+        self.assertTrue(self.decoder.failed)
+        self.assertEqual(0, len(self.decoder))
+
+    def test_stream_decodes_at_any_chunk_size(self):
+        for chunk_size in [1, 7, 64, 4096]:
+            stream = BytesIO(self.data)
+            self.assertEqual(self.drawings, 
+                                list(DrawingDecoder.decode_stream(stream, 
+                                                                chunk_size)))
+
+    def test_decoding_stream_keeps_drawings_before_truncation(self):
+        stream = BytesIO(self.data[:-1])
+        self.assertEqual(self.drawings[:-1], 
+                            list(DrawingDecoder.decode_stream(stream, 16)))
@@ -0,0 +1,70 @@
+from tempfile               import TemporaryFile
+from unittest               import TestCase
+
+from pypaint.drawing        import Drawing
+from pypaint.drawing_file   import DrawingFile
+from pypaint.drawing_type   import DrawingType
+
+
+class TestDrawingFile(TestCase):
+    
+    def setUp(self):
+        self.drawings = [Drawing(DrawingType.PEN, 1, "#000000", 
+                                    [i, i, i + 1, i + 1, i + 2, i])
+                            for i in range(200)]
+        self.drawings.append(Drawing(DrawingType.TEXT, 2, "#00ff00", 
+                                        [5, 5, 0, 0], "testing"))
+        self.file = TemporaryFile()
+        self.block_size = DrawingFile.BLOCK_SIZE
+        DrawingFile.BLOCK_SIZE = 1024
+
+    def tearDown(self):
+        DrawingFile.BLOCK_SIZE = self.block_size
+        self.file.close()
+
+    def test_write_read_are_equal(self):
+        DrawingFile.write(self.file, self.drawings)
+        self.assertTrue(DrawingFile.is_v2(self.file))
+        self.assertEqual(self.drawings, list(DrawingFile.read(self.file)))
+
+    def test_snapshot_blocks_are_flagged(self):
+        DrawingFile.write(self.file, self.drawings, 30)
+        index = DrawingFile.read_index(self.file)
+        snapshot_end = DrawingFile.snapshot_end(index)
+        self.assertEqual(30, sum(block.record_count 
+                                    for block in index[:snapshot_end]))
+        self.assertEqual(self.drawings[30:], 
+                            list(DrawingFile.read(self.file, snapshot_end)))
+
+    def test_corrupt_block_is_skipped(self):
+        DrawingFile.write(self.file, self.drawings, compressed = False)
+        index = DrawingFile.read_index(self.file)
+        self.file.seek(index[0].offset + DrawingFile.BLOCK_STRUCT.size + 3)
+        self.file.write(b"\xff")
+
+        skipped = index[0].record_count
+        self.assertEqual(self.drawings[skipped:], 
+                            list(DrawingFile.read(self.file)))
+
+    def test_missing_index_is_rebuilt(self):
+        DrawingFile.write(self.file, self.drawings)
+        self.file.seek(-1, 2)
+        self.file.write(b"\x00")
+        self.assertEqual(self.drawings, list(DrawingFile.read(self.file)))
+
+    def test_scan_stops_at_index(self):
+        DrawingFile.write(self.file, self.drawings)
+        index = DrawingFile.read_index(self.file)
+        self.file.seek(-DrawingFile.TRAILER_STRUCT.size + 8, 2)
+        self.file.write(b"\xff\xff\xff\x00")     # a block count past the end
+        self.assertEqual(index, DrawingFile.read_index(self.file))
+
+        self.file.seek(-1, 2)
+        self.file.write(b"\x00")
+        self.assertEqual(index, DrawingFile.read_index(self.file))
+
+    def test_raw_file_is_read(self):
+        self.file.write(b''.join(drawing.encode() 
+                                    for drawing in self.drawings))
+        self.assertFalse(DrawingFile.is_v2(self.file))
+        self.assertEqual(self.drawings, list(DrawingFile.read(self.file)))
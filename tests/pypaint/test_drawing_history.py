@@ -0,0 +1,296 @@
+from unittest                   import TestCase
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_history    import DrawingHistory
+from pypaint.drawing_type       import DrawingType
+
+
+class TestDrawingHistory(TestCase):
+    
+    def setUp(self):
+        self.history = DrawingHistory()
+        self.drawings = [
+            Drawing(DrawingType.PEN, 2, "#12ab34", [0, 0, 5, 5]),
+            Drawing(DrawingType.TEXT, 1, "#000000", [3, 4, 0, 0], "testing"),
+            Drawing(DrawingType.RECT, 3, "red", [1, 2, 3, 4])
+        ]
+        for drawing in self.drawings:
+            self.history.append(drawing)
+
+    def test_iterating_returns_appended_drawings(self):
+        self.assertEqual(self.drawings, list(self.history))
+        self.assertEqual("red", self.history[-1].color)
+
+    def test_pop_removes_last_drawing(self):
+        self.assertEqual(self.drawings[-1], self.history.pop()[0])
+        self.assertEqual(self.drawings[-2], self.history.pop()[0])
+        self.assertEqual(self.drawings[:1], list(self.history))
+
+    def test_append_after_pop(self):
+        self.history.pop()
+        self.history.pop()
+        self.history.append(self.drawings[2])
+        self.assertEqual([self.drawings[0], self.drawings[2]], 
+                            list(self.history))
+        self.assertIsNone(self.history[1].text)
+
+    def test_next_drawn_follows_items(self):
+        self.assertIsNone(self.history.next_drawn(0))
+        self.history.set_items(2, [7])
+        self.history.set_items(1, [8])
+        self.assertEqual(1, self.history.next_drawn(0))
+        self.assertEqual(2, self.history.next_drawn(1))
+        self.history.set_items(1, ())
+        self.assertEqual(2, self.history.next_drawn(0))
+        self.history.pop()
+        self.assertIsNone(self.history.next_drawn(0))
+
+    def test_pop_returns_items(self):
+        self.history.append(self.drawings[0], [7])
+        self.assertEqual((self.drawings[0], [7]), self.history.pop())
+        self.assertEqual((self.drawings[2], []), self.history.pop())
+
+    def test_clear_empties_history(self):
+        self.history.clear()
+        self.assertFalse(self.history)
+        self.assertRaises(IndexError, self.history.pop)
+
+    def test_sync_start_of_prefix(self):
+        other = DrawingHistory()
+        other.append(self.drawings[0])
+        self.assertEqual(1, self.history.sync_start(*other.sync_token()))
+        self.assertEqual(self.drawings[1:], 
+                            list(self.history.drawings_from(1)))
+
+    def test_sync_start_of_diverged_history(self):
+        other = DrawingHistory()
+        other.append(self.drawings[1])
+        self.assertEqual(0, self.history.sync_start(*other.sync_token()))
+
+    def test_sync_start_of_empty_history(self):
+        self.assertEqual(0, self.history.sync_start(
+                                            *DrawingHistory().sync_token()))
+
+    def test_sync_token_follows_pop(self):
+        token = self.history.sync_token()
+        self.history.append(self.drawings[0])
+        self.history.pop()
+        self.assertEqual(token, self.history.sync_token())
+        self.assertEqual(3, self.history.sync_start(*token))
+
+    def test_compact_joins_continuing_strokes(self):
+        history = DrawingHistory()
+        strokes = [Drawing(DrawingType.PEN, 1, "#000000", [0, 0, 1, 1]),
+                    Drawing(DrawingType.PEN, 1, "#000000", [1, 1, 2, 2, 3, 3]),
+                    Drawing(DrawingType.PEN, 2, "#000000", [3, 3, 4, 4]),
+                    Drawing(DrawingType.PEN, 1, "#000000", [4, 4, 5, 5])]
+        for i, stroke in enumerate(strokes):
+            history.append(stroke, [i + 1])
+        history.compact(1)
+
+        joined = Drawing(DrawingType.PEN, 1, "#000000", 
+                            [0, 0, 1, 1, 2, 2, 3, 3])
+        self.assertEqual([joined, strokes[2], strokes[3]], list(history))
+        self.assertEqual(2, history.snapshot_length)
+        self.assertEqual([[1, 2], [3], [4]], 
+                            [history.items(i) for i in range(len(history))])
+
+    def test_compact_joins_drawn_strokes_only(self):
+        history = DrawingHistory()
+        for i in range(4):
+            history.append(Drawing(DrawingType.PEN, 1, "#000000", 
+                                    [i, i, i + 1, i + 1]), 
+                            [i + 1] if i < 2 else [])
+        history.compact(0)
+        self.assertEqual([[0, 0, 1, 1, 2, 2], [2, 2, 3, 3, 4, 4]], 
+                            [drawing.coords for drawing in history])
+        self.assertEqual([[1, 2], []], [history.items(0), history.items(1)])
+
+    def _append_strokes(self, history, count):
+        for i in range(count):
+            history.append(Drawing(DrawingType.PEN, 1, "#000000", 
+                                    [i, i, i + 1, i + 1]))
+
+    def test_compact_keeps_sync_token(self):
+        history, prefix = DrawingHistory(), DrawingHistory()
+        self._append_strokes(history, 6)
+        self._append_strokes(prefix, 6)
+        for drawing in self.drawings[:2]:
+            history.append(drawing)
+            prefix.append(drawing)
+        history.append(self.drawings[2])
+        token = history.sync_token()
+        history.compact(1)
+
+        self.assertEqual(4, len(history))
+        self.assertEqual(token, history.sync_token())
+        self.assertEqual(3, history.sync_start(*prefix.sync_token()))
+
+    @staticmethod
+    def _apply(history, drawings):
+        for drawing in drawings:
+            if drawing.shape is DrawingType.CLEAR:
+                history.clear()
+            elif drawing.shape is DrawingType.SYNC:
+                history.set_position(*drawing.coords[:3])
+            elif drawing.shape is DrawingType.UNDO:
+                history.remove(drawing.op_id)
+            else:
+                history.append(drawing)
+
+    def test_sync_reply_marks_snapshot_position(self):
+        history = DrawingHistory()
+        self._append_strokes(history, 6)
+        history.append(self.drawings[0])
+        history.compact(1)
+        request = Drawing(DrawingType.SYNC, 0, "", 
+                            (0, 0, 0, DrawingHistory.SYNC_REQUEST))
+
+        other = DrawingHistory()
+        self._apply(other, history.sync_reply(request))
+        self.assertEqual(list(history), list(other))
+        self.assertEqual(history.sync_token(), other.sync_token())
+        for peer in (history, other):
+            peer.append(self.drawings[2])
+        self.assertEqual(history.sync_token(), other.sync_token())
+        self.assertEqual(len(history), 
+                            history.sync_start(*other.sync_token()))
+
+    def test_sync_reply_without_markers(self):
+        history = DrawingHistory()
+        self._append_strokes(history, 2)
+        history.compact(0)
+        self.assertEqual([DrawingType.CLEAR, DrawingType.PEN], 
+                            [drawing.shape for drawing in history.sync_reply(
+                                Drawing(DrawingType.SYNC, 0, "", 
+                                        (0, 0, 0, 0)))])
+
+    def test_pop_stops_at_snapshot(self):
+        self.history.compact(1)
+        self.history.pop()
+        self.assertFalse(self.history.undoable)
+        self.assertRaises(IndexError, self.history.pop)
+        self.assertEqual(self.drawings[:2], list(self.history))
+
+    def _append_ops(self, count):
+        drawings = [Drawing(DrawingType.LINE, 1, "#000000", [i, i, 5, 5], 
+                            op_id = (1, i + 1))
+                        for i in range(count)]
+        for i, drawing in enumerate(drawings):
+            self.history.append(drawing, [10 + i])
+        return drawings
+
+    def test_remove_leaves_other_drawings(self):
+        ops = self._append_ops(3)
+        self.assertEqual([10], self.history.remove((1, 1)))
+        self.assertEqual([], self.history.remove((1, 1)))
+        self.assertEqual(self.drawings + ops[1:], list(self.history))
+        self.assertEqual([11], self.history.items(4))
+        self.assertEqual(self.drawings + ops[1:], 
+                            list(self.history.drawings_from(0)))
+
+    def test_restore_puts_drawing_back(self):
+        ops = self._append_ops(3)
+        self.history.remove((1, 2))
+        self.assertEqual(ops[1], self.history.target(
+                        Drawing(DrawingType.REDO, 0, "", [0, 0, 0, 0], 
+                                op_id = (1, 2))))
+        self.history.restore((1, 2), [20, 21])
+        self.assertEqual(self.drawings + ops, list(self.history))
+        self.assertEqual([[10], [20, 21], [12]], 
+                            [self.history.items(i) for i in range(3, 6)])
+
+    def test_pop_skips_removed_drawings(self):
+        ops = self._append_ops(2)
+        self.history.remove((1, 2))
+        self.assertEqual((ops[0], [10]), self.history.pop())
+        self.history.restore((1, 2))
+        self.assertEqual(self.drawings, list(self.history))
+
+    def test_compact_drops_removed_drawings(self):
+        ops = self._append_ops(3)
+        self.history.remove((1, 1))
+        self.history.remove((1, 3))
+        self.history.compact(1)
+        self.assertEqual(self.drawings + [ops[1]], list(self.history))
+        self.assertEqual([], self.history.remove((1, 2)))
+        self.history.restore((1, 3))
+        self.assertEqual(self.drawings + ops[1:], list(self.history))
+
+    def _sync(self, other):
+        request = Drawing(DrawingType.SYNC, 0, "", 
+                            other.sync_token() 
+                                + (other.removed_digest(), 
+                                    DrawingHistory.SYNC_REQUEST))
+        reply = list(self.history.sync_reply(request))
+        self._apply(other, reply)
+        return reply
+
+    def test_sync_sends_removed_drawings_to_redo(self):
+        self._append_ops(3)
+        self.history.remove((1, 2))
+        other = DrawingHistory()
+        self._sync(other)
+        self.assertEqual(list(self.history), list(other))
+
+        for history in (self.history, other):
+            history.restore((1, 2))
+        self.assertEqual(list(self.history), list(other))
+        self.assertEqual(self.history.sync_token(), other.sync_token())
+        self.assertEqual(self.history.removed_digest(), 
+                            other.removed_digest())
+        self.assertEqual([], self._sync(other))
+
+    def test_sync_resends_after_undo(self):
+        ops = self._append_ops(3)
+        other = DrawingHistory()
+        self._sync(other)
+        self.history.remove((1, 3))
+        self.history.append(self.drawings[0])
+        reply = self._sync(other)
+        self.assertEqual(DrawingType.CLEAR, reply[0].shape)
+        self.assertEqual(self.drawings + ops[:2] + self.drawings[:1], 
+                            list(other))
+        self.assertEqual(self.history.removed_digest(), 
+                            other.removed_digest())
+
+    def test_removed_digest_survives_compaction(self):
+        self._append_ops(3)
+        self.history.remove((1, 1))
+        digest = self.history.removed_digest()
+        self.history.compact(1)
+        self.assertEqual(digest, self.history.removed_digest())
+        other = DrawingHistory()
+        self._sync(other)
+        self.assertEqual(list(self.history), list(other))
+        self.assertEqual(digest, other.removed_digest())
+        self.assertEqual(self.history.sync_token(), other.sync_token())
+
+    def test_tiles_hold_live_drawings(self):
+        far = Drawing(DrawingType.LINE, 1, "#000000", [2000, 0, 2010, 0], 
+                        op_id = (1, 1))
+        self.history.append(far)
+        tile = (2000 // DrawingHistory.TILE_SIZE, 0)
+        self.assertEqual({3}, set(self.history.tiles.cell_keys(tile)))
+        self.history.remove((1, 1))
+        self.assertEqual(set(), set(self.history.tiles.cell_keys(tile)))
+        self.history.restore((1, 1))
+        self.assertEqual({3}, set(self.history.tiles.cell_keys(tile)))
+        self.history.pop()
+        self.assertEqual({0, 1, 2}, set(self.history.tiles.cell_keys((0, 0))))
+        self.assertNotIn(3, self.history.tiles)
+
+    def test_undoable_in_skips_snapshot(self):
+        ops = self._append_ops(3)
+        box = (0, 0, 100, 100)
+        self.assertEqual([op.op_id for op in reversed(ops)], 
+                            self.history.undoable_in(box))
+        self.history.remove((1, 3))
+        self.assertEqual([(1, 2), (1, 1)], self.history.undoable_in(box))
+        self.history.compact(2)
+        self.assertEqual([(1, 2)], self.history.undoable_in(box))
+        self.assertEqual({(1, 2)}, {(self.history._authors[index], 
+                                        self.history._seqs[index])
+                                    for index in self.history._undoable.boxes})
+        self.history.restore((1, 3))
+        self.assertEqual([(1, 3), (1, 2)], self.history.undoable_in(box))
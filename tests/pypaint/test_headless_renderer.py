@@ -0,0 +1,105 @@
+from pathlib                    import Path
+from struct                     import unpack
+from tempfile                   import TemporaryDirectory
+from unittest                   import TestCase
+from unittest.mock              import patch
+from zlib                       import decompress
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_file       import DrawingFile
+from pypaint.drawing_type       import DrawingType
+from pypaint.export             import _export_job, export_files
+from pypaint.headless_renderer  import HeadlessRenderer
+
+
+BLACK = b"\x00\x00\x00"
+WHITE = b"\xff\xff\xff"
+
+
+class TestHeadlessRenderer(TestCase):
+
+    def setUp(self):
+        self.line = Drawing(DrawingType.LINE, 3, "#000000", [10, 10, 50, 10])
+        self.rect = Drawing(DrawingType.RECT, 1, "red", [60, 40, 20, 20])
+        self.oval = Drawing(DrawingType.OVAL, 2, "#00f", [0, 0, 40, 20])
+        self.text = Drawing(DrawingType.TEXT, 1, "#000000", [5, 5, 0, 0],
+                            "a < b")
+
+    def test_replay_applies_undo_and_clear(self):
+        undo = Drawing(DrawingType.UNDO, 0, "", [0, 0, 0, 0])
+        clear = Drawing(DrawingType.CLEAR, 0, "", [0, 0, 0, 0])
+        ping = Drawing(DrawingType.PING, 1, "#000000", [1, 1, 0, 0])
+        self.assertEqual([self.line], HeadlessRenderer.replay(
+                                [self.rect, clear, self.line, ping,
+                                    self.oval, undo]))
+
+    def test_line_is_drawn_with_its_thickness(self):
+        framebuffer = HeadlessRenderer.render_raster([self.line], 64, 32)
+        self.assertEqual(WHITE, framebuffer.pixel(30, 8))
+        self.assertEqual(BLACK, framebuffer.pixel(30, 9))
+        self.assertEqual(BLACK, framebuffer.pixel(30, 11))
+        self.assertEqual(WHITE, framebuffer.pixel(30, 12))
+        self.assertEqual(BLACK, framebuffer.pixel(51, 10))     # round cap
+        self.assertEqual(WHITE, framebuffer.pixel(55, 10))
+
+    def test_outlines_are_not_filled(self):
+        framebuffer = HeadlessRenderer.render_raster([self.rect, self.oval],
+                                                        80, 60)
+        self.assertEqual(b"\xff\x00\x00", framebuffer.pixel(20, 30))
+        self.assertEqual(WHITE, framebuffer.pixel(40, 30))
+        self.assertEqual(b"\x00\x00\xff", framebuffer.pixel(0, 10))
+        self.assertEqual(WHITE, framebuffer.pixel(20, 10))
+
+    def test_region_is_offset_and_clipped(self):
+        framebuffer = HeadlessRenderer.render_raster([self.line], 16, 16,
+                                                        40, 0)
+        self.assertEqual(BLACK, framebuffer.pixel(45, 10))
+        self.assertEqual(16 * 16 * 3, len(framebuffer.pixels))
+
+    def test_png_holds_the_raster(self):
+        framebuffer = HeadlessRenderer.render_raster([self.line], 64, 32)
+        png = framebuffer.encode_png()
+        self.assertTrue(png.startswith(b"\x89PNG\r\n\x1a\n"))
+        self.assertEqual((64, 32), unpack(">II", png[16:24]))
+        idat_length = unpack(">I", png[33:37])[0]
+        raw = decompress(png[41:41 + idat_length])
+        self.assertEqual(32 * (1 + 64 * 3), len(raw))
+
+    def test_svg_has_element_for_each_drawing(self):
+        svg = HeadlessRenderer.render_svg([self.line, self.rect, self.oval,
+                                            self.text])
+        self.assertIn('<polyline points="10 10 50 10"', svg)
+        self.assertIn('<rect x="20" y="20" width="40" height="20"', svg)
+        self.assertIn('stroke="#ff0000"', svg)
+        self.assertIn('<ellipse cx="20.0" cy="10.0"', svg)
+        self.assertIn(">a &lt; b</text>", svg)
+
+    def test_export_files_in_parallel(self):
+        with TemporaryDirectory() as directory:
+            paths = []
+            for i in range(3):
+                paths.append(Path(directory) / "{}.pypaint".format(i))
+                with open(paths[-1], "wb") as cur_file:
+                    DrawingFile.write(cur_file, [self.line, self.text])
+            missing = Path(directory) / "missing.pypaint"
+
+            results = list(export_files(paths + [missing], workers = 2))
+            self.assertEqual(paths + [missing],
+                                [path for path, _, _ in results])
+            for path, outputs, err in results[:3]:
+                self.assertIsNone(err)
+                self.assertEqual([path.with_suffix(".png"),
+                                    path.with_suffix(".svg")], outputs)
+                self.assertTrue(all(output.exists() for output in outputs))
+            self.assertIsInstance(results[3][2], OSError)
+
+    def test_export_job_returns_any_error(self):
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "bad.pypaint"
+            with open(path, "wb") as cur_file:
+                DrawingFile.write(cur_file, [self.line])
+            with patch.object(HeadlessRenderer, "render_raster", 
+                                side_effect = ValueError("bad coords")):
+                result = _export_job((path, ("png",), None))
+            self.assertEqual((path, []), result[:2])
+            self.assertIsInstance(result[2], ValueError)
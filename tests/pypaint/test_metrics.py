@@ -0,0 +1,110 @@
+from threading              import Thread
+from unittest               import TestCase
+
+from pypaint.drawing        import Drawing
+from pypaint.drawing_type   import DrawingType
+from pypaint.metrics        import METRICS, Histogram, Metrics
+from pypaint.paint_state    import PaintState
+from pypaint.wire_codec     import WireCodec
+
+
+class TestHistogram(TestCase):
+
+    def test_summary_of_values(self):
+        histogram = Histogram()
+        for value in [0, 1, 3, 5, 100]:
+            histogram.observe(value)
+        summary = histogram.summary()
+        self.assertEqual(5, summary["count"])
+        self.assertEqual(21.8, summary["mean"])
+        self.assertEqual((0, 100), (summary["min"], summary["max"]))
+        self.assertEqual(4, summary["p50"])
+        self.assertEqual(100, summary["p99"])
+
+    def test_percentile_of_zeros(self):
+        histogram = Histogram()
+        histogram.observe(0)
+        self.assertEqual(0, histogram.percentile(0.5))
+        self.assertIsNone(Histogram().percentile(0.5))
+
+
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_snapshot_rates_since_last_snapshot(self):
+        self.metrics.count("bytes", 100)
+        first = self.metrics.snapshot()
+        self.assertEqual(100, first["counters"]["bytes"])
+        self.metrics.count("bytes", 50)
+        second = self.metrics.snapshot()
+        self.assertEqual(150, second["counters"]["bytes"])
+        self.assertAlmostEqual(50 / second["interval"],
+                                second["rates"]["bytes"])
+
+    def test_timers_are_per_object_and_name(self):
+        drawing = Drawing(DrawingType.PEN, 1, "#000000", [0, 0, 1, 1])
+        other = Drawing(DrawingType.PEN, 1, "#000000", [0, 0, 1, 1])
+        self.metrics.start_timer(drawing, "a")
+        self.metrics.start_timer(drawing, "b")
+        self.metrics.stop_timer(other, "a")
+        self.metrics.stop_timer(drawing, "a")
+        self.metrics.stop_timer(drawing, "a")
+        self.assertEqual(1, self.metrics.histograms["a"].count)
+        self.assertNotIn("b", self.metrics.histograms)
+        self.assertEqual(1, len(self.metrics.timers))
+
+    def test_recording_from_threads(self):
+        def record(thread):
+            for i in range(1000):
+                self.metrics.count("total")
+                self.metrics.observe("{}.{}".format(thread, i), i)
+        threads = [Thread(target = record, args = (thread,))
+                    for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            self.metrics.snapshot()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4000, self.metrics.snapshot()["counters"]["total"])
+        self.assertEqual(4000, len(self.metrics.histograms))
+
+    def test_timers_are_bounded(self):
+        drawings = [Drawing(DrawingType.PEN, 1, "#000000", [0, 0, 1, 1])
+                        for _ in range(3)]
+        self.metrics.MAX_TIMERS = 2
+        for drawing in drawings:
+            self.metrics.start_timer(drawing, "a")
+        self.metrics.stop_timer(drawings[0], "a")
+        self.assertNotIn("a", self.metrics.histograms)
+        self.assertEqual(2, len(self.metrics.timers))
+
+
+class TestInstrumentation(TestCase):
+
+    def setUp(self):
+        METRICS.enable()
+
+    def tearDown(self):
+        METRICS.disable()
+        METRICS.reset()
+
+    def test_send_wait_and_codec_bytes(self):
+        state = PaintState()
+        state.send_active = True
+        drawing = Drawing(DrawingType.PEN, 1, "#000000", [0, 0, 5, 5])
+        state.add_to_send_queue(drawing)
+        data = WireCodec().encode([state.send_queue.get()])
+        WireCodec().decode(data)
+        self.assertEqual(1, METRICS.histograms["send_wait_ms"].count)
+        self.assertEqual(len(data), METRICS.counters["encoded_bytes"])
+        self.assertEqual(len(data), METRICS.counters["decoded_bytes"])
+        self.assertEqual(1, METRICS.counters["decoded_drawings"])
+
+    def test_nothing_recorded_when_disabled(self):
+        METRICS.disable()
+        WireCodec().decode(WireCodec().encode(
+                    [Drawing(DrawingType.PEN, 1, "#000000", [0, 0, 5, 5])]))
+        self.assertEqual({}, METRICS.counters)
@@ -1,6 +1,8 @@
+from queue                  import Queue
 from unittest               import TestCase
 from unittest.mock          import MagicMock
 
+from pypaint.drawing        import Drawing
 from pypaint.drawing_type   import DrawingType
 from pypaint.paint_state    import PaintState
 
@@ -17,10 +19,172 @@ class TestPaintState(TestCase):
         """
         Test that an undo added to the history removes the last drawing in it.
         """
-        test_drawing = MagicMock(shape = DrawingType.LINE)
-        test_undo = MagicMock(shape = DrawingType.UNDO)
+        test_drawing = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 1, 1])
+        test_undo = Drawing(DrawingType.UNDO, 0, "", [0, 0, 0, 0])
 
         self.state.add_last_drawing(test_drawing)
         self.state.add_last_drawing(test_undo)
 
         self.assertFalse(self.state.drawing_history)
+
+    def test_undo_returns_canvas_items_of_removed_drawing(self):
+        test_drawing = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 1, 1])
+        test_undo = Drawing(DrawingType.UNDO, 0, "", [0, 0, 0, 0])
+        test_clear = Drawing(DrawingType.CLEAR, 0, "", [0, 0, 0, 0])
+
+        self.state.add_last_drawing(test_drawing, (3,))
+        self.state.add_last_drawing(test_clear)
+        self.state.add_last_drawing(test_drawing, (4,))
+        self.assertEqual([4], self.state.add_last_drawing(test_undo))
+        self.assertEqual([], self.state.add_last_drawing(test_undo))
+
+    def test_undo_targets_op_id(self):
+        first = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 1, 1], 
+                        op_id = self.state.next_op_id())
+        other = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 2, 2], 
+                        op_id = (self.state.author_id + 1, 1))
+        undo = Drawing(DrawingType.UNDO, 0, "", [0, 0, 0, 0], 
+                        op_id = first.op_id)
+        redo = Drawing(DrawingType.REDO, 0, "", [0, 0, 0, 0], 
+                        op_id = first.op_id)
+
+        self.state.add_last_drawing(first, (1,))
+        self.state.add_last_drawing(other, (2,))
+        self.assertEqual([1], self.state.add_last_drawing(undo))
+        self.assertEqual([other], list(self.state.drawing_history))
+        self.state.add_last_drawing(redo, (3,))
+        self.assertEqual([first, other], list(self.state.drawing_history))
+        self.assertEqual([3], self.state.add_last_drawing(undo))
+
+    def test_undo_and_redo_stacks(self):
+        ops = [self.state.next_op_id() for _ in range(3)]
+        self.state.record_op(ops[0])
+        self.state.record_op(ops[1])
+        self.state.record_op(ops[2], join = True)
+
+        self.assertEqual((False, ops[1:]), self.state.pop_undo())
+        self.assertEqual((False, ops[:1]), self.state.pop_undo())
+        self.assertEqual((False, []), self.state.pop_undo())
+        self.assertEqual((False, ops[:1]), self.state.pop_redo())
+        self.assertTrue(self.state.redo_available)
+
+        self.state.record_op(self.state.next_op_id())
+        self.assertFalse(self.state.redo_available)
+        self.assertEqual((False, []), self.state.pop_redo())
+
+    def test_erases_are_actions(self):
+        ops = [self.state.next_op_id() for _ in range(3)]
+        self.state.record_op(ops[0])
+        self.state.record_erase(ops[1], join = True)
+        self.state.record_erase(ops[2], join = True)
+        self.assertEqual((True, ops[1:]), self.state.pop_undo())
+        self.assertEqual((False, ops[:1]), self.state.pop_undo())
+
+    def _undo(self, op_id):
+        return Drawing(DrawingType.UNDO, 0, "", [0, 0, 0, 0], op_id = op_id)
+
+    def test_undo_by_others_leaves_action(self):
+        lines = self._add_lines(3)
+        self.state.record_op(lines[0].op_id)
+        self.state.record_op(lines[1].op_id)
+        self.state.record_op(lines[2].op_id, join = True)
+        self.state.add_last_drawing(self._undo(lines[0].op_id))
+        self.state.add_last_drawing(self._undo(lines[1].op_id))
+        self.assertEqual((False, [lines[2].op_id]), self.state.pop_undo())
+        self.assertEqual((False, []), self.state.pop_undo())
+
+    def test_own_erase_keeps_action(self):
+        line = self._add_lines(1)[0]
+        self.state.record_op(line.op_id)
+        self.state.record_erase(line.op_id)
+        self.state.add_last_drawing(self._undo(line.op_id))
+        self.assertEqual((True, [line.op_id]), self.state.pop_undo())
+        self.assertEqual((False, [line.op_id]), self.state.pop_undo())
+
+    def test_compacted_actions_dropped(self):
+        lines = self._add_lines(2)
+        self.state.record_op(lines[0].op_id)
+        self.state.record_op(lines[1].op_id)
+        self.state.pop_undo()
+        self.state.add_last_drawing(self._undo(lines[1].op_id))
+        other = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 5, 5], 
+                        op_id = (self.state.author_id + 1, 1))
+        for _ in range(PaintState.UNDO_HORIZON 
+                        + PaintState.COMPACTION_INTERVAL):
+            self.state.add_last_drawing(other)
+        self.assertGreater(self.state.drawing_history.snapshot_length, 0)
+        self.assertFalse(self.state.undo_available)
+        self.assertFalse(self.state.redo_available)
+
+    def _add_lines(self, count):
+        lines = [Drawing(DrawingType.LINE, 1, "#000000", 
+                            [i * 20, 0, i * 20, 10], 
+                            op_id = self.state.next_op_id()) 
+                    for i in range(count)]
+        for line in lines:
+            self.state.add_last_drawing(line)
+        return lines
+
+    def test_drawings_near_point(self):
+        lines = self._add_lines(3)
+        self.assertEqual([lines[1].op_id], 
+                            self.state.drawings_near(21, 5, 1))
+        self.assertEqual([], self.state.drawings_near(10, 5, 1))
+
+    def test_drawings_in_box_latest_first(self):
+        lines = self._add_lines(3)
+        self.assertEqual([lines[1].op_id, lines[0].op_id], 
+                            self.state.drawings_in((0, 0, 25, 25)))
+
+    def test_drawings_near_follow_undo_redo_and_clear(self):
+        lines = self._add_lines(2)
+        undo = Drawing(DrawingType.UNDO, 0, "", [0, 0, 0, 0], 
+                        op_id = lines[0].op_id)
+        redo = Drawing(DrawingType.REDO, 0, "", [0, 0, 0, 0], 
+                        op_id = lines[0].op_id)
+        clear = Drawing(DrawingType.CLEAR, 0, "", [0, 0, 0, 0])
+
+        self.state.add_last_drawing(undo)
+        self.assertEqual([], self.state.drawings_near(0, 5, 1))
+        self.state.add_last_drawing(redo)
+        self.assertEqual([lines[0].op_id], self.state.drawings_near(0, 5, 1))
+        self.state.add_last_drawing(clear)
+        self.assertEqual([], self.state.drawings_near(0, 5, 1))
+
+    def test_full_send_queue_drops_previews(self):
+        self.state.send_active = True
+        self.state.send_queue = Queue(1)
+        line = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 5, 5])
+        preview = Drawing(DrawingType.RECT, 1, "#000000", [0, 0, 5, 5], 
+                            preview = True)
+        self.state.add_to_send_queue(line)
+        self.state.add_to_send_queue(preview)
+        self.assertIs(line, self.state.send_queue.get_nowait())
+        self.assertTrue(self.state.send_queue.empty())
+
+    def test_full_send_queue_marks_peer_behind(self):
+        self.state.send_active = True
+        self.state.send_queue = Queue(1)
+        lines = self._add_lines(2)
+        self.state.add_to_send_queue(lines[0])
+        self.assertFalse(self.state.send_behind)
+        self.state.add_to_send_queue(lines[1])
+        self.assertTrue(self.state.send_behind)
+        self.assertIs(lines[0], self.state.send_queue.get_nowait())
+
+    def test_drawings_queued_together(self):
+        self.state.send_active = True
+        self.state.send_queue = Queue(1)
+        lines = self._add_lines(3)
+        self.state.add_all_to_send_queue(iter(lines))
+        self.assertEqual(lines, self.state.send_queue.get_nowait())
+        self.assertFalse(self.state.send_behind)
+
+    def test_send_sink_takes_drawings(self):
+        sink = MagicMock()
+        self.state.send_active = True
+        self.state.set_send_sink(sink)
+        line = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 5, 5])
+        self.state.add_to_send_queue(line)
+        sink.send.assert_called_once_with(line)
+        self.assertTrue(self.state.send_queue.empty())
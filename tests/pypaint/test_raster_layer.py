@@ -0,0 +1,125 @@
+from unittest                   import TestCase
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_history    import DrawingHistory
+from pypaint.drawing_type       import DrawingType
+from pypaint.raster_layer       import RasterLayer
+
+
+class TestRasterLayer(TestCase):
+
+    def setUp(self):
+        self.history = DrawingHistory()
+        self.layer = RasterLayer(self.history, keep_recent = 2, 
+                                    flatten_interval = 3)
+
+    def _add_lines(self, count):
+        for i in range(count):
+            self.history.append(Drawing(DrawingType.LINE, 1, "#000000", 
+                                        [i, 10, i, 20]))
+
+    def test_line_moves_after_interval(self):
+        self._add_lines(4)
+        self.assertFalse(self.layer.update())
+        self._add_lines(1)
+        self.assertTrue(self.layer.update())
+        self.assertEqual(3, self.layer.flat_end)
+        self._add_lines(2)
+        self.assertFalse(self.layer.update())
+
+    def test_line_moves_when_history_shrinks(self):
+        self._add_lines(5)
+        self.layer.update()
+        self.history.clear()
+        self.assertTrue(self.layer.update())
+        self.assertEqual(0, self.layer.flat_end)
+
+    def test_text_and_zoomed_in_drawings_not_flat(self):
+        self._add_lines(5)
+        self.layer.update()
+        text = Drawing(DrawingType.TEXT, 1, "#000000", [0, 0, 0, 0], "text")
+        self.assertTrue(self.layer.is_flat(0, self.history[0]))
+        self.assertFalse(self.layer.is_flat(0, text))
+        self.assertFalse(self.layer.is_flat(4, self.history[4]))
+        self.layer.zoom = RasterLayer.MAX_ZOOM * 2
+        self.assertFalse(self.layer.is_flat(0, self.history[0]))
+
+    def test_render_tile_draws_flat_drawings(self):
+        self._add_lines(5)
+        self.layer.update()
+        x, y, data = self.layer.render_tile((0, 0))
+        self.assertEqual((0, 0), (x, y))
+        header = b"P6\n512 512\n255\n"
+        self.assertTrue(data.startswith(header))
+        pixel = len(header) + (15 * 512 + 2) * 3
+        self.assertEqual(b"\x00\x00\x00", data[pixel:pixel + 3])
+        pixel = len(header) + (15 * 512 + 4) * 3    # not flattened
+        self.assertEqual(b"\xff\xff\xff", data[pixel:pixel + 3])
+        self.assertIsNone(self.layer.render_tile((1, 0)))
+
+    def test_render_tile_scaled(self):
+        self._add_lines(5)
+        self.layer.update()
+        self.layer.zoom = 0.5
+        _, _, data = self.layer.render_tile((0, 0))
+        self.assertTrue(data.startswith(b"P6\n256 256\n255\n"))
+
+    def test_update_reports_flattened_range(self):
+        self._add_lines(5)
+        self.layer.update()
+        self.assertEqual(range(0, 3), self.layer.flattened)
+        self._add_lines(5)
+        self.assertTrue(self.layer.update())
+        self.assertEqual(range(3, 8), self.layer.flattened)
+
+    def test_line_carried_over_compaction(self):
+        for i in range(10):
+            self.history.append(Drawing(DrawingType.PEN, 1, "#000000", 
+                                        [i, i, i + 1, i + 1]))
+        self.layer.update()
+        self.history.compact(2)
+        self.assertFalse(self.layer.update())
+        self.assertEqual(1, self.layer.flat_end)
+        self.assertTrue(self.layer.is_flat(0, self.history[0]))
+        self.assertFalse(self.layer.is_flat(1, self.history[1]))
+
+    def test_submit_renders_in_worker(self):
+        self._add_lines(5)
+        self.layer.update()
+        future = self.layer.submit((0, 0))
+        try:
+            self.assertEqual(self.layer.render_tile((0, 0)), 
+                                future.result(timeout = 60))
+            self.assertIsNone(self.layer.submit((1, 0)))
+        finally:
+            self.layer.stop()
+
+    def _add_text(self):
+        self.history.append(Drawing(DrawingType.TEXT, 1, "#000000", 
+                                    [3, 15, 0, 0], "text"))
+
+    def test_line_stops_over_text(self):
+        self._add_lines(1)
+        self._add_text()
+        self.history.append(Drawing(DrawingType.LINE, 1, "#000000", 
+                                    [100, 10, 100, 20]))
+        self.history.append(Drawing(DrawingType.LINE, 1, "#000000", 
+                                    [5, 10, 5, 20]))
+        self._add_lines(4)
+        self.assertTrue(self.layer.update())
+        self.assertEqual(3, self.layer.flat_end)
+        self.assertFalse(self.layer.update())
+
+    def test_redo_over_text_moves_line_back(self):
+        self._add_text()
+        self.history.append(Drawing(DrawingType.LINE, 1, "#000000", 
+                                    [5, 10, 5, 20], op_id = (1, 1)))
+        self.history.remove((1, 1))
+        self._add_lines(3)
+        self.layer.update()
+        self.assertEqual(3, self.layer.flat_end)
+        self.history.restore((1, 1))
+        self.assertTrue(self.layer.redone((1, 1)))
+        self.assertEqual(1, self.layer.flat_end)
+        self.assertIsNone(self.layer.flattened)
+        self.assertFalse(self.layer.redone((1, 1)))
@@ -0,0 +1,146 @@
+from asyncio                   import open_connection, sleep, wait_for
+from unittest                  import IsolatedAsyncioTestCase
+
+from pypaint.drawing           import Drawing
+from pypaint.drawing_history   import DrawingHistory
+from pypaint.drawing_type      import DrawingType
+from pypaint.relay             import Relay
+from pypaint.wire_codec        import WireCodec
+
+
+class Client:
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.codec = WireCodec()
+        self.received = []
+
+    @staticmethod
+    async def connect(port, framed = True):
+        """
+        Connect to the relay, and if framed, offer frames and wait for its 
+        offer so op ids are sent.
+        """
+        client = Client(*await open_connection("127.0.0.1", port))
+        if framed:
+            client.writer.write(client.codec.offer())
+            while not client.codec.peer_framed:
+                await client._read()
+        return client
+
+    def send(self, drawings):
+        self.writer.write(self.codec.encode(drawings))
+
+    async def receive(self, count):
+        while len(self.received) < count:
+            await self._read()
+        drawings, self.received = self.received, []
+        return drawings
+
+    async def _read(self):
+        data = await wait_for(self.reader.read(1 << 16), 1)
+        if not data:
+            raise ConnectionError("relay closed the connection")
+        self.received.extend(self.codec.decode(data))
+
+    def close(self):
+        self.writer.close()
+
+
+class TestRelay(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.relay = Relay("127.0.0.1", 0)
+        await self.relay.start()
+        self.drawings = [
+            Drawing(DrawingType.PEN, 3, "#ff0000", [10, 10, 12, 9, 15, 7]),
+            Drawing(DrawingType.TEXT, 1, "#000000", [4, 5, 0, 0], "testing"),
+            Drawing(DrawingType.RECT, 2, "#ff0000", [0, 0, 800, 600])
+        ]
+        self.clients = []
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            client.close()
+        await self.relay.stop()
+
+    async def _connect(self, framed = True):
+        client = await Client.connect(self.relay.port, framed)
+        self.clients.append(client)
+        return client
+
+    async def test_drawings_relayed_to_other_clients(self):
+        first = await self._connect()
+        second = await self._connect()
+        old = await self._connect(framed = False)
+        first.send(self.drawings)
+        self.assertEqual(self.drawings, await second.receive(3))
+        self.assertEqual(self.drawings, await old.receive(3))
+
+    async def test_history_applied(self):
+        first = await self._connect()
+        second = await self._connect()
+        first.send(self.drawings + [Drawing(DrawingType.UNDO, 0, "",
+                                                [0, 0, 0, 0]), 
+                                    Drawing(DrawingType.LINE, 1, "#000000", 
+                                            [0, 0, 5, 5], preview = True)])
+        await second.receive(5)
+        self.assertEqual(self.drawings[:2], list(self.relay.history))
+
+    async def test_targeted_undo_and_redo_applied(self):
+        first = await self._connect()
+        second = await self._connect()
+        line = Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 5, 5], 
+                        op_id = (5, 1))
+        first.send([line] + self.drawings 
+                    + [Drawing(DrawingType.UNDO, 0, "", [0, 0, 0, 0], 
+                                op_id = (5, 1))])
+        await second.receive(5)
+        self.assertEqual(self.drawings, list(self.relay.history))
+
+        first.send([Drawing(DrawingType.REDO, 0, "", [0, 0, 0, 0], 
+                            op_id = (5, 1))])
+        await second.receive(1)
+        self.assertEqual([line] + self.drawings, list(self.relay.history))
+
+    async def _wait_for_history(self, length):
+        while len(self.relay.history) < length:
+            await sleep(0.001)
+
+    async def test_sync_answered_with_missing_drawings(self):
+        first = await self._connect()
+        first.send(self.drawings)
+        await self._wait_for_history(len(self.drawings))
+
+        prefix = DrawingHistory()
+        prefix.append(self.drawings[0])
+        second = await self._connect()
+        second.send([Drawing(DrawingType.SYNC, 0, "", 
+                                list(prefix.sync_token()) + [0, 0])])
+        self.assertEqual(self.drawings[1:], 
+                            await second.receive(len(self.drawings) - 1))
+
+    async def test_diverged_sync_answered_with_clear_and_history(self):
+        first = await self._connect()
+        first.send(self.drawings)
+        await self._wait_for_history(len(self.drawings))
+
+        second = await self._connect()
+        second.send([Drawing(DrawingType.SYNC, 0, "", [1, 0, 0, 0])])
+        received = await second.receive(len(self.drawings) + 1)
+        self.assertIs(DrawingType.CLEAR, received[0].shape)
+        self.assertEqual(self.drawings, received[1:])
+
+    async def test_position_markers_from_clients_ignored(self):
+        first = await self._connect()
+        second = await self._connect()
+        first.send(self.drawings[:1] 
+                    + [Drawing(DrawingType.SYNC, 0, "", 
+                                [1000, 1234, 5678, 
+                                    DrawingHistory.SYNC_POSITION])])
+        self.assertEqual(self.drawings[:1], await second.receive(1))
+        prefix = DrawingHistory()
+        prefix.append(self.drawings[0])
+        self.assertEqual(prefix.sync_token(), self.relay.history.sync_token())
+        self.assertEqual(0, self.relay.history.removed_digest())
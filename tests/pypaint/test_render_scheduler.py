@@ -0,0 +1,58 @@
+from queue                      import Queue
+from types                      import SimpleNamespace
+from unittest                   import TestCase
+from unittest.mock              import MagicMock
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_type       import DrawingType
+from pypaint.render_scheduler   import RenderScheduler
+
+
+class TestRenderScheduler(TestCase):
+    
+    def setUp(self):
+        self.widget = MagicMock()
+        self.state = SimpleNamespace(draw_queue = Queue(), draw_active = True)
+        self.rendered = []
+        self.scheduler = RenderScheduler(self.widget, self.state, 
+                                            self._render)
+
+    def _render(self, drawing):
+        self.rendered.append(drawing)
+        return drawing.bounding_box()
+
+    def test_frame_applies_all_queued_drawings(self):
+        drawings = [Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 10, 10]),
+                    Drawing(DrawingType.LINE, 1, "#000000", [20, 5, 30, 15])]
+        for drawing in drawings:
+            self.state.draw_queue.put(drawing)
+        self.scheduler._frame()
+
+        self.assertEqual(drawings, self.rendered)
+        self.assertEqual(1, self.scheduler.frame_count)
+        self.assertEqual(2, self.scheduler.last_frame_items)
+        self.assertEqual((-1, -1, 31, 16), self.scheduler.dirty_box)
+        self.widget.after.assert_called_once()
+
+    def test_empty_frame_is_not_counted(self):
+        self.scheduler._frame()
+        self.assertEqual(0, self.scheduler.frame_count)
+        self.widget.after.assert_called_once()
+
+    def test_stops_scheduling_when_inactive(self):
+        self.state.draw_active = False
+        self.scheduler._frame()
+        self.widget.after.assert_not_called()
+
+    def test_repaints_the_dirty_region_once_per_frame(self):
+        repaint = MagicMock()
+        self.scheduler.repaint = repaint
+        self.state.draw_queue.put(Drawing(DrawingType.LINE, 1, "#000000", 
+                                            [0, 0, 10, 10]))
+        self.state.draw_queue.put(Drawing(DrawingType.LINE, 1, "#000000", 
+                                            [20, 5, 30, 15]))
+        self.scheduler._frame()
+        repaint.assert_called_once_with((-1, -1, 31, 16))
+
+        self.scheduler._frame()
+        repaint.assert_called_once()
@@ -0,0 +1,79 @@
+from queue                      import Full, Queue
+from types                      import SimpleNamespace
+from unittest                   import TestCase
+
+from pypaint.drawing            import Drawing
+from pypaint.drawing_type       import DrawingType
+from pypaint.sender             import Sender
+from pypaint.wire_codec         import WireCodec
+
+
+class TestSender(TestCase):
+
+    def setUp(self):
+        self.state = SimpleNamespace(send_queue = Queue(2),
+                                        write_queue = Queue(1),
+                                        send_active = True)
+        self.codec = WireCodec()
+        self.sender = Sender(self.state, flush_interval = 5, flush_size = 4)
+        self.drawings = [Drawing(DrawingType.LINE, 1, "#000000",
+                                    [i, i, i + 1, i + 1])
+                            for i in range(10)]
+
+    def tearDown(self):
+        self.sender.stop()
+
+    def _received(self):
+        return self.codec.decode(self.state.write_queue.get(timeout = 1))
+
+    def test_drawings_coalesced_into_single_write(self):
+        self.sender.start()
+        for drawing in self.drawings[:3]:
+            self.state.send_queue.put(drawing)
+        self.assertEqual(self.drawings[:3], self._received())
+
+    def test_full_write_queue_keeps_coalescing(self):
+        self.state.write_queue.put(b'')
+        self.sender.start()
+        for drawing in self.drawings:
+            self.state.send_queue.put(drawing)
+        self.state.send_queue.join()    # all taken while the write waits
+        self.assertEqual(len(self.drawings), self.sender.pending_count)
+        self.assertEqual(b'', self.state.write_queue.get(timeout = 1))
+        self.assertEqual(self.drawings, self._received())
+
+    def test_pending_limit_holds_back_producers(self):
+        self.sender.PENDING_LIMIT = 4
+        self.state.write_queue.put(b'')
+        self.sender.start()
+        for drawing in self.drawings[:6]:
+            self.state.send_queue.put(drawing)
+        self.assertRaises(Full, self.state.send_queue.put_nowait, 
+                            self.drawings[6])
+
+        self.assertEqual(b'', self.state.write_queue.get(timeout = 1))
+        self.assertEqual(self.drawings[:4], self._received())
+        self.assertEqual(self.drawings[4:6], self._received())
+
+    def test_lists_queued_as_one_item(self):
+        self.sender.start()
+        self.state.send_queue.put(self.drawings[:3])
+        self.state.send_queue.put(self.drawings[3])
+        self.assertEqual(self.drawings[:4], self._received())
+
+    def test_framing_follows_the_queue(self):
+        self.sender.start()
+        self.sender.set_peer_framed(True)
+        self.state.send_queue.put(self.drawings[0])
+        data = self.state.write_queue.get(timeout = 1)
+        self.assertTrue(data.startswith(WireCodec.FRAME_MAGIC))
+        self.assertEqual(self.drawings[:1], self.codec.decode(data))
+
+    def test_inactive_sender_drops_drawings(self):
+        self.state.send_active = False
+        self.state.send_queue.put(self.drawings[0])
+        self.sender.start()
+        self.state.send_queue.join()
+        self.state.send_active = True
+        self.sender.stop()
+        self.assertTrue(self.state.write_queue.empty())
@@ -0,0 +1,35 @@
+from unittest                   import TestCase
+
+from pypaint.spatial_index      import SpatialIndex
+
+
+class TestSpatialIndex(TestCase):
+
+    def setUp(self):
+        self.index = SpatialIndex(cell_size = 10)
+        self.index.insert("a", (0, 0, 5, 5))
+        self.index.insert("b", (8, 8, 35, 12))
+        self.index.insert("c", (-20, 50, -10, 60))
+
+    def test_query_returns_intersecting_keys(self):
+        self.assertEqual({"a", "b"}, self.index.query((4, 4, 9, 9)))
+        self.assertEqual({"b"}, self.index.query((30, 0, 40, 10)))
+        self.assertEqual({"c"}, self.index.query((-15, 55, -15, 55)))
+        self.assertEqual(set(), self.index.query((6, 0, 7, 7)))
+
+    def test_discard_removes_key_from_every_cell(self):
+        self.index.discard("b")
+        self.index.discard("b")
+        self.assertNotIn("b", self.index)
+        self.assertEqual(set(), self.index.query((8, 8, 35, 12)))
+        self.assertEqual(2, len(self.index))
+
+    def test_insert_replaces_box(self):
+        self.index.insert("a", (100, 100, 105, 105))
+        self.assertEqual(set(), self.index.query((0, 0, 5, 5)))
+        self.assertEqual({"a"}, self.index.query((100, 100, 100, 100)))
+
+    def test_clear_empties_index(self):
+        self.index.clear()
+        self.assertEqual(0, len(self.index))
+        self.assertEqual(set(), self.index.query((-100, -100, 100, 100)))
@@ -0,0 +1,59 @@
+from math                       import sin
+from unittest                   import TestCase
+
+from pypaint.stroke_simplifier  import (DistanceSimplifier, RDPSimplifier, 
+                                        StrokeSimplifier)
+
+
+class TestStrokeSimplifier(TestCase):
+    
+    def setUp(self):
+        self.straight_coords = [0, 0, 1, 0, 2, 0, 3, 0, 4, 0]
+        self.corner_coords = [0, 0, 2, 0, 4, 0, 4, 2, 4, 4]
+
+    def test_base_keeps_every_point(self):
+        simplifier = StrokeSimplifier()
+        self.assertTrue(simplifier.accept((0, 0), (0, 0)))
+        self.assertEqual(self.corner_coords, 
+                            simplifier.simplify(self.corner_coords))
+
+    def test_distance_drops_close_points(self):
+        simplifier = DistanceSimplifier(2)
+        self.assertFalse(simplifier.accept((0, 0), (1, 1)))
+        self.assertTrue(simplifier.accept((0, 0), (2, 0)))
+
+    def test_rdp_reduces_straight_line_to_end_points(self):
+        simplifier = RDPSimplifier(0.5)
+        self.assertEqual([0, 0, 4, 0], 
+                            simplifier.simplify(self.straight_coords))
+
+    def test_rdp_keeps_corners(self):
+        simplifier = RDPSimplifier(0.5)
+        self.assertEqual([0, 0, 4, 0, 4, 4], 
+                            simplifier.simplify(self.corner_coords))
+
+    def test_rdp_keeps_short_strokes(self):
+        simplifier = RDPSimplifier(10)
+        self.assertEqual([0, 0, 1, 1], simplifier.simplify([0, 0, 1, 1]))
+
+    def test_rdp_batches_join_within_tolerance(self):
+        simplifier = RDPSimplifier(1)
+        points = [(x, round(5 * sin(x / 7))) for x in range(200)]
+        coords = [coord for point in points for coord in point]
+        pieces, start = [], 0
+        while start < len(points) - 1:   # batches sharing their end points
+            end = min(start + 63, len(points) - 1)
+            pieces.append(simplifier.simplify(coords[2 * start:2 * end + 2]))
+            start = end
+
+        for piece, next_piece in zip(pieces, pieces[1:]):
+            self.assertEqual(piece[-2:], next_piece[:2])
+        kept = [tuple(piece[i:i + 2]) for piece in pieces 
+                    for i in range(0, len(piece), 2)]
+        for x, y in points:
+            before = max(point for point in kept if point[0] <= x)
+            after = min(point for point in kept if point[0] >= x)
+            if before != after:
+                line_y = before[1] + ((after[1] - before[1]) * (x - before[0]) 
+                                        / (after[0] - before[0]))
+                self.assertLessEqual(abs(line_y - y), 1.5)
@@ -0,0 +1,54 @@
+from unittest               import TestCase
+
+from pypaint.viewport       import TiledViewport
+
+
+class TestTiledViewport(TestCase):
+
+    def setUp(self):
+        self.loaded = []
+        self.unloaded = []
+        self.viewport = TiledViewport(100, self.loaded.extend, 
+                                        self.unloaded.extend, margin = 0, 
+                                        tile_budget = 4)
+
+    def test_visible_tiles_loaded_once(self):
+        self.viewport.update((0, 0, 150, 50))
+        self.viewport.update((10, 10, 160, 60))
+        self.assertEqual([(0, 0), (1, 0)], self.loaded)
+        self.assertTrue(self.viewport.is_resident((120, 20, 130, 30)))
+        self.assertFalse(self.viewport.is_resident((220, 20, 230, 30)))
+
+    def test_least_recently_visible_evicted_past_budget(self):
+        self.viewport.update((0, 0, 50, 50))
+        self.viewport.update((100, 0, 150, 50))
+        self.viewport.update((0, 0, 50, 50))
+        self.viewport.update((200, 0, 350, 50))
+        self.assertEqual([], self.unloaded)
+        self.viewport.update((400, 0, 450, 50))
+        self.assertEqual([(1, 0)], self.unloaded)
+        self.assertEqual([(0, 0), (2, 0), (3, 0), (4, 0)], 
+                            list(self.viewport.resident))
+
+    def test_visible_tiles_kept_over_budget(self):
+        loaded, evicted = self.viewport.update((0, 0, 250, 150))
+        self.assertEqual(6, len(loaded))
+        self.assertEqual([], evicted)
+
+    def test_margin_loads_surrounding_tiles(self):
+        viewport = TiledViewport(100, self.loaded.extend, 
+                                    self.unloaded.extend, margin = 10)
+        viewport.update((0, 0, 50, 50))
+        self.assertEqual({(-1, -1), (-1, 0), (0, -1), (0, 0)}, 
+                            set(self.loaded))
+
+    def test_reset_unloads_everything(self):
+        self.viewport.update((0, 0, 150, 50))
+        self.viewport.reset()
+        self.assertEqual([(0, 0), (1, 0)], self.unloaded)
+        self.assertFalse(self.viewport.resident)
+
+    def test_zoom_clamped(self):
+        self.assertEqual(TiledViewport.ZOOM_MAX, 
+                            TiledViewport.clamp_zoom(1000))
+        self.assertEqual(2, TiledViewport.clamp_zoom(2))
@@ -0,0 +1,111 @@
+from unittest               import TestCase
+
+from pypaint.drawing        import Drawing
+from pypaint.drawing_type   import DrawingType
+from pypaint.wire_codec     import WireCodec
+
+
+class TestWireCodec(TestCase):
+    
+    def setUp(self):
+        self.sender = WireCodec()
+        self.receiver = WireCodec()
+        self.drawings = [
+            Drawing(DrawingType.PEN, 3, "#ff0000", [10, 10, 12, 9, 15, 7]),
+            Drawing(DrawingType.TEXT, 1, "#000000", [4, 5, 0, 0], "testing"),
+            Drawing(DrawingType.SYNC, 0, "", [12, -123456789, 0, 0]),
+            Drawing(DrawingType.RECT, 2, "#ff0000", [0, 0, 800, 600]),
+            Drawing(DrawingType.OVAL, 2, "#ff0000", [5, 5, 80, 60], 
+                    preview = True),
+            Drawing(DrawingType.LINE, 1, "#000000", [0, 0, 5, 5], 
+                    op_id = ((1 << 31) - 1, 42)),
+            Drawing(DrawingType.REDO, 0, "", [0, 0, 0, 0], op_id = (9, 1))
+        ]
+
+    def test_payload_encoding_decoding_are_equal(self):
+        payload = WireCodec.encode_payload(self.drawings)
+        self.assertEqual(self.drawings, WireCodec.decode_payload(payload))
+
+    def _legacy_drawings(self):
+        return [Drawing(drawing.shape, drawing.thickness, drawing.color, 
+                        drawing.coords, drawing.text) 
+                    for drawing in self.drawings[:4] + self.drawings[5:6]]
+
+    def test_raw_until_offer_received(self):
+        data = self.sender.encode(self.drawings)
+        self.assertEqual(b''.join(drawing.encode() 
+                                    for drawing in self._legacy_drawings()), 
+                            data)
+        self.assertEqual(self._legacy_drawings(), self.receiver.decode(data))
+
+    def test_raw_drawings_decode_in_older_peers(self):
+        data = self.sender.encode(self.drawings)
+        for drawing in Drawing.decode_drawings(data):
+            self.assertLess(drawing.shape_value, Drawing.PREVIEW_FLAG)
+            self.assertLessEqual(drawing.shape.value, 
+                                    DrawingType.SYNC.value)
+        self.assertEqual(5, len(Drawing.decode_drawings(data)))
+
+    def test_framed_after_offer_received(self):
+        self.assertEqual([], self.sender.decode(self.receiver.offer()))
+        self.assertTrue(self.sender.peer_framed)
+
+        data = self.sender.encode(self.drawings * 10)
+        self.assertTrue(data.startswith(WireCodec.FRAME_MAGIC))
+        self.assertEqual(self.drawings * 10, self.receiver.decode(data))
+
+    def test_offer_is_a_colorless_ping_to_older_peers(self):
+        offer = self.receiver.offer()
+        decoded = Drawing.decode_drawings(offer + self.drawings[0].encode())
+        self.assertEqual(DrawingType.PING, decoded[0].shape)
+        self.assertEqual("", decoded[0].color)
+        self.assertEqual(self.drawings[:1], decoded[1:])
+
+    def test_frame_header_offer_still_accepted(self):
+        self.sender.decode(WireCodec.FRAME_HEADER_STRUCT.pack(
+                                                    WireCodec.FRAME_MAGIC, 0))
+        self.assertTrue(self.sender.peer_framed)
+
+    def test_decoding_split_reads(self):
+        raw_data = self.sender.encode(self.drawings)
+        self.sender.decode(self.receiver.offer())
+        data = raw_data + self.sender.encode(self.drawings)
+
+        decoded = []
+        for i in range(0, len(data), 5):
+            decoded.extend(self.receiver.decode(data[i:i + 5]))
+        self.assertEqual(self._legacy_drawings() + self.drawings, decoded)
+
+    def test_bad_frame_dropped_without_losing_framing(self):
+        self.sender.decode(self.receiver.offer())
+        self.receiver.decode(self.sender.offer())
+        bad_frame = WireCodec.FRAME_HEADER_STRUCT.pack(WireCodec.FRAME_MAGIC, 
+                                                        4) + b"\xff" * 4
+        self.assertEqual([], self.sender.decode(bad_frame))
+        self.assertTrue(self.sender.peer_framed)
+        self.assertEqual(self.drawings, 
+                            self.sender.decode(self.receiver.encode(
+                                                            self.drawings)))
+
+    def test_oversized_frames_dropped(self):
+        self.receiver.MAX_FRAME_RAW = 1000
+        too_long = WireCodec.FRAME_HEADER_STRUCT.pack(
+                        WireCodec.FRAME_MAGIC, WireCodec.MAX_FRAME_PAYLOAD + 1)
+        self.assertEqual([], self.receiver.decode(too_long))
+        self.assertTrue(self.receiver.failed)
+        self.assertEqual(0, len(self.receiver))
+
+        self.receiver.reset()
+        header = bytearray(self.drawings[1].encode()[:Drawing.MSG_SIZE])
+        Drawing.PAYLOAD_LENGTH_STRUCT.pack_into(
+                header, Drawing.PAYLOAD_LENGTH_OFFSET, 
+                WireCodec.MAX_FRAME_PAYLOAD + 1)
+        self.assertEqual([], self.receiver.decode(header))
+        self.assertTrue(self.receiver.failed)
+
+        self.receiver.reset()
+        self.sender.decode(self.receiver.offer())
+        bomb = self.sender.encode(self.drawings * 100)
+        self.assertEqual([], self.receiver.decode(bomb))
+        self.assertTrue(self.receiver.failed)
+